@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Long-lived LD query service around the ld_vcf LD engine.
+
+Keeps the given tabix-indexed VCFs open and holds an LRU cache of decoded
+genotypes, keyed by (file, contig, block), so that overlapping regional
+queries (e.g. from web LD plots) do not decode the same records again.
+Requires libld_vcf.so and ld_vcf.py (see README.txt).
+
+Usage:
+  ld_server.py --vcf ALL.chr1.vcf.gz --vcf ALL.chr2.vcf.gz --socket /tmp/ld.sock
+  ld_server.py --vcf ALL.chr1.vcf.gz --port 8765 --cache_memory 2048
+
+Queries (HTTP GET, over the Unix socket or on localhost):
+  /ld?file=ALL.chr1.vcf.gz&region=1:230710048-230810048
+     optional: window, variant, var_position, include_variants (comma-separated),
+               samples (comma-separated), format (json or tsv, default: json)
+  /stats  cache usage
+
+Variants are selected for a region (and assigned to blocks) by their start
+position. Samples and include_variants are passed on to the decoding, so
+blocks are cached per file, sample set and variant list. The tsv format uses
+the same columns as the ld_vcf output.
+"""
+
+import argparse
+import json
+import os
+import re
+import socketserver
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from ld_vcf import WINDOW_SIZE, Genotypes, LDFile, compute_ld
+
+BLOCK_SIZE = 100000
+CACHE_MEMORY = 1024  # MB
+VARIANT_ID_BYTES = 64  # rough size of a cached variant id
+
+
+class GenotypeCache:
+    """LRU cache of decoded genotype blocks with a memory cap (in bytes)"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def size(block):
+        return (block.start.nbytes + block.position.nbytes +
+                block.genotypes.nbytes + len(block.variant) * VARIANT_ID_BYTES)
+
+    def get(self, key, record=True):
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None:
+                self.misses += record
+                return None
+            self.hits += record
+            self._blocks.move_to_end(key)
+            return block
+
+    def put(self, key, block):
+        size = self.size(block)
+        with self._lock:
+            if key in self._blocks:
+                return
+            if size > self.max_bytes:
+                # never cache a block bigger than the cache itself
+                return
+            self._blocks[key] = block
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._blocks.popitem(last=False)
+                self.bytes -= self.size(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"blocks": len(self._blocks), "bytes": self.bytes,
+                    "max_bytes": self.max_bytes, "hits": self.hits,
+                    "misses": self.misses}
+
+
+class LDService:
+    """Answers LD queries from cached genotype blocks of open VCF files"""
+
+    def __init__(self, vcfs, cache_memory=CACHE_MEMORY, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.cache = GenotypeCache(cache_memory * 1024 * 1024)
+        self._paths = {}
+        for path in vcfs:
+            self._paths[path] = path
+            self._paths[os.path.basename(path)] = path
+        self._files = {}
+        self._locks = {path: threading.Lock() for path in vcfs}
+
+    def _file(self, path):
+        # called with the lock of the file held
+        if path not in self._files:
+            self._files[path] = LDFile(path)
+        return self._files[path]
+
+    def _block(self, path, contig, block, samples=None, include_variants=None):
+        key = (path, samples, include_variants, contig, block)
+        genotypes = self.cache.get(key)
+        if genotypes is not None:
+            return genotypes
+
+        with self._locks[path]:
+            # another request may have decoded it in the meantime
+            genotypes = self.cache.get(key, record=False)
+            if genotypes is not None:
+                return genotypes
+
+            start = block * self.block_size + 1
+            end = (block + 1) * self.block_size
+            genotypes = self._file(path).decode(f"{contig}:{start}-{end}", samples,
+                                                include_variants)
+
+        # keep records starting in the block (not those overlapping it)
+        keep = (genotypes.start >= start) & (genotypes.start <= end)
+        genotypes = Genotypes(*(column[keep] for column in genotypes))
+        self.cache.put(key, genotypes)
+        return genotypes
+
+    def genotypes(self, path, contig, start, end, samples=None, include_variants=None):
+        """
+        Decoded genotypes of the variants starting in contig:start-end;
+        samples and include_variants are sorted tuples (or None)
+        """
+        first = (start - 1) // self.block_size
+        last = (end - 1) // self.block_size
+        blocks = [self._block(path, contig, b, samples, include_variants)
+                  for b in range(first, last + 1)]
+
+        genotypes = Genotypes(*(np.concatenate(columns) for columns in zip(*blocks)))
+        keep = (genotypes.start >= start) & (genotypes.start <= end)
+        return Genotypes(*(column[keep] for column in genotypes))
+
+    def query(self, file, region, window=WINDOW_SIZE, variant=None,
+              var_position=None, include_variants=None, samples=None):
+        """Calculate pairwise LD in region; returns an LDResult"""
+        if file not in self._paths:
+            raise KeyError(f"unknown file: {file}")
+        path = self._paths[file]
+
+        match = re.fullmatch(r"(.+):(\d+)-(\d+)", region)
+        if match is None:
+            raise ValueError(f"invalid region: {region} (expected chr:start-end)")
+        contig, start, end = match.group(1), int(match.group(2)), int(match.group(3))
+        if start < 1 or end < start:
+            raise ValueError(f"invalid region: {region}")
+
+        if samples is not None:
+            samples = tuple(sorted(set(samples)))
+        if include_variants is not None:
+            # like ld_vcf, the variant given is always included
+            include_variants = set(include_variants)
+            if variant is not None:
+                include_variants.add(variant)
+            include_variants = tuple(sorted(include_variants))
+
+        genotypes = self.genotypes(path, contig, start, end, samples, include_variants)
+        return compute_ld(genotypes.position, genotypes.variant, genotypes.genotypes,
+                          window=window, variant=variant, var_position=var_position)
+
+
+def format_tsv(ld):
+    """Format an LDResult like the ld_vcf output"""
+    return "".join(
+        f"1\t1\t{ld.position_a[i]}\t{ld.variant_a[i]}\t{ld.position_b[i]}\t"
+        f"{ld.variant_b[i]}\t{ld.r2[i]:f}\t{ld.d_prime[i]:f}\t{ld.n[i]}\n"
+        for i in range(len(ld.r2)))
+
+
+def format_json(ld):
+    return json.dumps({field: values.tolist() for field, values in ld._asdict().items()})
+
+
+class LDRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+
+        if url.path == "/stats":
+            return self.reply(200, json.dumps(self.service.cache.stats()), "application/json")
+        if url.path != "/ld":
+            return self.reply(404, "Not found\n")
+
+        def split(value):
+            return value.split(",") if value is not None else None
+
+        try:
+            if "file" not in params or "region" not in params:
+                raise ValueError("file and region are required")
+            ld = self.service.query(
+                params["file"], params["region"],
+                window=int(params.get("window", WINDOW_SIZE)),
+                variant=params.get("variant"),
+                var_position=int(params.get("var_position", 0)),
+                include_variants=split(params.get("include_variants")),
+                samples=split(params.get("samples")))
+        except KeyError as e:
+            return self.reply(404, f"{e.args[0]}\n")
+        except ValueError as e:
+            return self.reply(400, f"{e}\n")
+        except (MemoryError, OSError) as e:
+            return self.reply(500, f"{e}\n")
+
+        if params.get("format", "json") == "tsv":
+            self.reply(200, format_tsv(ld), "text/tab-separated-values")
+        else:
+            self.reply(200, format_json(ld), "application/json")
+
+    def reply(self, status, body, content_type="text/plain"):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve LD queries from tabix-indexed VCFs kept open in memory")
+    parser.add_argument("--vcf", action="append", required=True,
+                        help="VCF/BCF file to serve (can be used multiple times)")
+    parser.add_argument("--socket", type=str,
+                        help="path to Unix socket to listen on")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="localhost port to listen on if --socket is not given (default: 8765)")
+    parser.add_argument("--cache_memory", type=int, default=CACHE_MEMORY,
+                        help=f"memory cap of the genotype cache in MB (default: {CACHE_MEMORY})")
+    parser.add_argument("--block_size", type=int, default=BLOCK_SIZE,
+                        help=f"size of cached genotype blocks in bp (default: {BLOCK_SIZE})")
+    args = parser.parse_args()
+
+    LDRequestHandler.service = LDService(args.vcf, args.cache_memory, args.block_size)
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, LDRequestHandler)
+        print(f"Serving LD queries on {args.socket}", flush=True)
+    else:
+        server = ThreadingHTTPServer(("127.0.0.1", args.port), LDRequestHandler)
+        print(f"Serving LD queries on http://127.0.0.1:{args.port}", flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,9 @@
 
 
 #include <stdio.h>
+#include <stdarg.h>
+#include <errno.h>
+#include <string.h>
 #include <strings.h>
 #include <stdlib.h>
 #include <math.h>
@@ -42,6 +45,7 @@
 #define MIN_GENOTYPES_LOCUS 40
 #define THETA_CONVERGENCE_THRESHOLD 0.0001
 #define MIN_R2 0.05
+#define MISSING_GENOTYPE 0xff
 
 /* Macros for fetching particular haplotypes from the allele_counters */
 #define AABB allele_counters[0x0000]
@@ -67,6 +71,7 @@ typedef struct{
   char *var_id;
   int number_genotypes;
   Genotype * genotypes;
+  int result_index;
 } Locus_info;
 
 typedef struct{
@@ -90,43 +95,163 @@ typedef struct{
   uint8_t * haplotype;
 } Haplotype;
 
-void init_locus_list(Locus_list *l) {
+/* Pairwise results collected in memory (used by the shared library) */
+typedef struct {
+  int n_loci;
+  int sz_loci;
+  int *position;
+  char **var_id;
+  int n_pairs;
+  int sz_pairs;
+  int *locus_a;
+  int *locus_b;
+  double *r2;
+  double *d_prime;
+  int *N;
+} LD_result;
+
+/* Decoded genotypes of a region: one row of n_samples genotype codes per locus */
+typedef struct {
+  int n_loci;
+  int sz_loci;
+  int n_samples;
+  int *start;
+  int *position;
+  char **var_id;
+  uint8_t *genotypes;
+} LD_genotypes;
+
+/* Destination of the pairwise stats: either a file handle or an LD_result */
+typedef struct LD_sink {
+  int (*emit)(struct LD_sink *sink, Locus_info *first, Locus_info *second, const Stats *stats);
+  FILE *fh;
+  LD_result *result;
+} LD_sink;
+
+/* An opened VCF/BCF file, kept open across region queries */
+typedef struct {
+  htsFile *htsfile;
+  bcf_hdr_t *hdr;
+  enum htsExactFormat format;
+  tbx_t *tbx;
+  hts_idx_t *idx;
+  kstring_t str;
+  int *gt_arr;
+  int ngt_arr;
+  uint8_t *codes;
+  int ncodes;
+} LD_file;
+
+/* Options and state of a query over one or more regions */
+typedef struct {
+  int windowsize;
+  const char *variant;
+  int var_position;
+  const char **include_variants;
+  int n_include_variants;
+  int variant_index;
+  int position;
+} LD_query;
+
+#ifdef LD_VCF_LIBRARY
+/* Last error of a library call in this thread (see ld_error_code) */
+static __thread int last_error_code;
+static __thread char last_error[256];
+#endif
+
+/*
+ Report an error: the ld_vcf binary prints it to stderr, while the library
+ keeps it for the caller to read with ld_error_message()
+*/
+void report_error(int code, const char *format, ...) {
+  va_list args;
+  va_start(args, format);
+#ifdef LD_VCF_LIBRARY
+  last_error_code = code;
+  vsnprintf(last_error, sizeof(last_error), format, args);
+#else
+  vfprintf(stderr, format, args);
+  fputc('\n', stderr);
+#endif
+  va_end(args);
+}
+
+/*
+ Report a system error (e.g. out of memory): the ld_vcf binary exits, while
+ the library returns -1 so that the error is passed on to the caller
+*/
+int system_error(const char *message) {
+#ifdef LD_VCF_LIBRARY
+  report_error(errno, "%s: %s", message, strerror(errno));
+  return -1;
+#else
+  perror(message);
+  exit(SYSTEM_ERROR);
+#endif
+}
+
+int init_locus_list(Locus_list *l) {
   l->sz = INITIAL_LIST_SIZE;
   l->tail = -1;
   l->head = 0;
   l->locus = malloc(INITIAL_LIST_SIZE*sizeof(Locus_info));
-  if (l->locus == NULL) {
-    perror("Could not allocate memory");
-    exit(SYSTEM_ERROR);
-  }
+  if (l->locus == NULL)
+    return system_error("Could not allocate memory");
+  return 0;
 }
 
-void reallocate_locus_list(Locus_list *l) {
+int reallocate_locus_list(Locus_list *l) {
   Locus_info *t;
+  if (( t = realloc(l->locus, 2 * l->sz * sizeof(Locus_info))) == NULL)
+    return system_error("Out of memory reallocating locus list");
   l->sz *= 2;
-  if (( t = realloc(l->locus, l->sz * sizeof(Locus_info))) == NULL) {
-    perror("Out of memory reallocating locus list");
-    exit(SYSTEM_ERROR);
-  }
   l->locus = t;
+  return 0;
+}
+
+void free_locus(Locus_info *l) {
+  free(l->genotypes);
+  l->genotypes = NULL;
+  /* variant ids stored in an LD_result are owned by the result */
+  if (l->result_index < 0)
+    free(l->var_id);
+  l->var_id = NULL;
+}
+
+void free_locus_list(Locus_list *ll) {
+  int i;
+  for (i = ll->head; i <= ll->tail; i++)
+    free_locus(&ll->locus[i]);
+  free(ll->locus);
 }
 
 void dequeue(Locus_list *ll) {
+  free_locus(&ll->locus[ll->head]);
   ll->head++;
 }
 
+/* Append a locus taking ownership of var_id; returns NULL (and frees var_id) on error */
 Locus_info * next_locus(Locus_list *ll, int pos, char *var_id, int samples) {
   Locus_info *l;
+  Genotype *genotypes;
 
-  ll->tail++;
-  if (ll->tail == ll->sz)
-    reallocate_locus_list(ll);
+  if (ll->tail + 1 == ll->sz && reallocate_locus_list(ll)) {
+    free(var_id);
+    return NULL;
+  }
+  if ((genotypes = calloc(samples, sizeof(Genotype))) == NULL) {
+    free(var_id);
+    system_error("Could not allocate memory");
+    return NULL;
+  }
 
+  ll->tail++;
   l = &ll->locus[ll->tail];
   l->position = pos;
   l->var_id = var_id;
-  l->genotypes = calloc(samples, sizeof(Genotype));
+  l->genotypes = genotypes;
   l->number_genotypes = 0;
+  l->result_index = -1;
   return l;
 }
 
@@ -178,12 +303,14 @@ int by_person_id(const void *v1, const void *v2){
   return 0;
 }
 
-void extract_locus_haplotypes(Locus_info *first, Locus_info *second, Haplotype * haplotypes, int * allele_counters) {
+int extract_locus_haplotypes(Locus_info *first, Locus_info *second, Haplotype * haplotypes, int * allele_counters) {
 
   if (first->number_genotypes > second->number_genotypes)
-    haplotypes->haplotype = malloc(second->number_genotypes * sizeof(uint8_t));
+    haplotypes->haplotype = malloc(second->number_genotypes * sizeof(uint8_t) + 1);
   else
-    haplotypes->haplotype = malloc(first->number_genotypes * sizeof(uint8_t));
+    haplotypes->haplotype = malloc(first->number_genotypes * sizeof(uint8_t) + 1);
+  if (haplotypes->haplotype == NULL)
+    return system_error("Could not allocate memory");
 
   int i = 0;
   int j = 0;
@@ -210,14 +337,16 @@ void extract_locus_haplotypes(Locus_info *first, Locus_info *second, Haplotype *
     }
   }
   haplotypes->number_haplotypes = z;
+  return 0;
 }
 
-void calculate_pairwise_stats(Locus_info *first, Locus_info *second, FILE* fh){
+int calculate_pairwise_stats(Locus_info *first, Locus_info *second, LD_sink *sink){
   Stats stats;
   Haplotype haplotypes;
   int allele_counters[16] = {0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0};
 
-  extract_locus_haplotypes(second, first, &haplotypes, allele_counters);
+  if (extract_locus_haplotypes(second, first, &haplotypes, allele_counters))
+    return -1;
 
   int nAB = 2*AABB + AaBB + AABb;
   int nab = 2*aabb + Aabb + aaBb;
@@ -227,7 +356,8 @@ void calculate_pairwise_stats(Locus_info *first, Locus_info *second, FILE* fh){
 
   if (N < MIN_GENOTYPES_LOCUS){
     /*not enough individuals, return */
-    return;
+    free(haplotypes.haplotype);
+    return 0;
   }
 
   /*Calculate theta*/
@@ -273,35 +403,80 @@ void calculate_pairwise_stats(Locus_info *first, Locus_info *second, FILE* fh){
   free(haplotypes.haplotype);
 
   if ((float) stats.r2 < MIN_R2 || stats.N < MIN_GENOTYPES_LOCUS || (float) stats.r2 > 1 || (float) stats.d_prime > 1)
-    return;
+    return 0;
 
   if (second->position <= first->position)
-    fprintf(fh, "%d\t%d\t%d\t%s\t%d\t%s\t%f\t%f\t%d\n",
-      1,   // this used to be population_id, but we're ignoring that now. Placeholder for file format compatiblity
-      1,   // this used to be seq_region_id, but we're ignoring that now. Placeholder for file format compatiblity
-      second->position,
-      second->var_id,
-      first->position,
-      first->var_id,
-      stats.r2,
-      fabs(stats.d_prime),
-      stats.N
-    );
+    return sink->emit(sink, second, first, &stats);
   else 
-    fprintf(fh, "%d\t%d\t%d\t%s\t%d\t%s\t%f\t%f\t%d\n",
-      1,   // this used to be population_id, but we're ignoring that now. Placeholder for file format compatiblity
-      1,   // this used to be seq_region_id, but we're ignoring that now. Placeholder for file format compatiblity
-      first->position,
-      first->var_id,
-      second->position,
-      second->var_id,
-      stats.r2,
-      fabs(stats.d_prime),
-      stats.N
-    );
-}
-
-void calculate_ld(const Locus_list *ll, FILE *fh, int windowsize, int variant_index){
+    return sink->emit(sink, first, second, &stats);
+}
+
+int print_pair(LD_sink *sink, Locus_info *first, Locus_info *second, const Stats *stats) {
+  fprintf(sink->fh, "%d\t%d\t%d\t%s\t%d\t%s\t%f\t%f\t%d\n",
+    1,   // this used to be population_id, but we're ignoring that now. Placeholder for file format compatiblity
+    1,   // this used to be seq_region_id, but we're ignoring that now. Placeholder for file format compatiblity
+    first->position,
+    first->var_id,
+    second->position,
+    second->var_id,
+    stats->r2,
+    fabs(stats->d_prime),
+    stats->N
+  );
+  return 0;
+}
+
+/* Resize the array *ptr to size items; on error *ptr is kept as it was */
+int grow_array(void *ptr, size_t size, size_t item_size) {
+  void *t;
+  if ((t = realloc(*(void **) ptr, size * item_size)) == NULL)
+    return system_error("Out of memory reallocating array");
+  *(void **) ptr = t;
+  return 0;
+}
+
+int result_locus(LD_result *r, Locus_info *l) {
+  if (l->result_index < 0) {
+    if (r->n_loci == r->sz_loci) {
+      int sz = r->sz_loci ? r->sz_loci * 2 : INITIAL_LIST_SIZE;
+      if (grow_array(&r->position, sz, sizeof(int)) ||
+          grow_array(&r->var_id, sz, sizeof(char *)))
+        return -1;
+      r->sz_loci = sz;
+    }
+    r->position[r->n_loci] = l->position;
+    r->var_id[r->n_loci] = l->var_id;
+    l->result_index = r->n_loci++;
+  }
+  return l->result_index;
+}
+
+int store_pair(LD_sink *sink, Locus_info *first, Locus_info *second, const Stats *stats) {
+  LD_result *r = sink->result;
+  if (r->n_pairs == r->sz_pairs) {
+    int sz = r->sz_pairs ? r->sz_pairs * 2 : INITIAL_LIST_SIZE;
+    if (grow_array(&r->locus_a, sz, sizeof(int)) ||
+        grow_array(&r->locus_b, sz, sizeof(int)) ||
+        grow_array(&r->r2, sz, sizeof(double)) ||
+        grow_array(&r->d_prime, sz, sizeof(double)) ||
+        grow_array(&r->N, sz, sizeof(int)))
+      return -1;
+    r->sz_pairs = sz;
+  }
+  int a = result_locus(r, first);
+  int b = result_locus(r, second);
+  if (a < 0 || b < 0)
+    return -1;
+  r->locus_a[r->n_pairs] = a;
+  r->locus_b[r->n_pairs] = b;
+  r->r2[r->n_pairs] = stats->r2;
+  r->d_prime[r->n_pairs] = fabs(stats->d_prime);
+  r->N[r->n_pairs] = stats->N;
+  r->n_pairs++;
+  return 0;
+}
+
+int calculate_ld(const Locus_list *ll, LD_sink *sink, int windowsize, int variant_index){
   Locus_info * variant_locus = &ll->locus[variant_index];
   Locus_info * first = &ll->locus[ll->head];
   Locus_info * end= &ll->locus[ll->tail] + 1;
@@ -316,52 +491,55 @@ void calculate_ld(const Locus_list *ll, FILE *fh, int windowsize, int variant_in
       continue;
     }
 
-    calculate_pairwise_stats(locus, variant_locus, fh);
+    if (calculate_pairwise_stats(locus, variant_locus, sink))
+      return -1;
   }
+  return 0;
 }
 
-int get_genotypes(Locus_list *locus_list, bcf_hdr_t *hdr, bcf1_t *line, int position) {
-  // get variant id
-  // have to do a string copy otherwise the reference to the last one gets passed around indefinitely
-  bcf_unpack(line, 1);
-  bcf_dec_t *d = &line->d;      
-  char *var_id = malloc(strlen(d->id)+1);
-  strcpy(var_id, d->id);
-
+/*
+ Decode the genotypes of line into codes, one per sample; with samples (indices
+ in file order), only those n_samples samples are decoded, as if the others
+ were removed from the file. Returns 0 if the record is skipped.
+*/
+int decode_genotypes(LD_file *file, bcf1_t *line, uint8_t *codes, const int *samples, int n_samples) {
   // get genotypes
-  int * gt_arr = NULL;
-  int ngt_arr = 0;
-  int ngt = bcf_get_genotypes(hdr, line, &gt_arr, &ngt_arr);
+  // the genotype buffer is kept in the file and reused for every record
+  int ngt = bcf_get_genotypes(file->hdr, line, &file->gt_arr, &file->ngt_arr);
+  int * gt_arr = file->gt_arr;
 
-  if(ngt == 0)
+  if(ngt <= 0)
     return 0;
 
+  // gt_arr is an array of alleles
+  // we need to break this down into per-sample sets to turn into genotypes
+  int alleles_per_gt = ngt / line->n_sample;
+  if (samples == NULL)
+    n_samples = line->n_sample;
+
   // quickly scan through for non-ref alleles
   // this way we can exclude non-variant sites before doing any analysis
   int has_alt = 0;
-  int genotype_id;
-  for(genotype_id=0; genotype_id<ngt; genotype_id++) {
-    if(gt_arr[genotype_id] > 3) {
-      has_alt = 1;
-      break;
+  int i, genotype_id;
+  for(i=0; i<n_samples && !has_alt; i++) {
+    int first = alleles_per_gt * (samples ? samples[i] : i);
+    for(genotype_id=first; genotype_id<first+alleles_per_gt; genotype_id++) {
+      if(gt_arr[genotype_id] > 3) {
+        has_alt = 1;
+        break;
+      }
     }
   }
   if(has_alt == 0) 
     return 0;
 
-  // gt_arr is an array of alleles
-  // we need to break this down into per-sample sets to turn into genotypes
-  int alleles_per_gt = ngt / line->n_sample;
-
   // for now skip unless ploidy == 2
   if(alleles_per_gt != 2) 
     return 0;
 
   // iterate over genotypes
-  Locus_info * locus = next_locus(locus_list, position, var_id, line->n_sample);
-  int sample_id;
-  for(sample_id=0; sample_id<line->n_sample; sample_id++) {
-    int personid = sample_id + 1;
+  for(i=0; i<n_samples; i++) {
+    int sample_id = samples ? samples[i] : i;
     char genotype[2];
 
     // iterate over alleles
@@ -388,8 +566,10 @@ int get_genotypes(Locus_list *locus_list, bcf_hdr_t *hdr, bcf1_t *line, int posi
       }
     }
 
-    if (bad_genotype)
+    if (bad_genotype) {
+      codes[i] = MISSING_GENOTYPE;
       continue;
+    }
 
     /* Make all hets the same order */
     if (genotype[0] == 'a' && genotype[1] == 'A') {
@@ -397,14 +577,52 @@ int get_genotypes(Locus_list *locus_list, bcf_hdr_t *hdr, bcf1_t *line, int posi
       genotype[1] = 'a';
     }
 
-    locus->genotypes[locus->number_genotypes].person_id = personid;
-    locus->genotypes[locus->number_genotypes].genotype = genotype2int(genotype);
+    codes[i] = genotype2int(genotype);
+  }
+  return 1;
+}
+
+Locus_info * add_locus(Locus_list *locus_list, int position, char *var_id, const uint8_t *codes, int samples) {
+  Locus_info * locus = next_locus(locus_list, position, var_id, samples);
+  int sample_id;
+  if (locus == NULL)
+    return NULL;
+  for(sample_id=0; sample_id<samples; sample_id++) {
+    if (codes[sample_id] == MISSING_GENOTYPE)
+      continue;
+    locus->genotypes[locus->number_genotypes].person_id = sample_id + 1;
+    locus->genotypes[locus->number_genotypes].genotype = codes[sample_id];
     locus->number_genotypes++;
   }
+  return locus;
+}
+
+/* Add the locus of line if it has usable genotypes; returns 1 if added, 0 if skipped and -1 on error */
+int get_genotypes(Locus_list *locus_list, LD_file *file, bcf1_t *line, int position) {
+  if (file->ncodes < line->n_sample) {
+    if (grow_array(&file->codes, line->n_sample, sizeof(uint8_t)))
+      return -1;
+    file->ncodes = line->n_sample;
+  }
+
+  if (!decode_genotypes(file, line, file->codes, NULL, 0))
+    return 0;
+
+  // get variant id
+  // have to do a string copy otherwise the reference to the last one gets passed around indefinitely
+  bcf_unpack(line, 1);
+  bcf_dec_t *d = &line->d;      
+  char *var_id = malloc(strlen(d->id)+1);
+  if (var_id == NULL)
+    return system_error("Could not allocate memory");
+  strcpy(var_id, d->id);
+
+  if (add_locus(locus_list, position, var_id, file->codes, line->n_sample) == NULL)
+    return -1;
   return 1;
 }
 
-void process_window(Locus_list *locus_list, int windowsize, FILE *fh, int position) {
+int process_window(Locus_list *locus_list, int windowsize, LD_sink *sink, int position) {
   /*check if the new position is farther than the limit.*/
   /*if so, calculate the ld information for the values in the array*/
   while(
@@ -412,7 +630,8 @@ void process_window(Locus_list *locus_list, int windowsize, FILE *fh, int positi
     (abs(locus_list->locus[locus_list->head].position - position) > windowsize)
   ) {
 
-    calculate_ld(locus_list, fh, windowsize, locus_list->head);
+    if (calculate_ld(locus_list, sink, windowsize, locus_list->head))
+      return -1;
     dequeue(locus_list);  
   }
   if (locus_list->tail < locus_list->head) {
@@ -420,13 +639,427 @@ void process_window(Locus_list *locus_list, int windowsize, FILE *fh, int positi
     locus_list->head = 0;
     locus_list->tail = -1;
   }
+  return 0;
+}
+
+int by_variant_id(const void *v1, const void *v2){
+  return strcmp(*(char * const *)v1, *(char * const *)v2);
+}
+
+int check_include_variants(bcf1_t *line, const LD_query *query) {
+  bcf_unpack(line, 1);
+  char * id = line->d.id;
+
+  // could be the variant given with -v
+  if(query->variant && strcmp(id, query->variant) == 0) return 1;
+
+  // or could be in the (sorted) list given
+  if(bsearch(&id, query->include_variants, query->n_include_variants, sizeof(char *), by_variant_id) != NULL) return 1;
+
+  return 0;
+}
+
+int ld_close(LD_file *file) {
+  int status = 0;
+  if (file == NULL)
+    return status;
+  if (file->tbx) tbx_destroy(file->tbx);
+  if (file->idx) hts_idx_destroy(file->idx);
+  if (file->hdr) bcf_hdr_destroy(file->hdr);
+  if (file->htsfile) status = hts_close(file->htsfile);
+  free(file->str.s);
+  free(file->gt_arr);
+  free(file->codes);
+  free(file);
+  return status;
+}
+
+LD_file * ld_open(const char *filename, const char *samples_list, int samples_is_file) {
+  LD_file *file = calloc(1, sizeof(LD_file));
+  if (file == NULL) {
+    system_error("Could not allocate memory");
+    return NULL;
+  }
+
+  // open htsFile
+  file->htsfile = hts_open(filename, "rz");
+
+  if(!file->htsfile) {
+    report_error(EIO, "Unable to open file %s", filename);
+    ld_close(file);
+    return NULL;
+  }
+
+  // read header
+  file->hdr = bcf_hdr_read(file->htsfile);
+
+  if(!file->hdr) {
+    report_error(EIO, "Unable to read header from file %s", filename);
+    ld_close(file);
+    return NULL;
+  }
+
+  // use sample list if provided
+  // this speeds up VCF parsing
+  if(samples_list && bcf_hdr_set_samples(file->hdr, samples_list, samples_is_file) < 0) {
+    report_error(EINVAL, "Failed to read or set samples");
+    ld_close(file);
+    return NULL;
+  }
+
+  // get file format and open the matching index
+  file->format = hts_get_format(file->htsfile)->format;
+
+  if(file->format == vcf) {
+    file->tbx = tbx_index_load(filename);
+
+    if(!file->tbx) {
+      report_error(EIO, "Could not load .tbi/.csi index for file %s", filename);
+      ld_close(file);
+      return NULL;
+    }
+  }
+
+  else if(file->format == bcf) {
+    file->idx = bcf_index_load(filename);
+
+    if(!file->idx) {
+      report_error(EIO, "Could not load .csi index for file %s", filename);
+      ld_close(file);
+      return NULL;
+    }
+  }
+
+  else {
+    report_error(EINVAL, "Unsupported format for file %s", filename);
+    ld_close(file);
+    return NULL;
+  }
+
+  return file;
+}
+
+int next_record(LD_file *file, hts_itr_t *itr, bcf1_t *line) {
+  if (file->format == vcf) {
+    while(tbx_itr_next(file->htsfile, file->tbx, itr, &file->str) > 0) {
+      // parse into vcf struct as line
+      if(vcf_parse(&file->str, file->hdr, line) == 0)
+        return 1;
+    }
+    return 0;
+  }
+  return bcf_itr_next(file->htsfile, itr, line) >= 0;
+}
+
+hts_itr_t * region_iterator(LD_file *file, const char *region) {
+  return (file->format == vcf) ?
+    tbx_itr_querys(file->tbx, region) :
+    bcf_itr_querys(file->idx, file->hdr, region);
+}
+
+int outside_window(const LD_query *query, const Locus_list *locus_list) {
+  // once the variant of interest is found, skip anything farther than the window
+  return query->windowsize && query->variant_index > 0 &&
+    abs(query->position - locus_list->locus[query->variant_index].position) > query->windowsize;
+}
+
+int locus_added(LD_query *query, Locus_list *locus_list, LD_sink *sink) {
+  if (!query->variant && !query->var_position) {
+    return process_window(locus_list, query->windowsize, sink, query->position);
+  } else if (query->variant) {
+    if (!strcmp(query->variant, locus_list->locus[locus_list->tail].var_id)) {
+      query->variant_index = locus_list->tail;
+    }
+  } else if (query->var_position) {
+    if (query->var_position == locus_list->locus[locus_list->tail].position) {
+      query->variant_index = locus_list->tail;
+    }
+  }
+  return 0;
+}
+
+/* Returns 0 once the region is read, 1 if it is not in the file (e.g. unknown contig) and -1 on error */
+int read_region(LD_file *file, const char *region, LD_query *query, Locus_list *locus_list, LD_sink *sink) {
+  // query
+  hts_itr_t *itr = region_iterator(file, region);
+
+  // dive out without iter
+  if(!itr) return 1;
+
+  bcf1_t *line = bcf_init();
+  int status = 0;
+  if (line == NULL)
+    status = system_error("Could not allocate memory");
+
+  // iterate over file
+  while(status == 0 && next_record(file, itr, line)) {
+
+    // check include_variants
+    if(query->include_variants && check_include_variants(line, query) == 0)
+      continue;
+
+    query->position = line->pos + (2 - bcf_is_snp(line));
+    if (outside_window(query, locus_list))
+      continue;
+
+    int added = get_genotypes(locus_list, file, line, query->position);
+    if (added < 0 || (added && locus_added(query, locus_list, sink)))
+      status = -1;
+  }
+
+  if (line) bcf_destroy(line);
+  hts_itr_destroy(itr);
+  return status;
+}
+
+int finish_query(LD_query *query, Locus_list *locus_list, LD_sink *sink) {
+  if (!query->variant) {
+    // process any remaining buffer
+    return process_window(locus_list, 0, sink, query->position);
+  } else if (query->variant_index >= 0) { // Variable initialised to -1, if set correctly, set to int >= 0
+    // Compute LD around variant of interest
+    return calculate_ld(locus_list, sink, query->windowsize, query->variant_index);
+  }
+  return 0;
 }
 
+/*
+ Entry points of the shared library (libld_vcf.so)
+
+ A file is opened once with ld_open() and can then be queried any number of
+ times with ld_query(); each query returns an LD_result that must be released
+ with ld_result_free(). Pairs reference the loci table of the result by index.
+
+ On error (out of memory, or a region that is not in the file) these return
+ NULL instead of exiting; ld_error_code() and ld_error_message() then
+ describe the error (errno value, EINVAL for regions).
+*/
+#ifdef LD_VCF_LIBRARY
+int ld_error_code(void) {
+  return last_error_code;
+}
+
+const char * ld_error_message(void) {
+  return last_error;
+}
+#endif
+
+/* Sorted copy of a variant list, so that records can be checked with a binary search */
+const char ** sort_variants(const char **variants, int n_variants) {
+  const char **sorted = malloc((n_variants + 1) * sizeof(char *));
+  if (sorted == NULL) {
+    system_error("Could not allocate memory");
+    return NULL;
+  }
+  memcpy(sorted, variants, n_variants * sizeof(char *));
+  qsort(sorted, n_variants, sizeof(char *), by_variant_id);
+  return sorted;
+}
+
+void ld_result_free(LD_result *result) {
+  int i;
+  if (result == NULL)
+    return;
+  for (i = 0; i < result->n_loci; i++)
+    free(result->var_id[i]);
+  free(result->position);
+  free(result->var_id);
+  free(result->locus_a);
+  free(result->locus_b);
+  free(result->r2);
+  free(result->d_prime);
+  free(result->N);
+  free(result);
+}
+
+LD_result * ld_query(LD_file *file, const char *region, int windowsize, const char *variant, int var_position, const char **include_variants, int n_include_variants) {
+  LD_result *result = calloc(1, sizeof(LD_result));
+  if (result == NULL) {
+    system_error("Could not allocate memory");
+    return NULL;
+  }
+  LD_sink sink = {store_pair, NULL, result};
+
+  const char **sorted = NULL;
+  if (include_variants && (sorted = sort_variants(include_variants, n_include_variants)) == NULL) {
+    free(result);
+    return NULL;
+  }
+
+  LD_query query = {windowsize, variant, var_position, sorted, n_include_variants, -1, 0};
+  Locus_list locus_list;
+  if (init_locus_list(&locus_list)) {
+    free(sorted);
+    free(result);
+    return NULL;
+  }
+
+  int status = read_region(file, region, &query, &locus_list, &sink);
+  if (status == 1)
+    report_error(EINVAL, "Unknown contig or invalid region: %s", region);
+  else if (status == 0)
+    status = finish_query(&query, &locus_list, &sink);
+
+  free_locus_list(&locus_list);
+  free(sorted);
+  if (status) {
+    ld_result_free(result);
+    return NULL;
+  }
+  return result;
+}
+
+/*
+ Genotypes can also be decoded once with ld_decode() and kept by the caller,
+ and LD then calculated from them with ld_compute() (e.g. to cache decoded
+ genotypes in a long-lived process). Genotype codes are the same as in
+ Locus_info, with MISSING_GENOTYPE for samples that are skipped. Like a
+ sample list given to ld_open() and the variant list of ld_query(), samples
+ (increasing indices) and include_variants restrict what is decoded; both
+ are optional (NULL).
+*/
+int ld_n_samples(LD_file *file) {
+  return bcf_hdr_nsamples(file->hdr);
+}
+
+const char * ld_sample_name(LD_file *file, int i) {
+  return file->hdr->samples[i];
+}
+
+void ld_genotypes_free(LD_genotypes *g) {
+  int i;
+  if (g == NULL)
+    return;
+  for (i = 0; i < g->n_loci; i++)
+    free(g->var_id[i]);
+  free(g->start);
+  free(g->position);
+  free(g->var_id);
+  free(g->genotypes);
+  free(g);
+}
+
+LD_genotypes * ld_decode(LD_file *file, const char *region, const int *samples, int n_samples, const char **include_variants, int n_include_variants) {
+  int i;
+  if (samples) {
+    for (i = 0; i < n_samples; i++) {
+      if (samples[i] < 0 || samples[i] >= bcf_hdr_nsamples(file->hdr) || (i && samples[i] <= samples[i - 1])) {
+        report_error(EINVAL, "Sample indices must be increasing and less than %d", bcf_hdr_nsamples(file->hdr));
+        return NULL;
+      }
+    }
+  }
+
+  LD_genotypes *g = calloc(1, sizeof(LD_genotypes));
+  if (g == NULL) {
+    system_error("Could not allocate memory");
+    return NULL;
+  }
+  g->n_samples = samples ? n_samples : bcf_hdr_nsamples(file->hdr);
+
+  LD_query query = {0, NULL, 0, NULL, n_include_variants, -1, 0};
+  if (include_variants && (query.include_variants = sort_variants(include_variants, n_include_variants)) == NULL) {
+    ld_genotypes_free(g);
+    return NULL;
+  }
+
+  hts_itr_t *itr = region_iterator(file, region);
+  if(!itr) {
+    report_error(EINVAL, "Unknown contig or invalid region: %s", region);
+    free(query.include_variants);
+    ld_genotypes_free(g);
+    return NULL;
+  }
+
+  bcf1_t *line = bcf_init();
+  int status = 0;
+  if (line == NULL)
+    status = system_error("Could not allocate memory");
+
+  while(status == 0 && next_record(file, itr, line)) {
+    if(query.include_variants && check_include_variants(line, &query) == 0)
+      continue;
+
+    if (g->n_loci == g->sz_loci) {
+      int sz = g->sz_loci ? g->sz_loci * 2 : INITIAL_LIST_SIZE;
+      if (grow_array(&g->start, sz, sizeof(int)) ||
+          grow_array(&g->position, sz, sizeof(int)) ||
+          grow_array(&g->var_id, sz, sizeof(char *)) ||
+          grow_array(&g->genotypes, (size_t) sz * g->n_samples, sizeof(uint8_t))) {
+        status = -1;
+        break;
+      }
+      g->sz_loci = sz;
+    }
+
+    if (!decode_genotypes(file, line, &g->genotypes[(size_t) g->n_loci * g->n_samples], samples, n_samples))
+      continue;
+
+    bcf_unpack(line, 1);
+    if ((g->var_id[g->n_loci] = strdup(line->d.id)) == NULL) {
+      status = system_error("Could not allocate memory");
+      break;
+    }
+    g->start[g->n_loci] = line->pos + 1;
+    g->position[g->n_loci] = line->pos + (2 - bcf_is_snp(line));
+    g->n_loci++;
+  }
+
+  if (line) bcf_destroy(line);
+  hts_itr_destroy(itr);
+  free(query.include_variants);
+  if (status) {
+    ld_genotypes_free(g);
+    return NULL;
+  }
+  return g;
+}
+
+LD_result * ld_compute(const int *position, const char **var_id, const uint8_t *genotypes, int n_loci, int n_samples, int windowsize, const char *variant, int var_position) {
+  LD_result *result = calloc(1, sizeof(LD_result));
+  if (result == NULL) {
+    system_error("Could not allocate memory");
+    return NULL;
+  }
+  LD_sink sink = {store_pair, NULL, result};
+  LD_query query = {windowsize, variant, var_position, NULL, 0, -1, 0};
+  Locus_list locus_list;
+  if (init_locus_list(&locus_list)) {
+    free(result);
+    return NULL;
+  }
+
+  int i, status = 0;
+  for (i = 0; status == 0 && i < n_loci; i++) {
+    query.position = position[i];
+    if (outside_window(&query, &locus_list))
+      continue;
+
+    char *id = strdup(var_id[i]);
+    if (id == NULL)
+      status = system_error("Could not allocate memory");
+    else if (add_locus(&locus_list, position[i], id, &genotypes[(size_t) i * n_samples], n_samples) == NULL)
+      status = -1;
+    else
+      status = locus_added(&query, &locus_list, &sink);
+  }
+  if (status == 0)
+    status = finish_query(&query, &locus_list, &sink);
+
+  free_locus_list(&locus_list);
+  if (status) {
+    ld_result_free(result);
+    return NULL;
+  }
+  return result;
+}
+
+#ifndef LD_VCF_LIBRARY
 void usage(char *prog) {
   fprintf(stderr, "Usage: %s -f [input.vcf.gz] -r [chr:start-end] -l [optional_sample_list] (-g [input_two.vcf.gz] -s [chr:start-end]) > output.txt\n", prog);
 }
 
-char** read_variants_file(char *variants_file) {
+char** read_variants_file(char *variants_file, int *number_variants) {
   int lines_allocated = 128;
   int max_line_len = 100;
   char** include_variants = (char **)malloc(sizeof(char*)*lines_allocated);
@@ -465,7 +1098,10 @@ char** read_variants_file(char *variants_file) {
       fprintf(stderr,"Out of memory.\n");
       exit(SYSTEM_ERROR);
     }
-    if(fgets(include_variants[l], max_line_len-1, in)==NULL) break;
+    if(fgets(include_variants[l], max_line_len-1, in)==NULL) {
+      free(include_variants[l]);
+      break;
+    }
 
     /* Get rid of CR or LF at end of line */
     for(
@@ -479,23 +1115,11 @@ char** read_variants_file(char *variants_file) {
 
   fclose(in);
 
-  return include_variants;
-}
-
-int check_include_variants(bcf1_t *line, char** include_variants, char* variant) {
-  bcf_unpack(line, 1);
-  char * id = line->d.id;      
-
-  // could be the variant given with -v
-  if(variant && strcmp(id, variant) == 0) return 1;
-
-  // or could be in the file given
-  int i;
-  for(i=0; include_variants[i][0] != '\0'; i++) {
-    if(strcmp(include_variants[i], id) == 0) return 1;
-  }
+  // sort so that records can be checked with a binary search
+  qsort(include_variants, l, sizeof(char *), by_variant_id);
+  *number_variants = l;
 
-  return 0;
+  return include_variants;
 }
 
 int main(int argc, char *argv[]) {
@@ -625,189 +1249,52 @@ int main(int argc, char *argv[]) {
     windowsize = 1000000000;
   }
 
+  // set up the query
+  LD_query query = {windowsize, variant, var_position, NULL, 0, -1, 0};
+
   // variant list in file
-  char **include_variants = NULL;
-  int have_include_variants = 0;
-  // include_variants[0][0] = '\0';
-  if(access( variants_file, F_OK) != -1 ) {
-    include_variants = read_variants_file(variants_file);
-    have_include_variants = 1;
+  if(variants_file && access( variants_file, F_OK) != -1 ) {
+    query.include_variants = (const char **) read_variants_file(variants_file, &query.n_include_variants);
+  }
+
+  // sample list can be a file or a comma-separated list
+  int samples_is_file = 1;
+  if(samples_list) {
+    if(strstr(samples_list, ",") != NULL) {
+      samples_is_file = 0;
+    }
+    else if(access( samples_list, F_OK ) < 0) {
+      fprintf(stderr, "Failed to read samples list %s\n", samples_list);
+      return EXIT_FAILURE;
+    }
   }
 
   // open output
-  FILE *fh;
-  fh = stdout; // fopen("output.txt","w");
+  LD_sink sink = {print_pair, stdout, NULL}; // fopen("output.txt","w");
 
   // init vars
   Locus_list locus_list;
   init_locus_list(&locus_list);
   int f;
-  int position = 0;
-  int variant_index = -1;
 
   for(f=0; f<numregions; f++) {
 
-    // open htsFile
-    htsFile *htsfile = hts_open(files[f], "rz");
-
-    if(!htsfile) {
-      fprintf(stderr, "Unable to open file %s\n", files[f]);
-      return EXIT_FAILURE;
-    }
-
-    // read header
-    bcf_hdr_t *hdr = bcf_hdr_read(htsfile);
-
-    if(!hdr) {
-      fprintf(stderr, "Unable to read header from file %s\n", files[f]);
-      return EXIT_FAILURE;
-    }
-
-    // use sample list if provided
-    // this speeds up VCF parsing
-    if(samples_list) {
-
-      // can be a file
-      int is_file = 1;
-
-      // or a comma-separated list
-      if(strstr(samples_list, ",") != NULL) {
-        is_file = 0;
-      }
-      else if(access( samples_list, F_OK ) < 0) {
-        fprintf(stderr, "Failed to read samples list %s\n", samples_list);
-        return EXIT_FAILURE;
-      }
-
-      if(bcf_hdr_set_samples(hdr, samples_list, is_file) < 0) {
-        fprintf(stderr, "Failed to read or set samples\n");
-        return EXIT_FAILURE;
-      }
-    }
-
-    // get file format and act accordingly
-    enum htsExactFormat format = hts_get_format(htsfile)->format;
+    LD_file *file = ld_open(files[f], samples_list, samples_is_file);
 
-    if(format == vcf) {
-    
-      // open index
-      tbx_t *idx = tbx_index_load(files[f]);
-
-      if(!idx) {
-        fprintf(stderr, "Could not load .tbi/.csi index for file %s\n", files[f]);
-        return EXIT_FAILURE;
-      }
-
-      // query
-      hts_itr_t *itr = tbx_itr_querys(idx, regions[f]);
-
-      // dive out without iter
-      if(!itr) return 0;
-
-      // set up vars
-      kstring_t str = {0,0,0};
-      bcf1_t *line = bcf_init();
-
-      // iterate over file
-      while(tbx_itr_next(htsfile, idx, itr, &str) > 0) {
-
-        // parse into vcf struct as line
-        if(vcf_parse(&str, hdr, line) == 0) {
-
-          // check include_variants
-          if(have_include_variants && check_include_variants(line, include_variants, variant) == 0) 
-          continue;
-
-          position = line->pos + (2 - bcf_is_snp(line));
-          if (windowsize && variant_index > 0 && abs(position - locus_list.locus[variant_index].position) > windowsize)
-          continue;
-
-          if (get_genotypes(&locus_list, hdr, line, position)) {
-            if (!variant && !var_position) {
-              process_window(&locus_list, windowsize, fh, position);
-            } else if (variant) {
-              if (!strcmp(variant, locus_list.locus[locus_list.tail].var_id)) {
-                variant_index = locus_list.tail;
-              }
-            } else if (var_position) {
-              if (var_position == locus_list.locus[locus_list.tail].position) {
-                variant_index = locus_list.tail;
-              }
-            }
-          }
-        }
-      }
-
-      free(str.s);
-      tbx_destroy(idx);
-      tbx_itr_destroy(itr);
-    }
-
-    else if(format == bcf) {
-
-      // open index
-      hts_idx_t *idx = bcf_index_load(files[f]);
-
-      if(!idx) {
-        fprintf(stderr, "Could not load .csi index for file %s\n", files[f]);
-        return EXIT_FAILURE;
-      }
-
-      // query
-      hts_itr_t *itr = bcf_itr_querys(idx, hdr, regions[f]);
-
-      // dive out without iter
-      if(!itr) return 0;
-
-      bcf1_t *line = bcf_init();
-
-      while(bcf_itr_next(htsfile, itr, line) >= 0) {
-        // check include_variants
-        if(have_include_variants && check_include_variants(line, include_variants, variant) == 0) 
-          continue;
-
-        position = line->pos + (2 - bcf_is_snp(line));
-        if (windowsize && variant_index > 0 && abs(position - locus_list.locus[variant_index].position) > windowsize)
-	  continue;
-
-        if (get_genotypes(&locus_list, hdr, line, position)) {
-          if (!variant && !var_position) {
-            process_window(&locus_list, windowsize, fh, position);
-          } else if (variant) {
-            if (!strcmp(variant, locus_list.locus[locus_list.tail].var_id)) {
-              variant_index = locus_list.tail;
-            }
-          } else if (var_position) {
-            if (var_position == locus_list.locus[locus_list.tail].position) {
-              variant_index = locus_list.tail;
-            }
-          }
-        }
-      }
-
-      hts_idx_destroy(idx);
-      bcf_itr_destroy(itr);
-    }
-
-    else {
-      fprintf(stderr, "Unsupported format for file %s\n", files[f]);
+    if(!file) {
       return EXIT_FAILURE;
     }
 
-    bcf_hdr_destroy(hdr);
+    // dive out without iter
+    if(read_region(file, regions[f], &query, &locus_list, &sink)) return 0;
 
-    if ( hts_close(htsfile) ) {
+    if ( ld_close(file) ) {
       fprintf(stderr, "hts_close returned non-zero status: %s\n", files[f]);
       return EXIT_FAILURE;
     }
   }
 
-  if (!variant) {
-    // process any remaining buffer
-    process_window(&locus_list, 0, fh, position);
-  } else if (variant_index >= 0) { // Variable initialised to -1, if set correctly, set to int >= 0
-    // Compute LD around variant of interest
-    calculate_ld(&locus_list, fh, windowsize, variant_index);
-  }
+  finish_query(&query, &locus_list, &sink);
   return 0;
 }
+#endif
@@ -0,0 +1,305 @@
+"""
+In-process Python binding for the ld_vcf LD engine.
+
+Wraps the shared library built from ld_vcf.c (`make libld_vcf.so`, see
+README.txt) so that LD can be calculated without starting the ld_vcf binary
+and parsing its output. Opened files keep their htslib handle and index
+loaded across queries.
+
+Example:
+    from ld_vcf import LDFile
+
+    with LDFile("ALL.chr1.vcf.gz") as vcf:
+        ld = vcf.query("1:230710048-230810048", window=100000)
+        print(ld.variant_a[ld.r2 > 0.8])
+"""
+
+import ctypes
+import errno
+import os
+from collections import namedtuple
+
+import numpy as np
+
+WINDOW_SIZE = 100000
+LIBRARY = os.environ.get(
+    "LD_VCF_LIBRARY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "libld_vcf.so"))
+
+LDResult = namedtuple("LDResult", ["position_a", "variant_a",
+                                   "position_b", "variant_b",
+                                   "r2", "d_prime", "n"])
+LDResult.__doc__ = """Pairwise LD stats, one array element per variant pair
+(same columns as the ld_vcf output)"""
+
+Genotypes = namedtuple("Genotypes", ["start", "position", "variant", "genotypes"])
+Genotypes.__doc__ = """Decoded genotypes, one row per variant and one column per
+sample (uint8 codes; MISSING_GENOTYPE for samples skipped by ld_vcf)"""
+
+MISSING_GENOTYPE = 0xff
+
+
+class _Result(ctypes.Structure):
+    # must match LD_result in ld_vcf.c
+    _fields_ = [("n_loci", ctypes.c_int),
+                ("sz_loci", ctypes.c_int),
+                ("position", ctypes.POINTER(ctypes.c_int)),
+                ("var_id", ctypes.POINTER(ctypes.c_char_p)),
+                ("n_pairs", ctypes.c_int),
+                ("sz_pairs", ctypes.c_int),
+                ("locus_a", ctypes.POINTER(ctypes.c_int)),
+                ("locus_b", ctypes.POINTER(ctypes.c_int)),
+                ("r2", ctypes.POINTER(ctypes.c_double)),
+                ("d_prime", ctypes.POINTER(ctypes.c_double)),
+                ("N", ctypes.POINTER(ctypes.c_int))]
+
+
+class _Genotypes(ctypes.Structure):
+    # must match LD_genotypes in ld_vcf.c
+    _fields_ = [("n_loci", ctypes.c_int),
+                ("sz_loci", ctypes.c_int),
+                ("n_samples", ctypes.c_int),
+                ("start", ctypes.POINTER(ctypes.c_int)),
+                ("position", ctypes.POINTER(ctypes.c_int)),
+                ("var_id", ctypes.POINTER(ctypes.c_char_p)),
+                ("genotypes", ctypes.POINTER(ctypes.c_uint8))]
+
+
+_lib = None
+
+
+def load_library(path=LIBRARY):
+    """Load libld_vcf.so and declare the signatures of its entry points"""
+    global _lib
+    if _lib is None:
+        lib = ctypes.CDLL(path)
+        lib.ld_open.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_int]
+        lib.ld_open.restype = ctypes.c_void_p
+        lib.ld_close.argtypes = [ctypes.c_void_p]
+        lib.ld_close.restype = ctypes.c_int
+        lib.ld_query.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int,
+                                 ctypes.c_char_p, ctypes.c_int,
+                                 ctypes.POINTER(ctypes.c_char_p), ctypes.c_int]
+        lib.ld_query.restype = ctypes.POINTER(_Result)
+        lib.ld_result_free.argtypes = [ctypes.POINTER(_Result)]
+        lib.ld_result_free.restype = None
+        lib.ld_n_samples.argtypes = [ctypes.c_void_p]
+        lib.ld_n_samples.restype = ctypes.c_int
+        lib.ld_sample_name.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.ld_sample_name.restype = ctypes.c_char_p
+        lib.ld_decode.argtypes = [ctypes.c_void_p, ctypes.c_char_p,
+                                  ctypes.POINTER(ctypes.c_int), ctypes.c_int,
+                                  ctypes.POINTER(ctypes.c_char_p), ctypes.c_int]
+        lib.ld_decode.restype = ctypes.POINTER(_Genotypes)
+        lib.ld_genotypes_free.argtypes = [ctypes.POINTER(_Genotypes)]
+        lib.ld_genotypes_free.restype = None
+        lib.ld_compute.argtypes = [ctypes.POINTER(ctypes.c_int),
+                                   ctypes.POINTER(ctypes.c_char_p),
+                                   ctypes.POINTER(ctypes.c_uint8),
+                                   ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                   ctypes.c_char_p, ctypes.c_int]
+        lib.ld_compute.restype = ctypes.POINTER(_Result)
+        lib.ld_error_code.argtypes = []
+        lib.ld_error_code.restype = ctypes.c_int
+        lib.ld_error_message.argtypes = []
+        lib.ld_error_message.restype = ctypes.c_char_p
+        _lib = lib
+    return _lib
+
+
+def _check(lib, res):
+    """Raise the error of the last library call if it returned NULL"""
+    if res:
+        return res
+    code, message = lib.ld_error_code(), lib.ld_error_message().decode()
+    if code == errno.ENOMEM:
+        raise MemoryError(message)
+    if code == errno.EINVAL:
+        raise ValueError(message)
+    raise OSError(code, message)
+
+
+def _array(pointer, size, dtype):
+    """Copy a C array into a NumPy array"""
+    if size == 0:
+        return np.empty(0, dtype=dtype)
+    return np.ctypeslib.as_array(pointer, shape=(size,)).astype(dtype, copy=True)
+
+
+def _encode(value):
+    return value.encode() if isinstance(value, str) else value
+
+
+def _variant_list(variants):
+    """C array of variant ids (and its size) for include_variants, None if not given"""
+    if variants is None:
+        return None, 0
+    variants = [_encode(v) for v in variants]
+    return (ctypes.c_char_p * (len(variants) + 1))(*variants), len(variants)
+
+
+def _strings(pointer, size):
+    return np.array([pointer[i].decode() for i in range(size)], dtype=object)
+
+
+def _to_result(lib, res):
+    """Convert an LD_result into an LDResult and free it"""
+    _check(lib, res)
+    try:
+        r = res.contents
+        position = _array(r.position, r.n_loci, np.int64)
+        var_id = _strings(r.var_id, r.n_loci)
+        a = _array(r.locus_a, r.n_pairs, np.intp)
+        b = _array(r.locus_b, r.n_pairs, np.intp)
+        return LDResult(position_a=position[a], variant_a=var_id[a],
+                        position_b=position[b], variant_b=var_id[b],
+                        r2=_array(r.r2, r.n_pairs, np.float64),
+                        d_prime=_array(r.d_prime, r.n_pairs, np.float64),
+                        n=_array(r.N, r.n_pairs, np.int64))
+    finally:
+        lib.ld_result_free(res)
+
+
+class LDFile:
+    """
+    A tabix-indexed VCF (or CSI-indexed BCF) file opened for LD queries.
+
+    samples can be a list of sample names or the path to a file with one
+    sample per line; only those samples are decoded.
+    """
+
+    def __init__(self, path, samples=None):
+        self.path = path
+        self.samples = samples
+        self._sample_index = None
+        self._lib = load_library()
+
+        if samples is None:
+            samples_list, is_file = None, 0
+        elif isinstance(samples, str):
+            samples_list, is_file = _encode(samples), 1
+        else:
+            samples_list, is_file = _encode(",".join(samples)), 0
+
+        self._handle = _check(self._lib, self._lib.ld_open(_encode(path), samples_list, is_file))
+
+    def query(self, region, window=WINDOW_SIZE, variant=None, var_position=None,
+              include_variants=None):
+        """
+        Calculate pairwise LD for the variants in region (e.g. '1:1000-2000').
+
+        As with ld_vcf, variant or var_position restrict the results to pairs
+        with that variant and include_variants restricts the variants read.
+        Raises ValueError if region is not in the file (e.g. unknown contig).
+        """
+        self._check_open()
+        include, n_include = _variant_list(include_variants)
+        res = self._lib.ld_query(self._handle, _encode(region), int(window),
+                                 _encode(variant), int(var_position or 0),
+                                 include, n_include)
+        return _to_result(self._lib, res)
+
+    def sample_names(self):
+        """Names of the samples decoded from this file"""
+        self._check_open()
+        return [self._lib.ld_sample_name(self._handle, i).decode()
+                for i in range(self._lib.ld_n_samples(self._handle))]
+
+    def decode(self, region, samples=None, include_variants=None):
+        """
+        Decode the genotypes of the variants in region without calculating LD,
+        e.g. to keep them in memory and pass them to compute_ld() later.
+
+        samples (names) and include_variants restrict what is decoded, with
+        the same results as a sample list given to LDFile and include_variants
+        given to query(); samples are kept in the order of the file.
+        Raises ValueError if region is not in the file (e.g. unknown contig)
+        or if a sample is not in the file.
+        """
+        self._check_open()
+
+        indices, n_indices = None, 0
+        if samples is not None:
+            if self._sample_index is None:
+                self._sample_index = {name: i for i, name in enumerate(self.sample_names())}
+            missing = [s for s in samples if s not in self._sample_index]
+            if missing:
+                raise ValueError(f"unknown samples in {self.path}: {','.join(missing)}")
+            selected = sorted({self._sample_index[s] for s in samples})
+            n_indices = len(selected)
+            indices = (ctypes.c_int * (n_indices + 1))(*selected)
+        include, n_include = _variant_list(include_variants)
+
+        res = _check(self._lib, self._lib.ld_decode(self._handle, _encode(region),
+                                                    indices, n_indices, include, n_include))
+        try:
+            g = res.contents
+            n_loci, n_samples = g.n_loci, g.n_samples
+            return Genotypes(
+                start=_array(g.start, n_loci, np.int64),
+                position=_array(g.position, n_loci, np.int64),
+                variant=_strings(g.var_id, n_loci),
+                genotypes=_array(g.genotypes, n_loci * n_samples, np.uint8)
+                          .reshape(n_loci, n_samples))
+        finally:
+            self._lib.ld_genotypes_free(res)
+
+    def _check_open(self):
+        if self._handle is None:
+            raise ValueError(f"{self.path} is closed")
+
+    def close(self):
+        if self._handle is not None:
+            status = self._lib.ld_close(self._handle)
+            self._handle = None
+            if status:
+                raise IOError(f"hts_close returned non-zero status: {self.path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __del__(self):
+        if getattr(self, "_handle", None) is not None:
+            self._lib.ld_close(self._handle)
+            self._handle = None
+
+
+def compute_ld(position, var_id, genotypes, window=WINDOW_SIZE, variant=None,
+               var_position=None):
+    """
+    Calculate pairwise LD from decoded genotypes (see LDFile.decode), with
+    the same window and variant logic as LDFile.query(). Variants must be
+    sorted by position.
+    """
+    lib = load_library()
+    position = np.ascontiguousarray(position, dtype=np.intc)
+    genotypes = np.ascontiguousarray(genotypes, dtype=np.uint8)
+    n_loci = len(position)
+    n_samples = genotypes.shape[1] if genotypes.ndim == 2 else 0
+    ids = (ctypes.c_char_p * (n_loci + 1))(*[_encode(v) for v in var_id])
+
+    res = lib.ld_compute(position.ctypes.data_as(ctypes.POINTER(ctypes.c_int)),
+                         ids,
+                         genotypes.ctypes.data_as(ctypes.POINTER(ctypes.c_uint8)),
+                         n_loci, n_samples, int(window), _encode(variant),
+                         int(var_position or 0))
+    return _to_result(lib, res)
+
+
+_open_files = {}
+
+
+def calculate_ld(path, region, window=WINDOW_SIZE, samples=None, **filters):
+    """
+    Calculate pairwise LD for region, keeping the file open for later calls.
+
+    Returns an LDResult; filters are passed on to LDFile.query().
+    """
+    key = (path, samples if samples is None or isinstance(samples, str)
+           else tuple(samples))
+    if key not in _open_files:
+        _open_files[key] = LDFile(path, samples)
+    return _open_files[key].query(region, window=window, **filters)
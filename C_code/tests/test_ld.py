@@ -0,0 +1,160 @@
+"""
+Tests of the Python binding (ld_vcf.py) and the LD service (ld_server.py).
+
+Tests using the library are skipped if libld_vcf.so is not built (see
+README.txt) or cannot be loaded; set LD_VCF_LIBRARY to use another build.
+The test VCF is written and indexed with pysam.
+
+Usage:
+    python3 -m pytest C_code/tests
+"""
+
+import errno
+import os
+import random
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ld_vcf  # noqa: E402
+from ld_server import GenotypeCache, LDService  # noqa: E402
+from ld_vcf import Genotypes, LDFile  # noqa: E402
+
+BLOCK_SIZE = 100
+N_SAMPLES = 8
+# variants on both sides of the edges of blocks 0-2 (block_size 100)
+POSITIONS = [1, 50, 99, 100, 101, 102, 150, 199, 200, 201, 250, 300]
+
+
+@pytest.fixture(scope="module")
+def library():
+    if not os.path.exists(ld_vcf.LIBRARY):
+        pytest.skip(f"{ld_vcf.LIBRARY} is not built")
+    try:
+        return ld_vcf.load_library()
+    except OSError as e:
+        pytest.skip(f"cannot load {ld_vcf.LIBRARY}: {e}")
+
+
+@pytest.fixture(scope="module")
+def vcf(tmp_path_factory):
+    pysam = pytest.importorskip("pysam")
+    path = tmp_path_factory.mktemp("ld") / "test.vcf"
+    rng = random.Random(1)
+    with open(path, "w") as f:
+        f.write("##fileformat=VCFv4.2\n##contig=<ID=1,length=1000>\n"
+                '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">\n')
+        f.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" +
+                "\t".join(f"S{i}" for i in range(N_SAMPLES)) + "\n")
+        for pos in POSITIONS:
+            gts = [f"{rng.randint(0, 1)}|{rng.randint(0, 1)}" for _ in range(N_SAMPLES)]
+            if pos == 150:
+                # alt allele only in S7
+                gts = ["0|0"] * (N_SAMPLES - 1) + ["0|1"]
+            f.write(f"1\t{pos}\trs{pos}\tA\tG\t.\tPASS\t.\tGT\t" + "\t".join(gts) + "\n")
+    return pysam.tabix_index(str(path), preset="vcf", force=True)
+
+
+class _ErrorLibrary:
+    """Stands in for the library, with the error of the last call"""
+
+    def __init__(self, code, message):
+        self.code, self.message = code, message
+
+    def ld_error_code(self):
+        return self.code
+
+    def ld_error_message(self):
+        return self.message.encode()
+
+
+@pytest.mark.parametrize("code,error", [(errno.ENOMEM, MemoryError),
+                                        (errno.EINVAL, ValueError),
+                                        (errno.EIO, OSError)])
+def test_check_error_types(code, error):
+    with pytest.raises(error, match="failed"):
+        ld_vcf._check(_ErrorLibrary(code, "failed"), None)
+    assert ld_vcf._check(_ErrorLibrary(code, "failed"), 1) == 1
+
+
+def test_unknown_contig(library, vcf):
+    with LDFile(vcf) as f:
+        with pytest.raises(ValueError, match="Unknown contig"):
+            f.query("2:1-100")
+        with pytest.raises(ValueError, match="Unknown contig"):
+            f.decode("2:1-100")
+        with pytest.raises(ValueError, match="unknown samples"):
+            f.decode("1:1-100", samples=["S1", "S100"])
+
+
+def _block(n_variants, n_samples=10):
+    return Genotypes(start=np.zeros(n_variants, dtype=np.int64),
+                     position=np.zeros(n_variants, dtype=np.int64),
+                     variant=np.array(["rs"] * n_variants, dtype=object),
+                     genotypes=np.zeros((n_variants, n_samples), dtype=np.uint8))
+
+
+def test_cache_evicts_least_recently_used():
+    size = GenotypeCache.size(_block(1))
+    cache = GenotypeCache(3 * size)
+    for key in "abc":
+        cache.put(key, _block(1))
+    assert cache.get("a") is not None  # b is now the least recently used
+    cache.put("d", _block(1))
+
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.bytes == 3 * size
+
+    # a block bigger than the cache is not cached, nor evicts anything
+    cache.put("e", _block(4))
+    assert cache.get("e") is None
+    assert cache.stats()["blocks"] == 3
+
+    # a block of two evicts the two least recently used
+    cache.put("f", _block(2))
+    assert cache.get("a") is None and cache.get("c") is None
+    assert cache.get("d") is not None and cache.get("f") is not None
+    assert cache.bytes <= cache.max_bytes
+
+
+def _assert_same_ld(result, expected):
+    for name in expected._fields:
+        np.testing.assert_array_equal(getattr(result, name), getattr(expected, name),
+                                      err_msg=name)
+
+
+@pytest.mark.parametrize("region", ["1:1-1000", "1:1-100", "1:100-101", "1:101-200",
+                                    "1:99-201", "1:100-100", "1:200-300", "1:301-1000"])
+def test_block_edges(library, vcf, region):
+    service = LDService([vcf], block_size=BLOCK_SIZE)
+    with LDFile(vcf) as f:
+        expected = f.query(region, window=1000)
+        # twice: from the file, then from the cache
+        for _ in range(2):
+            _assert_same_ld(service.query(os.path.basename(vcf), region, window=1000),
+                            expected)
+        start, end = map(int, region.split(":")[1].split("-"))
+        genotypes = service.genotypes(vcf, "1", start, end)
+        assert list(genotypes.position) == [p for p in POSITIONS if start <= p <= end]
+
+
+@pytest.mark.parametrize("samples", [["S0", "S1", "S2", "S3"], ["S6", "S7", "S0"]])
+def test_samples_and_include_variants(library, vcf, samples):
+    service = LDService([vcf], block_size=BLOCK_SIZE)
+    include = ["rs1", "rs100", "rs150", "rs201", "rs300"]
+    with LDFile(vcf, samples) as f:
+        _assert_same_ld(service.query(vcf, "1:1-1000", window=1000, samples=samples),
+                        f.query("1:1-1000", window=1000))
+        _assert_same_ld(service.query(vcf, "1:1-1000", window=1000, samples=samples,
+                                      include_variants=include, variant="rs101"),
+                        f.query("1:1-1000", window=1000, include_variants=include,
+                                variant="rs101"))
+
+    # rs150 has no alt allele in the samples without S7, so it is skipped
+    genotypes = service.genotypes(vcf, "1", 1, 1000, tuple(sorted(samples)))
+    assert ("rs150" in genotypes.variant) == ("S7" in samples)
+    assert genotypes.genotypes.shape[1] == len(samples)
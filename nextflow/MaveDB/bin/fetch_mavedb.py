@@ -0,0 +1,5 @@
+#!/usr/bin/env python3
+from mavedb.fetch import main
+
+if __name__ == "__main__":
+  main()
@@ -10,12 +10,16 @@ urn=$1
 mappings_path=$2
 scores_path=$3
 
+# Locate the files with the same rule as the catalogue (catalogue.py find):
+# names containing the urn, case-insensitive, preferring names where it is
+# not followed by a digit (e.g. -a-1 rather than -a-10)
+
 # Locate the mapping file using the original urn (with colons)
-mapping_file=$(find ${mappings_path} -type f -iname "*${urn}*.json" | head -n 1)
+mapping_file=$(catalogue.py find --path "${mappings_path}" --suffix .json --name "${urn}")
 
 # Replace colons with hyphens for searching the scores directory
 score_urn=$(echo "${urn}" | sed 's/:/-/g')
-score_file=$(find ${scores_path} -type f -iname "*${score_urn}.scores.csv" | head -n 1)
+score_file=$(catalogue.py find --path "${scores_path}" --suffix .scores.csv --name "${score_urn}.scores.csv")
 
 # Check if the mapping and scores files exist in the user-provided directories
 if [ ! -f "${mapping_file}" ]; then
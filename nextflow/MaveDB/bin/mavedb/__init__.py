@@ -0,0 +1,8 @@
+"""
+Python code of the MaveDB pipeline
+
+The scripts in bin/ are thin entry points over these modules. Modules only
+import what is needed to parse arguments; heavy or rarely used dependencies
+(such as pyliftover or urllib.request) are imported where they are used, as
+every Nextflow task pays for the start-up time of its script.
+"""
@@ -0,0 +1,274 @@
+"""
+Catalogue of all MaveDB score sets in the data dump, for task planning
+
+Parses the data dump metadata (main.json) once, with the same logic as
+extract_metadata.py, and stores one row per URN in an indexed SQLite table:
+licence, number of variants, target gene and RefSeq, HGVS type and mapping
+state, the paths and sizes of its mappings and scores files and its formatted
+metadata. The HGVS type is read from the start of each mappings file, like
+split_by_mapping_type does; types other than hgvs.p and hgvs.g are reported
+as errors and left empty, so that split_by_mapping_type rejects the URN. URNs
+can then be filtered and split by HGVS type from the catalogue, and their
+metadata.json written from it, without parsing main.json or opening per-URN
+files again.
+
+Mappings and scores files of a URN are found with the same rule as
+import_from_files.sh, which calls `catalogue.py find` (see find_file).
+
+Usage:
+  catalogue.py build --metadata_file main.json --mappings_path mappings/ \\
+    --scores_path scores/ --catalogue catalogue.db
+
+  catalogue.py query --catalogue catalogue.db --urns urns.txt --licences CC0 > selected.tsv
+  catalogue.py metadata --catalogue catalogue.db --urn urn:mavedb:00000001-a-1
+  catalogue.py find --path scores/ --suffix .scores.csv --name urn-mavedb-00000001-a-1.scores.csv
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+
+from mavedb.extract_metadata import (format_metadata, load_metadata, save_metadata,
+                                     score_sets)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalogue (
+  urn           TEXT PRIMARY KEY,
+  licence       TEXT,
+  num_variants  INTEGER,
+  target_gene   TEXT,
+  refseq        TEXT,
+  hgvs_type     TEXT,    -- hgvs.p or hgvs.g (empty if unknown)
+  mapping_state TEXT,    -- from the data dump, or 'missing' without mappings file
+  mappings      TEXT,
+  mappings_size INTEGER,
+  scores        TEXT,
+  scores_size   INTEGER,
+  metadata      TEXT     -- metadata.json of the URN, as written by extract_metadata.py
+);
+CREATE INDEX IF NOT EXISTS catalogue_licence ON catalogue (licence);
+CREATE INDEX IF NOT EXISTS catalogue_hgvs_type ON catalogue (hgvs_type);
+"""
+
+COLUMNS = ["urn", "licence", "num_variants", "target_gene", "refseq", "hgvs_type",
+           "mapping_state", "mappings", "mappings_size", "scores", "scores_size"]
+
+HGVS = re.compile(rb'hgvs\.(.)', re.DOTALL)
+HGVS_TYPE = re.compile(rb'hgvs\.([pg])')
+CHUNK_SIZE = 64 * 1024
+
+
+def find_files (path, suffix):
+  """Files under path ending with suffix, as {lowercase name: path}"""
+  files = {}
+  if path:
+    for root, dirs, names in os.walk(path):
+      for name in sorted(names):
+        if name.lower().endswith(suffix.lower()):
+          files.setdefault(name.lower(), os.path.join(root, name))
+  return files
+
+
+def find_file (files, name):
+  """
+  File whose name contains name (like `find -iname "*<name>*"`), preferring
+  names where it is not followed by a digit (e.g. -a-1 rather than -a-10)
+  """
+  name = name.lower()
+  matches = [f for f in files if name in f]
+  for f in matches:
+    if not f[f.index(name) + len(name):][:1].isdigit():
+      return files[f]
+  return files[matches[0]] if matches else None
+
+
+def hgvs_type (mappings):
+  """
+  Type of the first HGVS expression in a mappings file: hgvs.p, hgvs.g or ''
+  if none; raises ValueError for other types
+  """
+  tail = b""
+  with open(mappings, 'rb') as f:
+    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+      data = tail + chunk
+      match = HGVS.search(data)
+      if match:
+        hgvs = HGVS_TYPE.match(match.group(0))
+        if hgvs is None:
+          expression = data[match.start():].split(b'"')[0][:40].decode(errors='replace')
+          raise ValueError(f"HGVS type of '{expression}' not expected")
+        return "hgvs." + hgvs.group(1).decode()
+      tail = chunk[-6:]
+  return ""
+
+
+def catalogue_row (experiment_set, score_set, mappings_files, scores_files):
+  targets = score_set.get("targetGenes", [])
+  refseq = [item['identifier']['identifier']
+            for target in targets
+            for item in target.get('externalIdentifiers', [])
+            if item.get('identifier', {}).get('dbName') == 'RefSeq']
+
+  urn = score_set.get("urn")
+  mappings = find_file(mappings_files, urn)
+  scores = find_file(scores_files, urn.replace(":", "-") + ".scores.csv")
+
+  mapping_state = score_set.get("mappingState", "")
+  if mappings_files is not None and mappings is None:
+    mapping_state = "missing"
+
+  hgvs = ""
+  if mappings:
+    try:
+      hgvs = hgvs_type(mappings)
+    except ValueError as e:
+      print(f"ERROR: {e} ({urn}, {mappings})", file=sys.stderr)
+
+  metadata = format_metadata(experiment_set, score_set)
+  return {
+    "urn"           : urn,
+    "licence"       : metadata['license']['shortName'],
+    "num_variants"  : score_set.get("numVariants"),
+    "target_gene"   : ",".join(target.get("name", "") for target in targets),
+    "refseq"        : ",".join(refseq),
+    "hgvs_type"     : hgvs,
+    "mapping_state" : mapping_state,
+    "mappings"      : mappings,
+    "mappings_size" : os.path.getsize(mappings) if mappings else None,
+    "scores"        : scores,
+    "scores_size"   : os.path.getsize(scores) if scores else None,
+    "metadata"      : json.dumps(metadata, indent=4),
+  }
+
+
+def build_catalogue (metadata_file, catalogue, mappings_path=None, scores_path=None):
+  """Write the catalogue of all score sets in metadata_file; returns the number of URNs"""
+  data = load_metadata(metadata_file)
+  mappings_files = find_files(mappings_path, ".json") if mappings_path else None
+  scores_files = find_files(scores_path, ".scores.csv") if scores_path else {}
+
+  rows = [catalogue_row(experiment_set, score_set, mappings_files, scores_files)
+          for experiment_set, score_set in score_sets(data)
+          if score_set.get("urn")]
+
+  if os.path.exists(catalogue):
+    os.remove(catalogue)
+  db = sqlite3.connect(catalogue)
+  db.executescript(SCHEMA)
+  names = COLUMNS + ["metadata"]
+  with db:
+    # later entries of the same URN replace earlier ones, like in extract_metadata.py
+    db.executemany(
+      f"INSERT OR REPLACE INTO catalogue ({', '.join(names)}) "
+      f"VALUES ({', '.join('?' for _ in names)})",
+      [[row[name] for name in names] for row in rows])
+  db.close()
+  return len(rows)
+
+
+def read_urns (f):
+  with open(f) as fh:
+    return [line.strip() for line in fh if line.strip()]
+
+
+def query (db, urns=None, licences=None, hgvs=None, columns=COLUMNS):
+  """Catalogue rows (as dictionaries), in the order of urns if given"""
+  where, values = [], []
+  if licences is not None:
+    where.append(f"licence IN ({', '.join('?' for _ in licences)})")
+    values += licences
+  if hgvs is not None:
+    where.append("hgvs_type = ?")
+    values.append(hgvs)
+
+  sql = f"SELECT {', '.join(columns)} FROM catalogue"
+  if where:
+    sql += " WHERE " + " AND ".join(where)
+  cur = db.execute(sql + " ORDER BY urn", values)
+  rows = {row[0]: dict(zip(columns, row)) for row in cur}
+
+  if urns is None:
+    return list(rows.values())
+  return [rows[urn] for urn in dict.fromkeys(urns) if urn in rows]
+
+
+def write_tsv (rows, columns, out):
+  out.write("\t".join(columns) + "\n")
+  for row in rows:
+    out.write("\t".join("" if row[c] is None else str(row[c]) for c in columns) + "\n")
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Catalogue of MaveDB score sets in the data dump')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  build = subparsers.add_parser('build', help="build the catalogue from the data dump")
+  build.add_argument('--metadata_file', type=str, required=True,
+                     help="path to MaveDB metadata file from the data dump (main.json)")
+  build.add_argument('--mappings_path', type=str,
+                     help="path to MaveDB mappings files (one JSON file per URN)")
+  build.add_argument('--scores_path', type=str,
+                     help="path to MaveDB scores files (one CSV file per URN)")
+
+  select = subparsers.add_parser('query', help="write catalogue rows as TSV")
+  select.add_argument('--urns', type=str,
+                      help="path to file with MaveDB URNs to select (default: all)")
+  select.add_argument('--licences', type=str,
+                      help="comma-separated list of licences to select (default: all)")
+  select.add_argument('--hgvs_type', type=str, choices=['hgvs.p', 'hgvs.g'],
+                      help="HGVS type to select (default: all)")
+  select.add_argument('-o', '--output', type=str,
+                      help="path to output TSV file (default: standard output)")
+
+  metadata = subparsers.add_parser('metadata',
+    help="write metadata.json and LICENCE.txt of a URN, like extract_metadata.py")
+  metadata.add_argument('--urn', type=str, required=True, help="MaveDB URN")
+
+  for subparser in (build, select, metadata):
+    subparser.add_argument('--catalogue', type=str, required=True,
+                           help="path to catalogue (SQLite database)")
+
+  find = subparsers.add_parser('find',
+    help="print the path of the file of a URN, as found when building the catalogue")
+  find.add_argument('--path', type=str, required=True,
+                    help="directory to search (recursively)")
+  find.add_argument('--suffix', type=str, required=True,
+                    help="suffix of the files to consider (e.g. '.json')")
+  find.add_argument('--name', type=str, required=True,
+                    help="part of the file name to look for (e.g. the URN)")
+  args = parser.parse_args()
+
+  if args.command == 'find':
+    path = find_file(find_files(args.path, args.suffix), args.name)
+    if path is None:
+      sys.exit(1)
+    print(path)
+    return
+
+  if args.command == 'build':
+    urns = build_catalogue(args.metadata_file, args.catalogue,
+                           args.mappings_path, args.scores_path)
+    print(f"Catalogued {urns} URNs in {args.catalogue}")
+    return
+
+  db = sqlite3.connect(args.catalogue)
+  if args.command == 'metadata':
+    row = db.execute("SELECT metadata FROM catalogue WHERE urn = ?", (args.urn,)).fetchone()
+    if row is None:
+      print(f"ERROR: no matching entry found for '{args.urn}' in catalogue '{args.catalogue}'. Exiting.")
+      sys.exit(1)
+    save_metadata(json.loads(row[0]), args.urn)
+    return
+
+  urns = read_urns(args.urns) if args.urns else None
+  licences = args.licences.split(",") if args.licences else None
+  rows = query(db, urns, licences, args.hgvs_type)
+
+  out = open(args.output, 'w') if args.output else sys.stdout
+  write_tsv(rows, COLUMNS, out)
+  if args.output:
+    out.close()
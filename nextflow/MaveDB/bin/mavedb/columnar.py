@@ -0,0 +1,236 @@
+"""
+Columnar (Parquet) store of MaveDB scores mapped to variants, with region and
+URN lookups
+
+Converts the combined MaveDB output (sorted by chr, start and end, as written
+by the pipeline before bgzip) into a Parquet file with one or more row groups
+per genomic bin, typed coordinates and score/p-value columns (values that
+are not numbers are stored as null and counted in a warning), plus a small
+JSON interval index (<file>.idx.json) with the span and URNs of each row
+group. Variants without a start (or chr) are kept in row groups of their own,
+with a null bin and span, so that they are only found by URN. Queries only
+read the row groups overlapping a region (or containing a URN) and return
+Arrow tables or NumPy arrays.
+
+Usage:
+  to_parquet.py --input MaveDB_variants.tsv --output MaveDB_variants.parquet
+
+  from mavedb.columnar import ScoreStore
+  store = ScoreStore("MaveDB_variants.parquet")
+  table = store.region("17", 43044295, 43125483)
+  arrays = store.urn("urn:mavedb:00000001-a-1", columns=["start", "score"], numpy=True)
+"""
+
+import argparse
+import json
+
+BIN_SIZE = 1000000
+MAX_ROW_GROUP = 1000000
+BATCH_SIZE = 64 * 1024 * 1024  # bytes of text read at a time
+NULL_VALUES = ["", "NA", "NaN", "nan", "None"]
+INT_COLUMNS = ["start", "end"]
+FLOAT_COLUMNS = ["score", "pvalue"]
+INDEX_SUFFIX = ".idx.json"
+# values of float columns that are numbers (others are stored as null)
+FLOAT_PATTERN = r"^[+-]?((\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|inf|infinity|nan)$"
+
+
+def read_header (f):
+  """Column names of a TSV file (the header may start with '#')"""
+  with open(f) as fh:
+    return fh.readline().rstrip("\n").lstrip("#").split("\t")
+
+
+def _row_groups (batch, bin_size, max_rows):
+  """
+  Split a batch (sorted by chr and start) into slices of the same chr and bin;
+  rows without a start are split from the others, with a bin of None
+  """
+  import numpy as np
+
+  chrom = batch.column("chr").to_numpy(zero_copy_only=False)
+  start = batch.column("start")
+  missing = start.is_null().to_numpy(zero_copy_only=False)
+  bins = start.fill_null(0).to_numpy() // bin_size
+  change = np.flatnonzero((chrom[1:] != chrom[:-1]) | (bins[1:] != bins[:-1]) |
+                          (missing[1:] != missing[:-1])) + 1
+  bounds = [0] + change.tolist() + [len(chrom)]
+
+  for i, j in zip(bounds[:-1], bounds[1:]):
+    group = (chrom[i], None if missing[i] else int(bins[i]))
+    for k in range(i, j, max_rows):
+      yield group, batch.slice(k, min(j, k + max_rows) - k)
+
+
+def _to_floats (batch, schema, float_columns, invalid):
+  """
+  Batch with float_columns (read as text) converted to floats; values that
+  are not numbers become null and are counted in invalid (column -> count)
+  """
+  import pyarrow as pa
+  import pyarrow.compute as pc
+
+  columns = []
+  for name, column in zip(batch.schema.names, batch.columns):
+    if name in float_columns:
+      number = pc.match_substring_regex(column, FLOAT_PATTERN, ignore_case=True)
+      invalid[name] += pc.sum(pc.invert(number)).as_py() or 0
+      column = pc.if_else(number, column, pa.scalar(None, pa.string()))
+      column = pc.cast(column, pa.float64())
+    columns.append(column)
+  return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def write_parquet (input, output, bin_size=BIN_SIZE, max_rows=MAX_ROW_GROUP,
+                   float_columns=FLOAT_COLUMNS):
+  """
+  Convert a TSV sorted by chr, start and end into a Parquet file with row
+  groups aligned to genomic bins of bin_size; writes the index next to it.
+  Values of float_columns that are not numbers are stored as null, with a
+  warning.
+  """
+  import pyarrow as pa
+  import pyarrow.compute as pc
+  import pyarrow.csv as csv
+  import pyarrow.parquet as pq
+
+  names = read_header(input)
+  types = {name: pa.string() for name in names}
+  types.update({name: pa.int64() for name in INT_COLUMNS if name in types})
+  floats = [name for name in float_columns if name in types]
+  schema = pa.schema([(name, pa.float64() if name in floats else types[name])
+                      for name in names])
+  invalid = dict.fromkeys(floats, 0)
+
+  # float columns are read as text, so that values that are not numbers do
+  # not fail the conversion (see _to_floats)
+  reader = csv.open_csv(
+    input,
+    read_options=csv.ReadOptions(column_names=names, skip_rows=1, block_size=BATCH_SIZE),
+    parse_options=csv.ParseOptions(delimiter="\t"),
+    convert_options=csv.ConvertOptions(column_types=types, null_values=NULL_VALUES,
+                                       strings_can_be_null=True))
+
+  index = {"bin_size": bin_size, "columns": names, "row_groups": []}
+  seen = set()
+  pending, rows_pending, key = [], 0, None
+
+  def flush (writer):
+    table = pa.Table.from_batches(pending, schema=schema)
+    writer.write_table(table, row_group_size=len(table))
+    urns = pc.unique(table.column("urn")).to_pylist() if "urn" in names else []
+    index["row_groups"].append({
+      "chr"   : key[0],
+      "bin"   : key[1],
+      "start" : pc.min(table.column("start")).as_py(),
+      # rows without an end only count by their start
+      "end"   : pc.max(pc.coalesce(table.column("end"), table.column("start"))).as_py(),
+      "rows"  : len(table),
+      "urns"  : sorted(u for u in urns if u is not None)})
+
+  with pq.ParquetWriter(output, schema) as writer:
+    for batch in reader:
+      batch = _to_floats(batch, schema, floats, invalid)
+      for group, rows in _row_groups(batch, bin_size, max_rows):
+        if pending and (group != key or rows_pending + len(rows) > max_rows):
+          flush(writer)
+          pending, rows_pending = [], 0
+        if (key is None or group[0] != key[0]) and group[0] in seen:
+          raise Exception(f"input is not sorted by chromosome: {group[0]} found again")
+        seen.add(group[0])
+        pending.append(rows)
+        rows_pending += len(rows)
+        key = group
+    if pending:
+      flush(writer)
+
+  with open(output + INDEX_SUFFIX, "w") as f:
+    json.dump(index, f)
+
+  for name, count in invalid.items():
+    if count:
+      print(f"WARNING: {count} values of column '{name}' are not numbers and were stored as null")
+  return index
+
+
+def to_numpy (table):
+  """Dictionary of column name to NumPy array (nulls are NaN or None)"""
+  return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+class ScoreStore:
+  """Region and URN lookups in a Parquet file written by write_parquet()"""
+
+  def __init__(self, path):
+    import pyarrow.parquet as pq
+
+    self.path = path
+    self.file = pq.ParquetFile(path)
+    with open(path + INDEX_SUFFIX) as f:
+      self.index = json.load(f)
+
+  @property
+  def columns(self):
+    return self.index["columns"]
+
+  def _read (self, row_groups, columns, mask):
+    import pyarrow.compute as pc
+
+    read = None if columns is None else list(dict.fromkeys(
+      list(columns) + [c for c in ("chr", "start", "end", "urn") if c in self.columns]))
+    table = self.file.read_row_groups(row_groups, columns=read)
+    table = table.filter(mask(table, pc))
+    if columns is not None:
+      table = table.select(list(columns))
+    return table
+
+  def region (self, chr, start, end, columns=None, numpy=False):
+    """
+    Variants overlapping chr:start-end (1-based, inclusive), as an Arrow table
+    (or a dictionary of NumPy arrays if numpy is True)
+    """
+    chr = str(chr)
+    # row groups of variants without coordinates have no span
+    groups = [i for i, g in enumerate(self.index["row_groups"])
+              if g["chr"] == chr and g["bin"] is not None and
+              g["start"] <= end and g["end"] >= start]
+
+    def mask (table, pc):
+      # variants without an end overlap the region by their start
+      return pc.and_(pc.and_(pc.equal(table["chr"], chr),
+                             pc.less_equal(table["start"], end)),
+                     pc.greater_equal(pc.coalesce(table["end"], table["start"]), start))
+
+    table = self._read(groups, columns, mask)
+    return to_numpy(table) if numpy else table
+
+  def urn (self, urn, columns=None, numpy=False):
+    """Variants of a MaveDB URN, as an Arrow table (or a dictionary of NumPy arrays)"""
+    groups = [i for i, g in enumerate(self.index["row_groups"]) if urn in g["urns"]]
+
+    def mask (table, pc):
+      return pc.equal(table["urn"], urn)
+
+    table = self._read(groups, columns, mask)
+    return to_numpy(table) if numpy else table
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Convert sorted MaveDB variants into a Parquet file with an interval index')
+  parser.add_argument('--input', type=str, required=True,
+                      help="path to TSV file with MaveDB variants sorted by chr, start and end")
+  parser.add_argument('--output', type=str, required=True,
+                      help=f"path to Parquet output file (the index is written to <output>{INDEX_SUFFIX})")
+  parser.add_argument('--bin_size', type=int, default=BIN_SIZE,
+                      help=f"size of genomic bins that row groups are aligned to (default: {BIN_SIZE})")
+  parser.add_argument('--max_rows', type=int, default=MAX_ROW_GROUP,
+                      help=f"maximum number of rows per row group (default: {MAX_ROW_GROUP})")
+  parser.add_argument('--float_columns', type=str, default=",".join(FLOAT_COLUMNS),
+                      help=f"comma-separated columns stored as floats (default: {','.join(FLOAT_COLUMNS)})")
+  args = parser.parse_args()
+
+  index = write_parquet(args.input, args.output, args.bin_size, args.max_rows,
+                        args.float_columns.split(","))
+  rows = sum(g["rows"] for g in index["row_groups"])
+  print(f"Wrote {rows} variants in {len(index['row_groups'])} row groups to {args.output}")
@@ -0,0 +1,335 @@
+"""
+Download metadata, mappings and scores of MaveDB URNs from the MaveDB API
+
+URNs are scheduled with asyncio, while requests are made with blocking
+http.client calls in a thread pool, over a small pool of persistent HTTP
+connections (so at most --concurrency requests are in flight). Requests are
+retried with exponential backoff on connection errors, rate limiting (429) and
+server errors (5xx). Response bodies are streamed to disk in chunks, kept in a
+local cache and revalidated with conditional requests (ETag/Last-Modified), so
+that unchanged resources are not transferred again.
+
+For each URN, writes <outdir>/<urn>/ with metadata.json and LICENCE.txt and,
+if its licence is accepted, mappings.json and scores.csv. URNs that could not
+be downloaded are reported and skipped.
+
+Usage:
+  fetch_mavedb.py --urns urns.txt --outdir mavedb --cache cache/ --licences CC0
+"""
+
+import argparse
+import asyncio
+import hashlib
+import http.client
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlsplit
+
+BASE_URL = "https://api.mavedb.org/api/v1"
+CONCURRENCY = 8
+RETRIES = 5
+BACKOFF = 1   # seconds; doubled after each failed attempt
+MAX_BACKOFF = 60
+TIMEOUT = 300
+RETRY_STATUS = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 1024 * 1024
+
+# files downloaded per URN, as (file, path after /score-sets/<urn>)
+METADATA = ("metadata.json", "")
+DATA = [("mappings.json", "/mapped-variants"),
+        ("scores.csv",    "/scores")]
+
+
+class HTTPError(Exception):
+  def __init__(self, url, status, reason):
+    super().__init__(f"HTTP {status} {reason}: {url}")
+    self.status = status
+
+
+class ConnectionPool:
+  """
+  Persistent HTTP(S) connections to the host of base_url, with at most size
+  requests in flight. Requests use http.client in a thread pool of the same
+  size, so blocking reads do not stall the event loop.
+  """
+
+  def __init__(self, base_url, size=CONCURRENCY, timeout=TIMEOUT):
+    url = urlsplit(base_url)
+    if url.scheme not in ("http", "https"):
+      raise ValueError(f"unsupported URL: {base_url}")
+    self.scheme = url.scheme
+    self.host = url.hostname
+    self.port = url.port
+    self.prefix = url.path.rstrip("/")
+    self.timeout = timeout
+    self._idle = []
+    self._semaphore = asyncio.Semaphore(size)
+    self._executor = ThreadPoolExecutor(max_workers=size)
+
+  def url(self, path):
+    port = f":{self.port}" if self.port else ""
+    return f"{self.scheme}://{self.host}{port}{self.prefix}{path}"
+
+  def _connect(self):
+    if self.scheme == "https":
+      return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+    return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+  @staticmethod
+  def _send(conn, path, headers, dest):
+    conn.request("GET", path, headers=headers)
+    res = conn.getresponse()
+    size = 0
+    if res.status == 200:
+      with open(dest, "wb") as f:
+        for chunk in iter(lambda: res.read(CHUNK_SIZE), b""):
+          f.write(chunk)
+          size += len(chunk)
+      # read(amt) returns what it got if the connection was closed early
+      if res.length:
+        raise http.client.IncompleteRead(b"", res.length)
+    else:
+      # bodies of other responses are not used, but must be read to reuse the connection
+      res.read()
+    return res.status, res.reason, {k.lower(): v for k, v in res.getheaders()}, size
+
+  async def get(self, path, dest, headers=None):
+    """
+    GET prefix + path, writing the body of a 200 response to dest; returns
+    (status, reason, headers, size of the body written)
+    """
+    async with self._semaphore:
+      loop = asyncio.get_running_loop()
+      reused = bool(self._idle)
+      conn = self._idle.pop() if reused else self._connect()
+      while True:
+        try:
+          status, reason, res_headers, size = await loop.run_in_executor(
+            self._executor, self._send, conn, self.prefix + path, headers or {}, dest)
+          break
+        except ConnectionError:
+          conn.close()
+          if not reused:
+            raise
+          # the server closed the idle connection: reconnect once (not a retry)
+          reused = False
+          conn = self._connect()
+        except Exception:
+          conn.close()
+          raise
+
+      if res_headers.get("connection", "").lower() == "close":
+        conn.close()
+      else:
+        self._idle.append(conn)
+      return status, reason, res_headers, size
+
+  def close(self):
+    for conn in self._idle:
+      conn.close()
+    self._idle = []
+    self._executor.shutdown()
+
+
+class HTTPCache:
+  """Response bodies on disk, with the validators to revalidate them"""
+
+  def __init__(self, directory):
+    self.directory = directory
+    os.makedirs(directory, exist_ok=True)
+
+  def _path(self, url):
+    return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+  def validators(self, url):
+    """Conditional request headers for a cached url (empty if not cached)"""
+    path = self._path(url)
+    if not os.path.exists(path + ".body") or not os.path.exists(path + ".json"):
+      return {}
+    with open(path + ".json") as f:
+      info = json.load(f)
+
+    headers = {}
+    if info.get("etag"):
+      headers["If-None-Match"] = info["etag"]
+    if info.get("last-modified"):
+      headers["If-Modified-Since"] = info["last-modified"]
+    return headers
+
+  def get(self, url, dest):
+    """Copy the cached body of url to dest"""
+    shutil.copyfile(self._path(url) + ".body", dest)
+
+  def put(self, url, headers, body):
+    """Cache the body (a file) if the response can be revalidated later"""
+    info = {"url": url,
+            "etag": headers.get("etag"),
+            "last-modified": headers.get("last-modified")}
+    if not info["etag"] and not info["last-modified"]:
+      return
+
+    path = self._path(url)
+    tmp = f"{path}.body.{os.getpid()}.tmp"
+    shutil.copyfile(body, tmp)
+    os.replace(tmp, path + ".body")
+    tmp = f"{path}.json.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+      json.dump(info, f)
+    os.replace(tmp, path + ".json")
+
+
+class Fetcher:
+  """Cached GET requests with retries over a connection pool"""
+
+  def __init__(self, pool, cache=None, retries=RETRIES, backoff=BACKOFF):
+    self.pool = pool
+    self.cache = cache
+    self.retries = retries
+    self.backoff = backoff
+    self.stats = {"downloaded": 0, "not modified": 0, "retries": 0, "bytes": 0}
+
+  async def _wait(self, attempt, retry_after=None):
+    self.stats["retries"] += 1
+    if retry_after is not None and retry_after.isdigit():
+      delay = int(retry_after)
+    else:
+      delay = self.backoff * 2 ** attempt
+      delay += random.uniform(0, self.backoff)
+    await asyncio.sleep(min(delay, MAX_BACKOFF))
+
+  async def get(self, path, dest):
+    """Write the body of prefix + path to dest, from the cache if it was not modified"""
+    url = self.pool.url(path)
+    headers = self.cache.validators(url) if self.cache else {}
+
+    for attempt in range(self.retries + 1):
+      last = attempt == self.retries
+      try:
+        status, reason, res_headers, size = await self.pool.get(path, dest, headers)
+      except (OSError, http.client.HTTPException) as e:
+        if last:
+          raise
+        print(f"WARNING: {e} ({url}); retrying", file=sys.stderr)
+        await self._wait(attempt)
+        continue
+
+      if status == 304 and headers:
+        self.stats["not modified"] += 1
+        self.cache.get(url, dest)
+        return
+      if status == 200:
+        self.stats["downloaded"] += 1
+        self.stats["bytes"] += size
+        if self.cache:
+          self.cache.put(url, res_headers, dest)
+        return
+      if status in RETRY_STATUS and not last:
+        print(f"WARNING: HTTP {status} {reason} ({url}); retrying", file=sys.stderr)
+        await self._wait(attempt, res_headers.get("retry-after"))
+        continue
+      raise HTTPError(url, status, reason)
+
+
+async def fetch_urn(fetcher, urn, outdir, licences=None):
+  """Download the files of a URN into <outdir>/<urn>; returns its licence"""
+  base = f"/score-sets/{quote(urn, safe=':')}"
+  tmp = os.path.join(outdir, f".{urn}.tmp")
+  shutil.rmtree(tmp, ignore_errors=True)
+  os.makedirs(tmp)
+
+  name, path = METADATA
+  await fetcher.get(base + path, os.path.join(tmp, name))
+  with open(os.path.join(tmp, name)) as f:
+    licence = json.load(f)['license']['shortName']
+  with open(os.path.join(tmp, "LICENCE.txt"), "w") as f:
+    f.write(licence)
+
+  if licences is None or licence in licences:
+    await asyncio.gather(*(fetcher.get(base + path, os.path.join(tmp, name))
+                           for name, path in DATA))
+
+  final = os.path.join(outdir, urn)
+  shutil.rmtree(final, ignore_errors=True)
+  os.rename(tmp, final)
+  return licence
+
+
+async def fetch_all(urns, outdir, base_url=BASE_URL, cache=None,
+                    concurrency=CONCURRENCY, retries=RETRIES, backoff=BACKOFF,
+                    licences=None):
+  """
+  Download all URNs into outdir; returns the Fetcher (for its stats) and a
+  dictionary of URN to licence, or to the exception if the download failed
+  """
+  os.makedirs(outdir, exist_ok=True)
+  pool = ConnectionPool(base_url, concurrency)
+  fetcher = Fetcher(pool, HTTPCache(cache) if cache else None, retries, backoff)
+
+  async def fetch(urn):
+    try:
+      return await fetch_urn(fetcher, urn, outdir, licences)
+    except Exception as e:
+      shutil.rmtree(os.path.join(outdir, f".{urn}.tmp"), ignore_errors=True)
+      return e
+
+  try:
+    results = await asyncio.gather(*(fetch(urn) for urn in urns))
+  finally:
+    pool.close()
+  return fetcher, dict(zip(urns, results))
+
+
+def read_urns(f):
+  with open(f) as fh:
+    urns = [line.strip() for line in fh if line.strip()]
+  # keep the first occurrence of each URN
+  return list(dict.fromkeys(urns))
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Download metadata, mappings and scores of MaveDB URNs')
+  parser.add_argument('--urns', type=str, required=True,
+                      help="path to file with MaveDB URNs (one per line)")
+  parser.add_argument('--outdir', type=str, default="mavedb",
+                      help="output directory, with one sub-directory per URN (default: 'mavedb')")
+  parser.add_argument('--cache', type=str,
+                      help="directory to cache responses in and revalidate them from (optional)")
+  parser.add_argument('--licences', type=str,
+                      help="comma-separated list of licences to download mappings and scores for (default: all)")
+  parser.add_argument('--base_url', type=str, default=BASE_URL,
+                      help=f"MaveDB API URL (default: {BASE_URL})")
+  parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                      help=f"maximum number of concurrent requests (default: {CONCURRENCY})")
+  parser.add_argument('--retries', type=int, default=RETRIES,
+                      help=f"maximum number of retries per request (default: {RETRIES})")
+  parser.add_argument('--backoff', type=float, default=BACKOFF,
+                      help=f"seconds to wait before the first retry, doubled for each retry (default: {BACKOFF})")
+  args = parser.parse_args()
+
+  urns = read_urns(args.urns)
+  licences = args.licences.split(",") if args.licences else None
+
+  print(f"Downloading {len(urns)} URNs from {args.base_url}...", flush=True)
+  start = time.time()
+  fetcher, results = asyncio.run(fetch_all(
+    urns, args.outdir, args.base_url, args.cache, args.concurrency,
+    args.retries, args.backoff, licences))
+
+  failed = {urn: e for urn, e in results.items() if isinstance(e, Exception)}
+  for urn, e in failed.items():
+    print(f"ERROR: failed to download {urn}: {e}", file=sys.stderr)
+
+  stats = fetcher.stats
+  print(f"Done in {time.time() - start:.1f}s: {len(urns) - len(failed)} URNs downloaded, "
+        f"{len(failed)} failed; {stats['downloaded']} responses downloaded "
+        f"({stats['bytes']} bytes), {stats['not modified']} not modified, "
+        f"{stats['retries']} retries", flush=True)
+
+  if urns and len(failed) == len(urns):
+    sys.exit(1)
@@ -0,0 +1,100 @@
+"""
+Lift-over variants associated with MaveDB scores
+"""
+
+import os
+import json
+import shutil
+import argparse
+
+import telemetry
+from mavedb.records import MISSING, RecordFile, is_record_file
+
+def main():
+  parser = argparse.ArgumentParser(
+             description='Lift-over variants associated with MaveDB scores')
+  parser.add_argument('--metadata', type=str,
+                      help="path to file with MaveDB metadata")
+  parser.add_argument('--mapped_variants', type=str,
+                      help="path to file with variants mapped to MaveDB scores")
+  parser.add_argument('--reference', type=str, default="hg38",
+                      help="genome (default: 'hg38')")
+  args = parser.parse_args()
+
+  reference = args.reference
+  mapped    = args.mapped_variants
+  metadata  = json.load(open(args.metadata))
+
+  if 'reference' in metadata['extraMetadata']:
+    genome = metadata['extraMetadata']['reference']
+  else:
+    genome = 'hg38'
+
+  if genome == reference:
+    # just rename file if variants are already mapped to reference genome
+    os.rename(mapped, f"liftover_{mapped}")
+  else:
+    with telemetry.stage("liftover") as stage:
+      rows = liftover_variants(mapped, genome, reference)
+      stage.rows_in = stage.rows_out = rows
+
+  return True
+
+def liftover_variants (mapped, genome, reference):
+  # only needed if coordinates need converting, so imported here to keep start-up fast
+  from pyliftover import LiftOver
+
+  # write file information with lifted-over coordinates to new file
+  print(f"Converting coordinates from {genome} to {reference}...")
+  chain = LiftOver(f"{genome}To{reference.capitalize()}.over.chain.gz")
+
+  if is_record_file(mapped):
+    return liftover_records(mapped, chain)
+
+  rows = 0
+  out = open(f"liftover_{mapped}", "w")
+  with open(mapped) as f:
+    header = f.readline()
+    out.write(header)
+
+    for line in f:
+      l = line.split("\t")
+      chr, start, end = l[0:3]
+
+      conv = chain.convert_coordinate("chr" + chr, int(start))
+      if len(conv) > 1:
+        raise Exception("multiple coordinates returned")
+      new_chr, new_start, strand, size = conv[0]
+
+      conv = chain.convert_coordinate("chr" + chr, int(end))
+      if len(conv) > 1:
+        raise Exception("multiple coordinates returned")
+      new_chr, new_end, strand, size = conv[0]
+
+      l[0:3] = new_chr.replace("chr", ""), str(new_start), str(new_end)
+      out.write('\t'.join(l))
+      rows += 1
+  out.close()
+  return rows
+
+def convert_coordinate (chain, chr, pos):
+  conv = chain.convert_coordinate("chr" + chr, pos)
+  if len(conv) > 1:
+    raise Exception("multiple coordinates returned")
+  return conv[0]
+
+def liftover_records (mapped, chain):
+  """Lift-over a copy of a record file, updating coordinates in place"""
+  output = f"liftover_{mapped}"
+  shutil.copyfile(mapped, output)
+
+  rows = 0
+  with RecordFile(output, writable=True) as records:
+    for offset, chr, start, end, payload in records:
+      if MISSING in (start, end):
+        raise ValueError(f"variant without coordinates in {mapped}")
+      new_chr, new_start, strand, size = convert_coordinate(chain, chr, start)
+      new_chr, new_end, strand, size = convert_coordinate(chain, chr, end)
+      records.set_coordinates(offset, new_chr.replace("chr", ""), new_start, new_end)
+      rows += 1
+  return rows
@@ -0,0 +1,202 @@
+"""
+Content-hash manifests of MaveDB URNs for incremental releases
+
+A manifest records the hashes of the scores, mappings and metadata of a URN
+(and of the Ensembl registry file, if any), the version of the mapping code
+(a hash of the mavedb package), the Ensembl API and VEP versions used by
+Variant Recoder and the parameters affecting its output.
+Results of a URN are kept in a store directory (<store>/<urn>/) next to their
+manifest, so a URN with the same hash in a later release reuses its previous
+result instead of being mapped (and lifted-over) again.
+
+Usage:
+  manifest.py check --store store/ --urn urn:mavedb:00000001-a-1 \\
+    --scores scores.csv --mappings mappings.json --metadata metadata.json \\
+    --ensembl $ENSEMBL_ROOT_DIR --param round=4
+
+  Writes manifest.json and prints 'reuse <result>' if the store has a result
+  for the same hash or 'rebuild' otherwise.
+
+  manifest.py store --store store/ --urn urn:mavedb:00000001-a-1 \\
+    --manifest manifest.json --result liftover_map_urn:mavedb:00000001-a-1.tsv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+
+from mavedb.records import RecordFile, is_record_file
+
+MANIFEST = "manifest.json"
+CHUNK_SIZE = 1024 * 1024
+
+# files (relative to the Ensembl root directory) with the versions of the
+# Ensembl code run by Variant Recoder, and patterns matching the version
+ENSEMBL_VERSIONS = {
+  'ensembl_api' : ("ensembl/modules/Bio/EnsEMBL/ApiVersion.pm",
+                   re.compile(r"\$API_VERSION\s*=\s*['\"]?(\d+)")),
+  'vep'         : ("ensembl-vep/modules/Bio/EnsEMBL/VEP/Constants.pm",
+                   re.compile(r"\$VEP_VERSION\s*=\s*['\"]?(\d+)")),
+}
+
+
+def file_hash (f):
+  """SHA-256 of the contents of a file"""
+  sha = hashlib.sha256()
+  with open(f, 'rb') as fh:
+    for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+      sha.update(chunk)
+  return sha.hexdigest()
+
+
+def code_version ():
+  """
+  SHA-256 of the source of the mavedb package, to invalidate results when
+  its code changes (any module, as they import each other)
+  """
+  sha = hashlib.sha256()
+  package = os.path.dirname(os.path.abspath(__file__))
+  for name in sorted(os.listdir(package)):
+    if name.endswith(".py"):
+      sha.update(name.encode() + b"\0")
+      sha.update(file_hash(os.path.join(package, name)).encode() + b"\0")
+  return sha.hexdigest()
+
+
+def ensembl_versions (root):
+  """Versions of the Ensembl code in root (see ENSEMBL_VERSIONS), as {name: version}"""
+  versions = {}
+  for name, (path, pattern) in ENSEMBL_VERSIONS.items():
+    f = os.path.join(root, path)
+    try:
+      with open(f) as fh:
+        match = pattern.search(fh.read())
+    except OSError as e:
+      raise Exception(f"cannot read the {name} version from {f}: {e}")
+    if match is None:
+      raise Exception(f"no {name} version found in {f}")
+    versions[name] = match.group(1)
+  return versions
+
+
+def create_manifest (urn, inputs, params):
+  """
+  Manifest of a URN from its input files (name -> path) and parameters
+  (name -> value); the hash covers inputs, parameters and code version.
+  """
+  manifest = {
+    'urn'    : urn,
+    'code'   : code_version(),
+    'inputs' : {name: file_hash(path) for name, path in sorted(inputs.items())},
+    'params' : dict(sorted(params.items())),
+  }
+  manifest['hash'] = hashlib.sha256(
+    json.dumps(manifest, sort_keys=True).encode()).hexdigest()
+  return manifest
+
+
+def read_manifest (f):
+  if not os.path.exists(f):
+    return None
+  with open(f) as fh:
+    return json.load(fh)
+
+
+def stored_result (store, manifest):
+  """Path to the stored result of a URN with the same hash (None if not stored)"""
+  directory = os.path.join(store, manifest['urn'])
+  previous = read_manifest(os.path.join(directory, MANIFEST))
+  if previous is None or previous.get('hash') != manifest['hash']:
+    return None
+
+  result = os.path.join(directory, previous['result'])
+  return result if os.path.exists(result) else None
+
+
+def store_result (store, manifest, result):
+  """Replace the stored result and manifest of a URN"""
+  directory = os.path.join(store, manifest['urn'])
+  os.makedirs(directory, exist_ok=True)
+
+  # remove the previous manifest first so that a partial copy is never reused
+  previous = os.path.join(directory, MANIFEST)
+  if os.path.exists(previous):
+    os.remove(previous)
+  for f in os.listdir(directory):
+    os.remove(os.path.join(directory, f))
+
+  name = os.path.basename(result)
+  shutil.copyfile(result, os.path.join(directory, name))
+
+  manifest = dict(manifest, result=name)
+  tmp = previous + ".tmp"
+  with open(tmp, 'w') as fh:
+    json.dump(manifest, fh, indent=2)
+  os.replace(tmp, previous)
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Check and store results of MaveDB URNs by content hash')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  check = subparsers.add_parser('check',
+    help="write manifest.json and check if the store has a result for the same hash")
+  check.add_argument('--scores', type=str, required=True,
+                     help="path to file with MaveDB URN scores")
+  check.add_argument('--mappings', type=str, required=True,
+                     help="path to file with MaveDB URN mappings")
+  check.add_argument('--metadata', type=str, required=True,
+                     help="path to file with MaveDB URN metadata")
+  check.add_argument('--ensembl', type=str, required=True,
+                     help="path to Ensembl root directory, to read the versions of its code")
+  check.add_argument('--registry', type=str,
+                     help="path to Ensembl registry file (optional)")
+  check.add_argument('--param', type=str, action='append', default=[],
+                     help="parameter affecting the output, as name=value (can be used multiple times)")
+
+  store = subparsers.add_parser('store',
+    help="store the result of a URN with its manifest")
+  store.add_argument('--manifest', type=str, required=True,
+                     help="path to manifest.json written by 'check'")
+  store.add_argument('--result', type=str, required=True,
+                     help="path to result file of the URN")
+
+  for subparser in (check, store):
+    subparser.add_argument('--store', type=str, required=True,
+                           help="path to directory with results of previous runs")
+    subparser.add_argument('--urn', type=str, required=True, help="MaveDB URN")
+  args = parser.parse_args()
+
+  if args.command == 'check':
+    params = dict(p.split("=", 1) for p in args.param)
+    params.update(ensembl_versions(args.ensembl))
+    inputs = {'scores': args.scores, 'mappings': args.mappings,
+              'metadata': args.metadata}
+    if args.registry is not None:
+      inputs['registry'] = args.registry
+    manifest = create_manifest(args.urn, inputs, params)
+    with open(MANIFEST, 'w') as fh:
+      json.dump(manifest, fh, indent=2)
+
+    result = stored_result(args.store, manifest)
+    print(f"reuse {os.path.abspath(result)}" if result else "rebuild")
+  elif args.command == 'store':
+    manifest = read_manifest(args.manifest)
+    if manifest['urn'] != args.urn:
+      raise Exception(f"manifest of {manifest['urn']} does not match URN {args.urn}")
+
+    # do not keep empty results, as they may be due to transient errors
+    if is_record_file(args.result):
+      with RecordFile(args.result) as records:
+        lines = 1 + sum(1 for _ in zip(records, range(1)))  # header plus first record
+    else:
+      with open(args.result) as fh:
+        lines = sum(1 for line, _ in zip(fh, range(2)) if line.strip())
+    if lines < 2:
+      print(f"WARNING: not storing result of {args.urn} without variants")
+      return
+    store_result(args.store, manifest, args.result)
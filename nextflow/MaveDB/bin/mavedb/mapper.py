@@ -0,0 +1,331 @@
+"""
+Map MaveDB scores to variants
+
+Steps shared by the mappers of the MaveDB API (mapping.py) and data dump
+(mapping_fromfiles.py): parsing arguments, loading scores and Variant Recoder
+output, mapping scores to variants (in shards of rows with --workers) and
+writing the output. The layout of the mappings of each source is described by
+a MappingSource.
+"""
+
+import csv
+import json
+import warnings
+import argparse
+import sys
+from collections import OrderedDict
+
+import telemetry
+from mavedb.records import write_variant_records
+from mavedb.utils import (customshowwarning, get_chromosome, match_information,
+                          parse_vr_output, round_float_columns, variant_match)
+
+
+class MappingSource:
+  """Layout of the mappings and metadata of a MaveDB source"""
+
+  # strip whitespace around score headers and values
+  strip_scores = False
+
+  def load_mappings (self, mappings, urn):
+    """Dictionary of MaveDB ID to mapping, from the loaded mappings file"""
+    raise NotImplementedError
+
+  def extra (self, metadata):
+    """Metadata columns added to every mapped variant"""
+    raise NotImplementedError
+
+  def alleles (self, mapping):
+    """Mapped alleles of a mapping (the members of phased variants)"""
+    raise NotImplementedError
+
+  def location (self, allele):
+    """Location of a mapped allele as (0-based start, end, ref, alt)"""
+    raise NotImplementedError
+
+
+def parse_args ():
+  parser = argparse.ArgumentParser(
+    description='Output file with MaveDB scores mapped to variants')
+  parser.add_argument('--vr', type=str,
+                      help="path to file containg Variant Recoder output with 'vcf_string' enabled (optional)")
+  parser.add_argument('--vr_cache', type=str,
+                      help="path to Variant Recoder cache to look up HGVSp in, after those in --vr (optional; see vr_cache.py)")
+  parser.add_argument('--vr_namespace', type=str,
+                      help="release/assembly namespace of the Variant Recoder cache, e.g. '114_GRCh38'")
+  parser.add_argument('--urn', type=str, help="MaveDB URN")
+  parser.add_argument('--scores', type=str,
+                      help="path to file with MaveDB URN scores")
+  parser.add_argument('--mappings', type=str,
+                      help="path to file with MaveDB URN mappings")
+  parser.add_argument('--metadata', type=str,
+                      help="path to file with MaveDB URN metadata")
+  parser.add_argument('-o', '--output', type=str,
+                      help="path to output file")
+  parser.add_argument('--round', type=int,
+                      help="Number of decimal places for rounding values (default: not used)")
+  parser.add_argument('--format', type=str, choices=['tsv', 'records'], default='tsv',
+                      help="output format: 'tsv' or binary 'records' for liftover and merging (default: 'tsv'; see records.py)")
+  parser.add_argument('--workers', type=int, default=1,
+                      help="number of processes to map large score sets with, in shards of contiguous rows (default: 1)")
+  parser.add_argument('--min_shard_rows', type=int, default=10000,
+                      help="minimum number of scores per shard (default: 10000)")
+  return parser.parse_args()
+
+
+def main (source):
+  args = parse_args()
+  warnings.showwarning = customshowwarning
+
+  # Load the scores (CSV), mappings (JSON), and metadata (JSON) files
+  print("Loading MaveDB data...", flush=True)
+  with telemetry.stage("load scores") as stage:
+    scores = load_scores(args.scores, source.strip_scores)
+    stage.rows_in = len(scores)
+
+  # Check if the scores file is empty, if so, print an error and exit - don't process this URN
+  if not scores:
+    print(f"ERROR: The scores file '{args.scores}' for URN '{args.urn}' is empty. Exiting.")
+    sys.exit(1)
+
+  # Throw warning if scores file has very few entries, as this will explain lack of mappings
+  if len(scores) < 10:
+    print(f"WARNING: The scores file '{args.scores}' for URN '{args.urn}' contains {len(scores)} row(s).")
+
+  with telemetry.stage("load mappings") as stage:
+    with open(args.mappings) as f:
+      mappings = source.load_mappings(json.load(f), args.urn)
+    with open(args.metadata) as f:
+      metadata = json.load(f)
+    stage.rows_in = len(mappings)
+
+  # If a Variant Recoder output file is provided, load it; otherwise, set matches to None
+  if args.vr_cache is not None:
+    # imported here: only needed with a Variant Recoder cache
+    from mavedb.vr_cache import VRCache
+    # results of this run are not merged into the cache yet
+    results = {}
+    if args.vr is not None:
+      with open(args.vr) as f:
+        results, _ = parse_vr_output(json.load(f))
+    hgvsp2vars = VRCache(args.vr_cache, args.vr_namespace, readonly=True).matches(results)
+
+    # like Variant Recoder output with only warnings (see load_vr_output)
+    if not any(hgvs in hgvsp2vars for hgvs in score_hgvs(scores, mappings, source)):
+      print(f"Error: The Variant Recoder cache has no variants for any HGVSp of URN '{args.urn}'. Variant Recoder was not able to recode them. Exiting.")
+      sys.exit(1)
+  elif args.vr is not None:
+    with telemetry.stage("load Variant Recoder output") as stage:
+      hgvsp2vars = load_vr_output(args.vr)
+      stage.rows_in = len(hgvsp2vars)
+  else:
+    hgvsp2vars = None
+
+  # Create the mapping between variant coordinates and MaveDB scores
+  print("Preparing mappings between variants and MaveDB scores...", flush=True)
+  extra = source.extra(metadata)
+  map_rows = lambda rows: map_scores_to_variants(rows, mappings, extra, source, hgvsp2vars, args.round)
+  if args.workers > 1:
+    # imported here: only needed for sharded mapping
+    from mavedb.shards import map_sharded
+    if hgvsp2vars is None:
+      # look up the chromosome once, instead of in every shard
+      hgvs = next(score_hgvs(scores, mappings, source), None)
+      if hgvs is not None:
+        get_chromosome(hgvs)
+    with telemetry.stage("map scores to variants") as stage:
+      rows = map_sharded(map_rows, scores, args.output, args.format,
+                         args.workers, args.min_shard_rows)
+      stage.rows_in = len(scores)
+      stage.rows_out = rows
+  else:
+    with telemetry.stage("map scores to variants") as stage:
+      map = map_rows(scores)
+      rows = len(map)
+      stage.rows_in = len(scores)
+      stage.rows_out = rows
+    if map:
+      with telemetry.stage("write output") as stage:
+        write_variant_mapping(args.output, map, args.format)
+        stage.rows_out = rows
+
+  if not rows:
+    print(f"ERROR: no variants were mapped to the scores of URN '{args.urn}'. Exiting.")
+    sys.exit(1)
+
+  print("Done: MaveDB score mapped to variants!", flush=True)
+  return True
+
+def load_vr_output (f):
+  """
+  Load Variant Recoder output.
+
+  Parses the JSON data with parse_vr_output(), skipping any entries that couldn't be parsed,
+  and builds an ordered dictionary with the details of each variant. Returns a dictionary
+  mapping HGVS strings to lists of variants (HGVS without variants are left out).
+  """
+  data = json.load(open(f))
+
+  # Check if file is full of warnings - means that variant recoder couldn't recode
+  if any("warnings" in item for item in data):
+    print("WARNING: The Variant Recoder output file contains warnings. This may indicate that the Variant Recoder was unable to recode some variants.")
+
+    if all("warnings" in item for item in data):
+      print(f"Error: The Variant Recoder output file contains only 'Unable to parse' warnings. It was not able to parse the variants and recode them. Exiting.")
+      sys.exit(1)
+
+  results, _ = parse_vr_output(data)
+  return {hgvs: [variant_match(hgvs, variant) for variant in variants]
+          for hgvs, variants in results.items() if variants}
+
+def load_scores (f, strip=False):
+  """Load MaveDB scores from a CSV file into a list of dictionaries."""
+  scores = []
+  with open(f) as csvfile:
+    reader = csv.DictReader(csvfile)
+    if not strip:
+      return list(reader)
+
+    # Strip whitespace from each header name -- I think only necessary due to the csv viewer adding spacing and then this was cached in a nf run. Consider removing.
+    reader.fieldnames = [field.strip() for field in reader.fieldnames]
+    for row in reader:
+      # Strip whitespace from each value if it is a string
+      clean_row = { key: value.strip() if isinstance(value, str) else value for key, value in row.items() } # Same as above
+      scores.append(clean_row)
+  return scores
+
+def score_metadata (metadata):
+  """URN, publish date, RefSeq and PubMed IDs of the scores of a URN"""
+  refseq = None
+  if len(metadata['targetGenes']) > 1:
+    raise Exception("Multiple targets are not currently supported")
+  else:
+    for item in metadata['targetGenes'][0]['externalIdentifiers']:
+      if item['identifier']['dbName'] == 'RefSeq':
+        refseq = item['identifier']['identifier']
+
+  pubmed_list = []
+  for pub in metadata['primaryPublicationIdentifiers']:
+    if pub['dbName'] == 'PubMed':
+      pubmed_list.append(pub['identifier'])
+  pubmed = ",".join(pubmed_list)
+
+  return {
+    'urn'          : metadata['urn'],
+    'publish_date' : metadata['experiment']['publishedDate'],
+    'refseq'       : refseq,
+    'pubmed'       : pubmed,
+  }
+
+def join_information (hgvs, location, row, extra):
+  """
+  Join variant and MaveDB score information for a given HGVS.
+
+  Builds an ordered dictionary with the variant location (with a 0-based
+  start) merged with extra metadata and the score row.
+  """
+  start, end, ref, alt = location
+  mapped = OrderedDict([
+    ("chr",   get_chromosome(hgvs)),
+    ("start", start + 1),           # Convert 0-based to 1-based indexing.
+    ("end",   end),
+    ("ref",   ref),
+    ("alt",   alt),
+    ("hgvs",  hgvs)
+  ])
+
+  # Merge extra metadata and the current score row.
+  mapped.update(extra)
+  mapped.update(row)
+  return [mapped]
+
+def map_variant_to_MaveDB_scores (matches, allele, row, extra, source):
+  """
+  Map variant information to a MaveDB score entry.
+
+  Extracts the HGVS expression from the mapped allele (using the first expression value).
+  If no Variant Recoder matches are provided (matches is None), it joins the variant
+  location of the allele directly. Otherwise, it uses match_information to match the HGVS.
+  """
+  hgvs = allele['expressions'][0]['value']
+  if matches is None:
+    # HGVS genomic coordinates
+    return join_information(hgvs, source.location(allele), row, extra)
+  else:
+    # HGVS protein matches
+    return match_information(hgvs, matches, row, extra)
+
+def skip_score (row):
+  """Whether a score row is not mapped"""
+  # Skip rows with special HGVS values (e.g. synonymous, wild-type)
+  if row['hgvs_pro'] in ('_sy', '_wt', 'p.=') or row['hgvs_nt'] in ('_sy', '_wt'):
+    return True
+
+  # Skip rows with missing score values
+  return row['score'] == "NA" or row['score'] is None
+
+def score_hgvs (scores, mappings, source):
+  """HGVS of the mapped alleles of the scores, in order"""
+  for row in scores:
+    mapping = mappings.get(row['accession'])
+    if skip_score(row) or mapping is None:
+      continue
+    for allele in source.alleles(mapping):
+      yield allele['expressions'][0]['value']
+
+def map_scores_to_variants (scores, mappings, extra, source, matches=None, round=None):
+  """
+  Map MaveDB scores to variant coordinates.
+
+  For each score row:
+    - Skip rows with special HGVS values (e.g. synonymous or wild-type) or missing scores.
+    - Retrieve the corresponding mapping entry by accession.
+    - Check for an URN mismatch between the score and mapping.
+    - Round numeric values if requested.
+    - Map each allele of the mapping (the members of phased variants).
+
+  Extra metadata (see MappingSource.extra) is merged into every output record.
+  """
+  out = []
+  for row in scores:
+    if skip_score(row):
+      continue
+
+    mapping = mappings.get(row['accession'])
+    if mapping is None:
+      warnings.warn(row['accession'] + " not in mappings file")
+      continue
+
+    # Check for URN mismatch between the score row and the mapping entry
+    if 'mavedb_id' in mapping.keys() and row['accession'] != mapping['mavedb_id']:
+      warnings.warn("URN mismatch: trying to match " + row['accession'] + " from scores file with " + mapping['mavedb_id'] + " from mappings file")
+      continue
+
+    row = round_float_columns(row, round)
+    for allele in source.alleles(mapping):
+      out += map_variant_to_MaveDB_scores(matches, allele, row, extra, source)
+  return out
+
+def write_variant_mapping (f, map, format='tsv'):
+  """
+  Write the final mapping between variants and MaveDB scores to an output TSV file.
+
+  Constructs a header from the keys of the first output record (excluding unwanted fields),
+  writes the header (with any 'hgvs_' prefixes removed), and then writes each record.
+  With format 'records', writes the same columns in the binary record format instead.
+  """
+  if format == 'records':
+    return write_variant_records(f, map)
+
+  with open(f, 'w') as csvfile:
+    header = list(map[0].keys())
+    header = [h for h in header if h not in ['HGVSp', 'index']]
+    writer = csv.DictWriter(csvfile, delimiter="\t", fieldnames=header,
+                            extrasaction='ignore')
+    # prepare new header
+    new_header = [h.replace('hgvs_', '') for h in header]
+    header = OrderedDict(zip(header, new_header))
+
+    writer.writerow(header)
+    writer.writerows(map)
+  return True
@@ -0,0 +1,40 @@
+"""
+Map MaveDB scores to variants, using the mappings returned by the MaveDB API
+"""
+
+from mavedb import mapper
+
+
+class APIMappings (mapper.MappingSource):
+  """Mappings returned by the MaveDB API for the scores of a URN"""
+
+  def load_mappings (self, mappings, urn):
+    overhead = mappings[0]['id'] - 1
+    mavedb_ids = [urn + "#" + str(i['id'] - overhead) for i in mappings ]
+    print(mavedb_ids)
+
+    # first mapping of each MaveDB ID
+    by_id = {}
+    for mavedb_id, mapping in zip(mavedb_ids, mappings):
+      by_id.setdefault(mavedb_id, mapping)
+    return by_id
+
+  def extra (self, metadata):
+    return mapper.score_metadata(metadata)
+
+  def alleles (self, mapping):
+    mapped_info = mapping['postMapped']
+    if mapped_info['type'] == "Haplotype":
+      return mapped_info['members']
+    return [mapped_info]
+
+  def location (self, allele):
+    var = allele['variation']
+    return (var["location"]["interval"]["start"]["value"],
+            var["location"]["interval"]["end"]["value"],
+            allele['vrs_ref_allele_seq'],
+            var["state"]["sequence"])
+
+
+def main():
+  return mapper.main(APIMappings())
@@ -0,0 +1,63 @@
+"""
+Map MaveDB scores to variants, using the mappings from the MaveDB data dump
+"""
+
+import warnings
+
+from mavedb import mapper
+
+
+class DumpMappings (mapper.MappingSource):
+  """Mappings of the scores of a URN in the MaveDB data dump"""
+
+  # only necessary due to the csv viewer adding spacing and then this was cached in a nf run. Consider removing.
+  strip_scores = True
+
+  def load_mappings (self, mappings, urn):
+    # Pre-build a dictionary mapping accession IDs to mapping records
+    # This makes lookups robust and order-independent
+    return {mapping["mavedb_id"]: mapping for mapping in mappings["mapped_scores"]}
+
+  def extra (self, metadata):
+    """URN, publish date, RefSeq, PubMed IDs, DOIs and URLs of the publications"""
+    extra = mapper.score_metadata(metadata)
+    publications = metadata['primaryPublicationIdentifiers']
+    for pub in publications:
+      if pub['dbName'] != 'PubMed':
+        warnings.warn("No PubMed ID found in metadata")
+
+    doi_list = []
+    for pub in publications:
+      if pub['doi']:
+        doi_list.append(pub['doi'])
+      else:
+        warnings.warn("No doi found in metadata")
+
+    url_list = []
+    for pub in publications:
+      if pub['url']:
+        url_list.append(pub['url'])
+      else:
+        warnings.warn("No URL found in metadata")
+
+    extra['doi'] = ",".join(doi_list)
+    extra['url'] = ",".join(url_list)
+    return extra
+
+  def alleles (self, mapping):
+    # Process phased variants if multiple members exist; otherwise, process the mapping directly
+    mapped_info = mapping['post_mapped']
+    if mapped_info.get("members", []):
+      return mapped_info['members']
+    return [mapped_info]
+
+  def location (self, allele):
+    # The reference allele is the first element of 'extensions'
+    return (allele["location"]["start"],
+            allele["location"]["end"],
+            allele["extensions"][0]["value"],
+            allele["state"]["sequence"])
+
+
+def main():
+  return mapper.main(DumpMappings())
@@ -0,0 +1,93 @@
+"""
+Merge mapped variants of all MaveDB URNs into a single TSV file
+
+Takes the per-URN outputs in the binary record format (see records.py) and
+writes the same combined TSV as the pandas-based concatenation (process
+concatenate_files), by running the same pandas code on each file converted
+back to TSV in memory: columns are the union of the columns of all files (in
+order of appearance, duplicate names renamed by pandas), standardised
+('p-value' renamed to 'pvalue', all lowercase), missing columns are left
+empty and values are written as pandas reads and writes them. Empty files
+(fallbacks for URNs without variants) are skipped, and TSV files are
+accepted as well.
+
+Usage:
+  merge_variants.py --output combined.tsv map_*.rec liftover_map_*.rec
+"""
+
+import argparse
+import csv
+import io
+import os
+
+import telemetry
+from mavedb.records import RecordFile, is_record_file
+
+
+def standardise_columns (df):
+  df = df.rename(columns={'p-value': 'pvalue'})
+  df.columns = df.columns.str.lower()
+  return df
+
+
+def read_table (f, nrows=None):
+  """DataFrame of a record or TSV file, read with pandas.read_csv"""
+  # imported here: slow to import, and only needed to merge
+  import pandas
+
+  if is_record_file(f):
+    with RecordFile(f) as records:
+      header = io.StringIO()
+      csv.writer(header, delimiter="\t", lineterminator="\n").writerow(records.columns)
+      lines = [] if nrows == 0 else records.lines()
+      f = io.BytesIO(header.getvalue().encode() + b"".join(lines))
+  return pandas.read_csv(f, delimiter="\t", nrows=nrows)
+
+
+def merge_variants (files, output, stage=None):
+  """Write all variants of files to output; returns the number of variants"""
+  # imported here: see read_table
+  import pandas
+
+  # concatenate header of all files
+  header = None
+  tables = []
+  for f in files:
+    try:
+      content = standardise_columns(read_table(f, nrows=0))
+    except pandas.errors.EmptyDataError:
+      continue
+    tables.append(f)
+    header = content if header is None else pandas.concat([header, content], axis=0,
+                                                          ignore_index=True)
+
+  # merge data and append to file (one file at a time)
+  rows = 0
+  # an empty output if all files are empty
+  open(output, 'w').close()
+  for i, f in enumerate(tables):
+    print("Processing file:", f)
+    if stage is not None:
+      stage.count(bytes_read=os.path.getsize(f))
+
+    content = standardise_columns(read_table(f))
+    out = pandas.concat([header, content], axis=0, ignore_index=True)
+    out.to_csv(output, sep="\t", mode="a", index=False, header=i == 0)
+    rows += len(content)
+  return rows
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Merge mapped variants of MaveDB URNs into a single TSV file')
+  parser.add_argument('files', type=str, nargs='*',
+                      help="paths to files with mapped variants (records or TSV)")
+  parser.add_argument('-o', '--output', type=str, default="combined.tsv",
+                      help="path to output file (default: 'combined.tsv')")
+  args = parser.parse_args()
+
+  print(f"Found {len(args.files)} files to merge")
+  with telemetry.stage("merge variants") as stage:
+    rows = merge_variants(args.files, args.output, stage)
+    stage.rows_out = rows
+  print(f"Wrote {rows} variants to {args.output}")
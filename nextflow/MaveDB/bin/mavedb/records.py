@@ -0,0 +1,141 @@
+"""
+Binary record format for variants passed between the MaveDB pipeline steps
+
+The mappers can write their output as records instead of TSV, so that
+liftover does not parse and re-encode text: it memory-maps a copy of the file
+and rewrites coordinates in place. Records are only converted to text by the
+merge step (see merge.py).
+
+Layout (little-endian):
+  MAGIC
+  u32 length + JSON header: {"columns": [...]} (starting with chr, start, end)
+  records: u32 payload length, chr (64 bytes, NUL-padded), i64 start, i64 end,
+           payload (UTF-8 TSV of the other columns, quoted as in the TSV output)
+
+Empty coordinates are stored as MISSING.
+"""
+
+import csv
+import io
+import json
+import mmap
+import struct
+
+MAGIC = b"MAVEDB-RECORDS-1\n"
+LENGTH = struct.Struct("<I")
+RECORD = struct.Struct("<I64sqq")
+MISSING = -2 ** 63
+COORDINATES = ["chr", "start", "end"]
+
+
+def is_record_file (f):
+  with open(f, 'rb') as fh:
+    return fh.read(len(MAGIC)) == MAGIC
+
+
+def _coordinate (value):
+  return MISSING if value == "" else int(value)
+
+
+def _text (value):
+  return "" if value == MISSING else str(value)
+
+
+class RecordWriter:
+  """
+  Write rows (lists of values, as formatted by the csv module) as records;
+  without header, writes records to append to a file with the same columns
+  """
+
+  def __init__(self, f, columns, header=True):
+    if list(columns[:3]) != COORDINATES:
+      raise Exception(f"columns must start with {', '.join(COORDINATES)}: {columns}")
+    self.columns = list(columns)
+    self._fh = open(f, 'wb')
+    self._buffer = io.StringIO()
+    self._csv = csv.writer(self._buffer, delimiter="\t", lineterminator="")
+
+    if header:
+      header = json.dumps({"columns": self.columns}).encode()
+      self._fh.write(MAGIC + LENGTH.pack(len(header)) + header)
+    self.rows = 0
+
+  def write (self, row):
+    # format values exactly like csv.DictWriter does for the TSV output
+    self._buffer.seek(0)
+    self._buffer.truncate()
+    self._csv.writerow(row)
+    chr, start, end, payload = (self._buffer.getvalue() + "\t").split("\t", 3)
+    payload = payload[:-1].encode()
+
+    chr = chr.encode()
+    if len(chr) > 64:
+      raise Exception(f"chromosome name longer than 64 bytes: {chr}")
+    self._fh.write(RECORD.pack(len(payload), chr, _coordinate(start), _coordinate(end)))
+    self._fh.write(payload)
+    self.rows += 1
+
+  def close (self):
+    self._fh.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+class RecordFile:
+  """Memory-mapped record file; coordinates can be updated in place if writable"""
+
+  def __init__(self, f, writable=False):
+    self._fh = open(f, 'r+b' if writable else 'rb')
+    self._mm = mmap.mmap(self._fh.fileno(), 0,
+                         access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+    if self._mm[:len(MAGIC)] != MAGIC:
+      raise Exception(f"not a MaveDB record file: {f}")
+
+    size, = LENGTH.unpack_from(self._mm, len(MAGIC))
+    offset = len(MAGIC) + LENGTH.size
+    self.columns = json.loads(self._mm[offset:offset + size])["columns"]
+    self._first = offset + size
+
+  def __iter__(self):
+    """Yield (offset, chr, start, end, payload) of each record"""
+    mm, offset, end = self._mm, self._first, len(self._mm)
+    while offset < end:
+      length, chr, start, stop = RECORD.unpack_from(mm, offset)
+      data = offset + RECORD.size
+      yield offset, chr.rstrip(b"\0").decode(), start, stop, mm[data:data + length]
+      offset = data + length
+
+  def set_coordinates (self, offset, chr, start, end):
+    RECORD.pack_into(self._mm, offset, RECORD.unpack_from(self._mm, offset)[0],
+                     chr.encode(), start, end)
+
+  def lines (self):
+    """Yield each record as a TSV line (bytes, with newline)"""
+    for offset, chr, start, end, payload in self:
+      yield b"%s\t%s\t%s\t%s\n" % (chr.encode(), _text(start).encode(),
+                                   _text(end).encode(), payload)
+
+  def close (self):
+    self._mm.close()
+    self._fh.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def write_variant_records (f, map):
+  """Write mapping between MaveDB scores and variants as records (see write_variant_mapping)"""
+  header = list(map[0].keys())
+  header = [h for h in header if h not in ['HGVSp', 'index']]
+
+  with RecordWriter(f, [h.replace('hgvs_', '') for h in header]) as writer:
+    for row in map:
+      writer.write([row.get(h, "") for h in header])
+  return True
@@ -0,0 +1,126 @@
+"""
+Map the scores of a single MaveDB URN in parallel, in contiguous shards
+
+The score rows are split into contiguous ranges, each mapped by a forked
+worker process that shares the scores, mappings and Variant Recoder matches
+of its parent (copy-on-write, without pickling them). Shard outputs are
+written with the columns of the first non-empty shard and concatenated in
+row order, so the output is the same as mapping all rows in a single process.
+"""
+
+import csv
+import multiprocessing
+import os
+import shutil
+import traceback
+from collections import OrderedDict
+
+from mavedb.records import RecordWriter
+
+# scores per shard below which rows are mapped in a single process
+MIN_SHARD_ROWS = 10000
+
+
+def output_columns (map):
+  """Columns written by write_variant_mapping(), before renaming"""
+  return [h for h in map[0].keys() if h not in ['HGVSp', 'index']]
+
+
+def write_header (f, header, format):
+  new_header = [h.replace('hgvs_', '') for h in header]
+  if format == 'records':
+    RecordWriter(f, new_header).close()
+  else:
+    with open(f, 'w') as csvfile:
+      writer = csv.DictWriter(csvfile, delimiter="\t", fieldnames=header,
+                              extrasaction='ignore')
+      writer.writerow(OrderedDict(zip(header, new_header)))
+
+
+def write_rows (f, map, header, format):
+  """Write rows like write_variant_mapping(), without header"""
+  if format == 'records':
+    new_header = [h.replace('hgvs_', '') for h in header]
+    with RecordWriter(f, new_header, header=False) as writer:
+      for row in map:
+        writer.write([row.get(h, "") for h in header])
+  else:
+    with open(f, 'w') as csvfile:
+      writer = csv.DictWriter(csvfile, delimiter="\t", fieldnames=header,
+                              extrasaction='ignore')
+      writer.writerows(map)
+
+
+def _worker (conn, map_rows, scores, output, format):
+  try:
+    map = map_rows(scores)
+    conn.send(output_columns(map) if map else None)
+
+    header = conn.recv()
+    if map:
+      write_rows(output, map, header, format)
+    conn.send(len(map))
+  except Exception:
+    conn.send(traceback.format_exc())
+  finally:
+    conn.close()
+
+
+def _receive (conn):
+  message = conn.recv()
+  if isinstance(message, str):
+    raise Exception(f"mapping shard failed:\n{message}")
+  return message
+
+
+def map_sharded (map_rows, scores, output, format='tsv', workers=1,
+                 min_rows=MIN_SHARD_ROWS):
+  """
+  Map scores with map_rows(rows) (returning the mapped variants of rows) in up
+  to workers processes and write them to output like write_variant_mapping();
+  returns the number of variants written (output is not written if 0)
+  """
+  shards = max(1, min(workers, len(scores) // max(1, min_rows)))
+  bounds = [len(scores) * i // shards for i in range(shards + 1)]
+  print(f"Mapping {len(scores)} scores in {shards} shards...", flush=True)
+
+  # fork (instead of spawn) shares the scores, mappings and matches with workers
+  context = multiprocessing.get_context('fork')
+  processes, conns = [], []
+  for i in range(shards):
+    parent, child = context.Pipe()
+    process = context.Process(
+      target=_worker,
+      args=(child, map_rows, scores[bounds[i]:bounds[i + 1]], f"{output}.shard{i}",
+            format))
+    process.start()
+    child.close()
+    processes.append(process)
+    conns.append(parent)
+
+  try:
+    headers = [_receive(conn) for conn in conns]
+    header = next((header for header in headers if header is not None), None)
+    for conn in conns:
+      conn.send(header)
+    rows = [_receive(conn) for conn in conns]
+  except BaseException:
+    # workers may be waiting for the header
+    for process in processes:
+      process.terminate()
+    raise
+  finally:
+    for process in processes:
+      process.join()
+
+  total = sum(rows)
+  if total:
+    write_header(output, header, format)
+    with open(output, 'ab') as out:
+      for i in range(shards):
+        shard = f"{output}.shard{i}"
+        if os.path.exists(shard):
+          with open(shard, 'rb') as f:
+            shutil.copyfileobj(f, out)
+          os.remove(shard)
+  return total
@@ -0,0 +1,118 @@
+"""Helpers shared by the MaveDB mapping modules"""
+
+import csv
+import json
+import warnings
+from collections import OrderedDict
+
+
+def customshowwarning(message, category, filename, lineno, file=None, line=None):
+  """Customise warning messages to simply print the warning message"""
+  print("WARNING:", message)
+
+
+def load_HGVSp_to_variant_matches (f):
+  """Load HGVSp to variant matches from a TSV file."""
+  matches = {}
+  with open(f) as csvfile:
+    reader = csv.DictReader(csvfile, delimiter="\t")
+    for row in reader:
+      hgvs = row['HGVSp']
+      if hgvs not in matches:
+        matches[hgvs] = []
+      matches[hgvs].append(row)
+  return(matches)
+
+def parse_vr_output (data):
+  """
+  Parse Variant Recoder output (with 'vcf_string' enabled).
+
+  Returns a dictionary of HGVSp to lists of (chr, start, end, ref, alt), in the
+  order returned, and the warnings of the entries that Variant Recoder could not
+  parse or skipped (which are not in the dictionary).
+  """
+  results = {}
+  failed = []
+  for result in data:
+    for allele in result:
+      info = result[allele]
+      if isinstance(info, list) and ("Unable to parse" in info[0] or "skipped" in info[0]):
+        failed.append(info[0])
+        continue
+      hgvs = info["input"]
+      variants = results.setdefault(hgvs, [])
+      for string in info["vcf_string"]:
+        chr, start, ref, alt = string.split('-')
+        end = int(start) + len(alt) - 1
+        variants.append((chr, start, end, ref, alt))
+  return results, failed
+
+def variant_match (hgvs, variant):
+  """HGVSp to variant match for a (chr, start, end, ref, alt) variant"""
+  chr, start, end, ref, alt = variant
+  return OrderedDict([("HGVSp", hgvs),
+                      ("chr",   chr),
+                      ("start", start),
+                      ("end",   end),
+                      ("ref",   ref),
+                      ("alt",   alt)])
+
+# Global variable for caching chromosome name
+chrom = None
+def get_chromosome (hgvs):
+  """
+  Lookup chromosome name in the Ensembl REST API (caches result globally).
+  
+  Splits the HGVS string to extract the chromosome, retrieves synonyms from Ensembl,
+  and selects the UCSC name (removing 'chr' if present).
+  """
+  global chrom
+  if (chrom is None):
+    chrom = hgvs.split(":")[0]
+    # only needed for HGVSg mappings, so imported here to keep start-up fast
+    import urllib.request
+    from urllib.parse import urlencode
+
+    url   = f"https://rest.ensembl.org/info/assembly/homo_sapiens/{chrom}?"
+    data  = urlencode({"synonyms": 1, "content-type": "application/json"})
+    res   = urllib.request.urlopen(url + data).read()
+    res   = json.loads(res)
+    chrom = [each["name"] for each in res["synonyms"] if each['dbname'] == "UCSC"][0]
+    chrom = chrom.replace("chr", "")
+  return chrom
+
+def match_information (hgvs, matches, row, extra):
+  """
+  Match a given HGVS to variant details using pre-loaded HGVSp-variant matches.
+  
+  If the provided HGVS is not found in the matches, a warning is issued.
+  For each matching entry, merge the match with extra metadata and the score row.
+  """
+  out = []
+  if hgvs not in matches:
+    warnings.warn(f"{hgvs} not found in HGVSp-variant matches")
+    return out
+
+  for match in matches[hgvs]:
+    # a copy, as the same match is shared by all rows with this HGVS
+    mapped = dict(match)
+    mapped['hgvs'] = match['HGVSp']
+    mapped.update(extra)
+    mapped.update(row)
+    out.append(mapped)
+  return out
+
+def round_float_columns(row, round):
+  """
+  Round all float values in a row to a specified number of decimal places.
+  """
+  if round is not None:
+    for i in row.keys():
+      try:
+        # Use the built-in round() function to round the value
+        rounded = round(float(row[i]), round)
+        row[i] = '{0:g}'.format(rounded)
+      except:
+        # If the conversion fails, leave the value unchanged
+        pass
+  return row
@@ -0,0 +1,321 @@
+"""
+Persistent cache of Variant Recoder results, keyed by HGVSp
+
+Stores HGVSp -> (chr, start, end, ref, alt) results in a SQLite database,
+namespaced by release/assembly (e.g. '114_GRCh38'), so that Variant Recoder
+only runs on HGVSp not seen before and the mappers can answer their lookups
+from the cache. HGVSp that Variant Recoder returned without variants (or
+could not parse) are stored too, so they are not sent again until they expire
+(--expire days later). HGVSp missing from the Variant Recoder output (e.g. if
+it failed) are not stored, so they are sent again by the next run.
+
+The cache is usually on a shared (e.g. NFS) file system, where SQLite locking
+is not reliable. So tasks never write to it: they open it read-only, without
+locking, and store their results in a shard of their own (a new database in
+their working directory). The shards are merged into the cache by a single
+task once no other task reads it. Pipelines sharing a cache must therefore
+not run at the same time.
+
+Usage:
+  # HGVSp of a URN not in the cache yet (or without variants for over 30 days)
+  vr_cache.py missing --cache vr_cache.db --namespace 114_GRCh38 --hgvs hgvsp.txt --expire 30 > new.txt
+
+  # store Variant Recoder results for those HGVSp in a shard
+  vr_cache.py add --cache shard.db --namespace 114_GRCh38 --hgvs new.txt --vr vr.json
+
+  # merge the shards of all tasks into the cache
+  vr_cache.py merge --cache vr_cache.db shard_1.db shard_2.db
+"""
+
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+import urllib.parse
+
+from mavedb.utils import parse_vr_output, variant_match
+
+# seconds to wait for other tasks writing to the cache
+TIMEOUT = 600
+
+# days after which HGVSp without variants are recoded again
+EXPIRE = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS variant_recoder (
+  namespace TEXT    NOT NULL,
+  hgvsp     TEXT    NOT NULL,
+  idx       INTEGER NOT NULL, -- order of the variant in the Variant Recoder output (-1: no variants)
+  chr       TEXT,
+  start     TEXT,
+  end       INTEGER,
+  ref       TEXT,
+  alt       TEXT,
+  added     INTEGER,          -- time the result was stored (seconds since the epoch)
+  PRIMARY KEY (namespace, hgvsp, idx)
+) WITHOUT ROWID
+"""
+
+
+def failed_hgvs (failed):
+  """
+  HGVSp named in the warnings of inputs that Variant Recoder could not recode
+
+  The warnings have no field with the input, so it is taken from the words of
+  the message (e.g. "Unable to parse HGVS notation 'NP_000001.1:p.Xaa1Gly'"),
+  split on whitespace, quotes and commas and without trailing ':' or '.'; only
+  words that are HGVSp given to Variant Recoder are used (see add).
+  """
+  return {word.rstrip(':.') for message in failed for word in re.findall(r"[^\s'\",]+", message)}
+
+
+class VRCache:
+  """
+  Variant Recoder results for a given release/assembly namespace
+
+  With readonly, the cache is opened without locking and never written to;
+  a cache that does not exist yet is empty.
+  """
+
+  def __init__(self, path, namespace, readonly=False):
+    if not namespace:
+      raise ValueError("a namespace (e.g. release and assembly) is required for the Variant Recoder cache")
+    self.namespace = namespace
+    self.path = path
+    self.readonly = readonly
+    self._db = None
+    self._pid = None
+    if readonly:
+      self.expires = 'added' in self._columns()
+      return
+
+    self.db.execute(SCHEMA)
+    if 'added' not in self._columns():
+      # caches created before results expired: their HGVSp without variants are expired
+      self.db.execute("ALTER TABLE variant_recoder ADD COLUMN added INTEGER")
+    self.db.commit()
+    self.expires = True
+
+  @property
+  def db (self):
+    # SQLite connections must not be used across fork() (e.g. by sharded
+    # mapping), so each process opens its own
+    if self._pid != os.getpid():
+      if not self.readonly:
+        self._db = sqlite3.connect(self.path, timeout=TIMEOUT)
+      elif os.path.exists(self.path):
+        # immutable: no locks (unreliable over NFS), as no task writes to it
+        uri = "file:" + urllib.parse.quote(os.path.abspath(self.path))
+        self._db = sqlite3.connect(uri + "?mode=ro&immutable=1", uri=True)
+      else:
+        self._db = sqlite3.connect(":memory:")
+        self._db.execute(SCHEMA)
+      self._pid = os.getpid()
+    return self._db
+
+  def _columns (self):
+    return [row[1] for row in self.db.execute("PRAGMA table_info(variant_recoder)")]
+
+  def __contains__ (self, hgvs):
+    cur = self.db.execute(
+      "SELECT 1 FROM variant_recoder WHERE namespace = ? AND hgvsp = ? LIMIT 1",
+      (self.namespace, hgvs))
+    return cur.fetchone() is not None
+
+  def variants (self, hgvs):
+    """Cached variants for a HGVSp, as (chr, start, end, ref, alt); None if not cached"""
+    cur = self.db.execute(
+      "SELECT idx, chr, start, end, ref, alt FROM variant_recoder "
+      "WHERE namespace = ? AND hgvsp = ? ORDER BY idx",
+      (self.namespace, hgvs))
+    rows = cur.fetchall()
+    if not rows:
+      return None
+    return [tuple(row[1:]) for row in rows if row[0] >= 0]
+
+  def _current (self, hgvs, since):
+    if not self.expires:
+      # not merged into since results expire: HGVSp without variants are expired
+      cur = self.db.execute(
+        "SELECT 1 FROM variant_recoder WHERE namespace = ? AND hgvsp = ? AND idx >= 0 LIMIT 1",
+        (self.namespace, hgvs))
+      return cur.fetchone() is not None
+    cur = self.db.execute(
+      "SELECT 1 FROM variant_recoder WHERE namespace = ? AND hgvsp = ? "
+      "AND (idx >= 0 OR added >= ?) LIMIT 1",
+      (self.namespace, hgvs, since))
+    return cur.fetchone() is not None
+
+  def missing (self, hgvs_list, expire=EXPIRE):
+    """
+    HGVSp from hgvs_list that are not cached yet, or were cached without
+    variants more than expire days ago (in the same order)
+    """
+    since = time.time() - expire * 86400
+    return [hgvs for hgvs in hgvs_list if not self._current(hgvs, since)]
+
+  def add (self, results, hgvs_list=(), failed=()):
+    """
+    Store Variant Recoder results (from parse_vr_output) as of now; HGVSp
+    returned without variants, and HGVSp in hgvs_list named in the warnings
+    of failed inputs, are stored as having no variants. Other HGVSp in
+    hgvs_list are not stored, so they are recoded again.
+    """
+    added = int(time.time())
+    rows = []
+    for hgvs, variants in results.items():
+      if not variants:
+        rows.append((self.namespace, hgvs, -1, None, None, None, None, None, added))
+      for idx, variant in enumerate(variants):
+        rows.append((self.namespace, hgvs, idx) + tuple(variant) + (added,))
+    unparsed = failed_hgvs(failed)
+    for hgvs in hgvs_list:
+      if hgvs not in results and hgvs in unparsed:
+        rows.append((self.namespace, hgvs, -1, None, None, None, None, None, added))
+
+    with self.db:
+      # replace previous results for the same HGVSp (e.g. a re-run Variant Recoder)
+      self.db.executemany(
+        "DELETE FROM variant_recoder WHERE namespace = ? AND hgvsp = ?",
+        {(row[0], row[1]) for row in rows})
+      self.db.executemany(
+        "INSERT INTO variant_recoder (namespace, hgvsp, idx, chr, start, end, ref, alt, added) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len({row[1] for row in rows})
+
+  def merge (self, shards):
+    """
+    Add the results of shards (caches written by add) in this namespace to
+    this cache, replacing previous results for the same HGVSp; returns the
+    number of HGVSp merged
+    """
+    merged = 0
+    for shard in shards:
+      self.db.execute("ATTACH DATABASE ? AS shard", (os.fspath(shard),))
+      try:
+        with self.db:
+          self.db.execute(
+            "DELETE FROM variant_recoder WHERE namespace = ? AND hgvsp IN "
+            "(SELECT hgvsp FROM shard.variant_recoder WHERE namespace = ?)",
+            (self.namespace, self.namespace))
+          self.db.execute(
+            "INSERT INTO variant_recoder (namespace, hgvsp, idx, chr, start, end, ref, alt, added) "
+            "SELECT namespace, hgvsp, idx, chr, start, end, ref, alt, added "
+            "FROM shard.variant_recoder WHERE namespace = ?", (self.namespace,))
+        merged += self.db.execute(
+          "SELECT COUNT(DISTINCT hgvsp) FROM shard.variant_recoder WHERE namespace = ?",
+          (self.namespace,)).fetchone()[0]
+      finally:
+        self.db.execute("DETACH DATABASE shard")
+    return merged
+
+  def matches (self, results=None):
+    """
+    HGVSp to variant matches (as returned by load_vr_output) looked up in the
+    cache; results (from parse_vr_output) not merged into the cache yet are
+    looked up first
+    """
+    return CachedMatches(self, results)
+
+  def close (self):
+    if self._db is not None and self._pid == os.getpid():
+      self._db.close()
+    self._db = self._pid = None
+
+
+class CachedMatches:
+  """
+  Read-only mapping of HGVSp to variant matches, answered from the cache.
+
+  Behaves like the dictionary returned by load_vr_output(): HGVSp without
+  variants are not in it, and each HGVSp returns the same list of matches
+  every time it is looked up.
+  """
+
+  def __init__(self, cache, results=None):
+    self._cache = cache
+    self._results = results or {}
+    self._matches = {}
+
+  def _lookup (self, hgvs):
+    if hgvs not in self._matches:
+      variants = self._results.get(hgvs) or self._cache.variants(hgvs) or []
+      self._matches[hgvs] = [variant_match(hgvs, variant) for variant in variants]
+    return self._matches[hgvs]
+
+  def __contains__ (self, hgvs):
+    return len(self._lookup(hgvs)) > 0
+
+  def __getitem__ (self, hgvs):
+    matches = self._lookup(hgvs)
+    if not matches:
+      raise KeyError(hgvs)
+    return matches
+
+  def __len__ (self):
+    return sum(1 for matches in self._matches.values() if matches)
+
+
+def read_hgvs (f):
+  with open(f) as fh:
+    return [line.strip() for line in fh if line.strip()]
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description='Cache of Variant Recoder results, keyed by HGVSp')
+  subparsers = parser.add_subparsers(dest='command', required=True)
+
+  missing = subparsers.add_parser('missing',
+    help="print HGVSp (one per line) that are not in the cache (opened read-only)")
+  add = subparsers.add_parser('add',
+    help="store Variant Recoder results in a cache (the shard of a task)")
+  merge = subparsers.add_parser('merge',
+    help="merge shards into the cache")
+  for subparser in (missing, add, merge):
+    subparser.add_argument('--cache', type=str, required=True,
+                           help="path to cache (SQLite database, created if needed)")
+    subparser.add_argument('--namespace', type=str, required=True,
+                           help="release/assembly namespace, e.g. '114_GRCh38'")
+  for subparser in (missing, add):
+    subparser.add_argument('--hgvs', type=str, required=True,
+                           help="path to file with HGVSp (one per line)")
+  missing.add_argument('--expire', type=float, default=EXPIRE,
+                       help=f"days after which HGVSp without variants are recoded again (default: {EXPIRE})")
+  add.add_argument('--vr', type=str, required=True,
+                   help="path to Variant Recoder output for --hgvs with 'vcf_string' enabled")
+  merge.add_argument('shards', type=str, nargs='*',
+                     help="paths to shards written by 'add'")
+  args = parser.parse_args()
+
+  if args.command == 'merge':
+    cache = VRCache(args.cache, args.namespace)
+    merged = cache.merge(args.shards)
+    print(f"Merged Variant Recoder results for {merged} HGVSp from {len(args.shards)} shards",
+          file=sys.stderr)
+    cache.close()
+    return
+
+  cache = VRCache(args.cache, args.namespace, readonly=args.command == 'missing')
+  hgvs_list = read_hgvs(args.hgvs)
+
+  if args.command == 'missing':
+    new = cache.missing(hgvs_list, args.expire)
+    for hgvs in new:
+      sys.stdout.write(hgvs + "\n")
+    print(f"{len(hgvs_list) - len(new)} of {len(hgvs_list)} HGVSp in Variant Recoder cache",
+          file=sys.stderr)
+  elif args.command == 'add':
+    with open(args.vr) as f:
+      results, failed = parse_vr_output(json.load(f))
+    stored = cache.add(results, hgvs_list, failed)
+    print(f"Stored Variant Recoder results for {stored} HGVSp", file=sys.stderr)
+    unparsed = failed_hgvs(failed)
+    unanswered = [hgvs for hgvs in hgvs_list if hgvs not in results and hgvs not in unparsed]
+    if unanswered:
+      print(f"WARNING: {len(unanswered)} HGVSp not in the Variant Recoder output were not stored",
+            file=sys.stderr)
+  cache.close()
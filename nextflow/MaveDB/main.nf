@@ -13,14 +13,30 @@ params.ensembl  = "${ENSEMBL_ROOT_DIR}"
 params.output   = "output/MaveDB_variants.tsv.gz"
 params.registry = null
 
+// Cache of Variant Recoder results (only HGVSp not cached yet are recoded)
+params.vr_cache     = null
+params.vr_namespace = null // release/assembly of the cached results, e.g. 114_GRCh38
+params.vr_expire    = 30   // days after which HGVSp cached without variants are recoded again
+
+// Results of previous runs, reused for URNs with unchanged inputs
+params.store        = null
+
 params.licences = "CC0" // Open-access only
 params.round    = 4
+params.parquet  = false // also write output as Parquet with an interval index
+params.binary   = false // pass variants between steps in a binary record format
+params.map_workers = 1  // processes per URN to map large score sets with
 
 // Parameters for loading MaveDB from files:
 params.from_files    = true        // Use local files instead of downloading via the MaveDB API
 params.metadata_file = ""          // only used if from_files is true
 params.mappings_path = ""          // only used if from_files is true
 params.scores_path   = ""          // only used if from_files is true
+params.catalogue     = false       // catalogue the data dump once instead of parsing it per URN (only used if from_files is true)
+
+// Parameters for downloading MaveDB data via the API (only used if from_files is false):
+params.fetch_cache       = "cache/MaveDB" // responses are revalidated instead of downloaded again
+params.fetch_concurrency = 8              // maximum number of concurrent requests
 
 // Print usage
 if (params.help) {
@@ -43,27 +59,42 @@ if (params.help) {
     --mappings_path Path to MaveDB mappings files (one JSON file per URN)
     --scores_path   Path to MaveDB scores files (one CSV file per URN)
     --metadata_file Path to MaveDB metadata file (one collated file, i.e. main.json)
+    --catalogue     Catalogue the data dump in a single pass to filter and split URNs (default: false)
+    --fetch_cache   Directory to cache MaveDB API responses in (default: cache/MaveDB)
+    --fetch_concurrency Maximum number of concurrent requests to the MaveDB API (default: 8)
     --licences      Comma-separated list of accepted licences (default: 'CC0')
     --round         Decimal places to round floats in MaveDB data (default: 4)
+    --vr_cache      Path to Variant Recoder cache, created if needed (default: not used)
+    --vr_namespace  Release/assembly namespace of the Variant Recoder cache, such as '114_GRCh38'
+    --vr_expire     Days after which HGVSp cached without variants are recoded again (default: 30)
+    --store         Path to directory with results of previous runs, reused for URNs with unchanged inputs (default: not used)
+    --telemetry     Directory to collect resource usage of the Python steps (default: disabled)
+    --parquet       Also write output as Parquet with an interval index for region/URN queries (default: false)
+    --map_workers   Number of processes to map each large score set with, in shards of rows (default: 1)
+    --binary        Pass variants from mapping to liftover and merging as binary records instead of TSV (default: false)
   """
   exit 1
 }
 
 // Module imports
 include { filter_by_licence } from './subworkflows/filter.nf'
-include { download_MaveDB_data } from './nf_modules/fetch.nf'
 include { split_by_mapping_type } from './subworkflows/split.nf'
-include { run_variant_recoder } from './nf_modules/variant_recoder.nf'
+include { run_variant_recoder; merge_vr_cache } from './nf_modules/variant_recoder.nf'
 include { get_hgvsp } from './nf_modules/utils.nf'
 include { map_scores_to_HGVSp_variants; map_scores_to_HGVSg_variants } from './nf_modules/mapping.nf'
 include { download_chain_files; liftover_to_hg38 } from './nf_modules/liftover.nf'
-include { concatenate_files; tabix } from './nf_modules/output.nf'
+include { concatenate_files; merge_variants; sort_variants; tabix; to_parquet } from './nf_modules/output.nf'
 include { check_JVM_mem; print_params; print_summary } from '../utils/utils.nf'
 include { import_from_files } from './nf_modules/import_from_files.nf'
 include { extract_metadata } from './nf_modules/extract_metadata.nf'
+include { build_catalogue; metadata_from_catalogue } from './nf_modules/catalogue.nf'
+include { check_manifest; store_result } from './nf_modules/manifest.nf'
 
 // Main workflow
-print_params('Create MaveDB plugin data for VEP', nullable=['registry'])
+print_params('Create MaveDB plugin data for VEP', nullable=['registry', 'vr_cache', 'vr_namespace', 'store'])
+if (params.vr_cache && !params.vr_namespace) {
+  exit 1, "ERROR: --vr_namespace is required when using --vr_cache"
+}
 check_JVM_mem(min=50.4)
 print_summary()
 
@@ -76,9 +107,28 @@ workflow {
   // If --from_files is true, use local files instead of downloading via the MaveDB API
   if (params.from_files) {
     
-    // metaChannel extracts the metadata from the large metadata file 
-    // metaChannel outputs tuples of [urn, metadata.json, LICENSE.txt]
-    metaChannel = extract_metadata(urn, params.metadata_file)
+    if (params.catalogue) {
+      // Catalogue all URNs in a single pass over the data dump, to filter them
+      // by licence and split them by HGVS type without opening per-URN files
+      build_catalogue(params.metadata_file)
+      entries = build_catalogue.out.tsv
+                  .splitCsv(header: true, sep: '\t')
+                  .map { [it.urn, it] }
+                  .join(urn.map { [it] })
+
+      entries
+          .filter { !params.licences.tokenize(",").contains(it[1].licence) }
+          .subscribe { println "NOTE: Discarded ${it[0]} based on license (${it[1].licence})" }
+      entries = entries.filter { params.licences.tokenize(",").contains(it[1].licence) }
+      hgvsTypes = entries.map { [it[0], it[1].hgvs_type] }
+
+      // metadata of the remaining URNs, as tuples of [urn, metadata.json, LICENSE.txt]
+      metaChannel = metadata_from_catalogue(entries.map { it[0] }, build_catalogue.out.db)
+    } else {
+      // metaChannel extracts the metadata from the large metadata file 
+      // metaChannel outputs tuples of [urn, metadata.json, LICENSE.txt]
+      metaChannel = extract_metadata(urn, params.metadata_file)
+    }
 
     // Log removed URNs (those that do NOT have a "CC0" license)
     metaChannel
@@ -105,12 +155,33 @@ workflow {
           metadata : d   // Metadata JSON file path
         ]}
 
+    // HGVS type of the mappings, if known from the catalogue
+    if (params.catalogue) {
+      files = files.map { [it.urn, it] }
+                   .join(hgvsTypes)
+                   .map { urn, f, hgvs -> hgvs ? f + [hgvs: hgvs] : f }
+    }
+
   } else {
     // If --from_files is false, download MaveDB data via the API (this option is not advised as it's unreliable)
     licences = params.licences.tokenize(",")
-    urn = filter_by_licence(urn, licences)
-    download_MaveDB_data(urn)
-    files = download_MaveDB_data.out.map { [urn: it[0], mappings: it[1], scores: it[2], metadata: it[3]] }
+    files = filter_by_licence(urn, licences)
+              .map { [urn: it.urn, mappings: it.mappings, scores: it.scores, metadata: it.metadata] }
+  }
+
+  // With --store, reuse results of URNs whose inputs did not change since the previous run
+  if (params.store) {
+    manifests = check_manifest(files.map { [it.urn, it.mappings, it.scores, it.metadata] })
+      .branch {
+        reuse:   it[2] == 'reuse'
+        rebuild: true
+      }
+    reused = manifests.reuse.map { [it[0], file(it[3])] }
+    files  = files.map { [it.urn, it] }
+                  .join(manifests.rebuild.map { [it[0]] })
+                  .map { it[1] }
+  } else {
+    reused = Channel.empty()
   }
   
   // Split mapping.json files by mapping type - HGVSg or HGVSp
@@ -125,12 +196,28 @@ workflow {
   get_hgvsp(files.hgvs_pro)
   hgvsp = get_hgvsp.out.filter { it.last().size() > 0 }
   run_variant_recoder(hgvsp)
-  map_scores_to_HGVSp_variants(run_variant_recoder.out)
+  map_scores_to_HGVSp_variants(run_variant_recoder.out.vr)
+  if (params.vr_cache) {
+    // once all HGVSp are mapped, i.e. nothing reads the cache anymore
+    merge_vr_cache(run_variant_recoder.out.shard.collect(),
+                   map_scores_to_HGVSp_variants.out.count())
+  }
+
+  results = liftover_to_hg38.out.mix(map_scores_to_HGVSp_variants.out)
+  if (params.store) {
+    store_result(results.join(manifests.rebuild.map { [it[0], it[1]] }))
+  }
 
   // concatenate output files into a single file
-  output_files = liftover_to_hg38.out
-                  .mix(map_scores_to_HGVSp_variants.out)
+  output_files = results
+                  .mix(reused)
                   .collect { it.last() }
-  concatenate_files(output_files)
-  tabix(concatenate_files.out)
+  if (params.binary) {
+    combined = merge_variants(output_files)
+  } else {
+    combined = concatenate_files(output_files)
+  }
+  sorted = sort_variants(combined)
+  tabix(sorted)
+  if (params.parquet) to_parquet(sorted)
 }
@@ -0,0 +1,33 @@
+process build_catalogue {
+  // Catalogue all score sets of the MaveDB data dump in a single pass
+  // (licence, number of variants, HGVS type, mappings and scores files, ...)
+
+  input:  path metadata_file
+  output:
+    path('catalogue.db'),  emit: db
+    path('catalogue.tsv'), emit: tsv
+
+  """
+  catalogue.py build --metadata_file ${metadata_file} \\
+                     --mappings_path ${params.mappings_path} \\
+                     --scores_path ${params.scores_path} \\
+                     --catalogue catalogue.db
+  catalogue.py query --catalogue catalogue.db --output catalogue.tsv
+  """
+}
+
+process metadata_from_catalogue {
+  // Write metadata.json and LICENCE.txt of a URN like extract_metadata, but
+  // looked up in the catalogue instead of parsing the whole data dump
+
+  tag "${urn}"
+  input:
+    val urn
+    path catalogue
+  output:
+    tuple val(urn), file("metadata.json"), file("LICENCE.txt")
+
+  """
+  catalogue.py metadata --catalogue ${catalogue} --urn "${urn}"
+  """
+}
@@ -1,36 +1,21 @@
-process download_MaveDB_metadata {
-  // Download MaveDB metadata
-  errorStrategy 'ignore'
+process fetch_MaveDB {
+  // Download metadata, mappings and scores of all MaveDB URNs at once
+  // (mappings and scores only for URNs with accepted licences)
+  // Response bodies are streamed to disk, so the default memory (increased on
+  // retries after exceeding it; see nextflow.config) is enough
 
-  input:  val urn
-  output: tuple val(urn), path('metadata.json'), path('LICENCE.txt')
-
-  """
-  #!/usr/bin/env python3
-  import urllib.request
-  import json
-
-  url = "https://api.mavedb.org/api/v1/score-sets/${urn}"
-  res = urllib.request.urlopen(url).read()
-  res = json.loads(res)
-  
-  with open('metadata.json', 'w') as f:
-    json.dump(res, f)
-
-  with open("LICENCE.txt", "w") as f:
-    f.write(res['license']['shortName'])
-  """
-}
-
-process download_MaveDB_data {
-  // Download MaveDB data
-  input: tuple val(urn), path(metadata), path(licence)
-  output: tuple val(urn), path('mappings.json'), path('scores.csv'), path(metadata)
+  input:
+    path urns
+    val licences
+  output: path('mavedb/*', type: 'dir')
 
   script:
-    url = "https://api.mavedb.org/api/v1/score-sets/${urn}"
+  def cache = params.fetch_cache ? "--cache ${file(params.fetch_cache)}" : ""
   """
-  wget ${url}/mapped-variants -O mappings.json
-  wget ${url}/scores -O scores.csv
+  fetch_mavedb.py --urns ${urns} \\
+                  --outdir mavedb \\
+                  --licences '${licences.join(',')}' \\
+                  --concurrency ${params.fetch_concurrency} \\
+                  ${cache}
   """
-}
\ No newline at end of file
+}
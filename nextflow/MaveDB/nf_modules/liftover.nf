@@ -24,8 +24,10 @@ process liftover_to_hg38 {
     tuple val(urn), path(metadata), path(mapped_variants)
     path(chain_files)
   output:
-    tuple val(urn), path("liftover_*.tsv")
+    tuple val(urn), path("liftover_*.${params.binary ? 'rec' : 'tsv'}")
 
+  script:
+  def ext = params.binary ? "rec" : "tsv"
   """
   set +e
   
@@ -34,9 +36,9 @@ process liftover_to_hg38 {
               --reference hg38
 
   # Check if the output file exists and is non-empty or create an empty file
-  if [ ! -s liftover_${urn}.tsv ]; then
-      echo "WARNING: liftover_${urn}.tsv is empty. Creating fallback empty file." >&2
-      echo "" > liftover_${urn}.tsv
+  if [ ! -s liftover_${urn}.${ext} ]; then
+      echo "WARNING: liftover_${urn}.${ext} is empty. Creating fallback empty file." >&2
+      echo "" > liftover_${urn}.${ext}
   fi
   """
 }
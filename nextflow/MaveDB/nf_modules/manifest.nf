@@ -0,0 +1,39 @@
+process check_manifest {
+  // Hash the inputs of a URN and check if its result can be reused from --store
+
+  tag "${urn}"
+  input:  tuple val(urn), path(mappings), path(scores), path(metadata)
+  output: tuple val(urn), path('manifest.json'), env(status), env(result)
+
+  script:
+  // parameters changing the output of a URN (besides its input files, the
+  // mapping code, the Ensembl code versions and the registry file contents)
+  def opts = ["from_files=${params.from_files}", "round=${params.round}",
+              "vr_namespace=${params.vr_namespace}", "binary=${params.binary}"]
+  def registry = params.registry ? "--registry ${file(params.registry)}" : ""
+  """
+  # not read from a process substitution, so that errors fail the task
+  manifest.py check --store ${file(params.store)} \\
+                    --urn ${urn} \\
+                    --scores ${scores} \\
+                    --mappings ${mappings} \\
+                    --metadata ${metadata} \\
+                    --ensembl ${params.ensembl} ${registry} \\
+                    ${opts.collect { "--param '${it}'" }.join(' ')} > check.txt
+  read status result < check.txt
+  """
+}
+
+process store_result {
+  // Keep the result of a URN in --store for later runs
+
+  tag "${urn}"
+  input: tuple val(urn), path(result), path(manifest)
+
+  """
+  manifest.py store --store ${file(params.store)} \\
+                    --urn ${urn} \\
+                    --manifest ${manifest} \\
+                    --result ${result}
+  """
+}
@@ -3,16 +3,29 @@ process map_scores_to_HGVSp_variants {
 
   tag "${urn}"
   input:  tuple val(urn), path(mappings), path(scores), path(metadata), path(vr)
-  output: tuple val(urn), path('map_*.tsv')
+  output: tuple val(urn), path("map_*.${params.binary ? 'rec' : 'tsv'}")
 
   memory { mappings.size() * 4.B + 1.GB }
+  cpus { scores.size() > 1.MB.toBytes() ? params.map_workers : 1 }
 
   script:
   def round = params.round ? "--round ${params.round}" : ""
 
+  // With --binary, write records for liftover and merging instead of TSV
+  def ext    = params.binary ? "rec" : "tsv"
+  def format = params.binary ? "--format records" : ""
+
+  // Large score sets are mapped in shards of rows by parallel processes
+  def workers = task.cpus > 1 ? "--workers ${task.cpus}" : ""
+
   // If --from_files is true, use local files instead of downloading via the MaveDB API
   def script_name = params.from_files ? "map_scores_to_variants_fromfiles.py" : "map_scores_to_variants.py"
 
+  // With a cache, vr.json only has the HGVSp missing from it (see run_variant_recoder)
+  def vr_input = params.vr_cache ?
+    "--vr $vr --vr_cache ${file(params.vr_cache)} --vr_namespace ${params.vr_namespace}" :
+    "--vr $vr"
+
   """
   #!/usr/bin/env bash
   
@@ -22,14 +35,14 @@ process map_scores_to_HGVSp_variants {
                  --scores ${scores} \\
                  --mappings ${mappings} \\
                  --metadata ${metadata} \\
-                 --vr $vr \\
-                 ${round} \\
-                 --output map_${urn}.tsv
+                 ${vr_input} \\
+                 ${round} ${format} ${workers} \\
+                 --output map_${urn}.${ext}
 
   # Check if the output file exists and is non-empty, if not, create an empty file
-  if [ ! -s map_${urn}.tsv ]; then
-      echo "WARNING: map_${urn}.tsv is empty or doesn't exist. Creating fallback empty file." >&2
-      echo "" > map_${urn}.tsv
+  if [ ! -s map_${urn}.${ext} ]; then
+      echo "WARNING: map_${urn}.${ext} is empty or doesn't exist. Creating fallback empty file." >&2
+      echo "" > map_${urn}.${ext}
   fi
   """
 }
@@ -39,13 +52,21 @@ process map_scores_to_HGVSg_variants {
 
   tag "${urn}"
   input:  tuple val(urn), path(mappings), path(scores), path(metadata), val(hgvs)
-  output: tuple val(urn), path(metadata), path('*map_*.tsv')
+  output: tuple val(urn), path(metadata), path("*map_*.${params.binary ? 'rec' : 'tsv'}")
 
   memory { mappings.size() * 2.B + 1.GB }
+  cpus { scores.size() > 1.MB.toBytes() ? params.map_workers : 1 }
 
   script:
   def round = params.round ? "--round ${params.round}" : ""
 
+  // With --binary, write records for liftover and merging instead of TSV
+  def ext    = params.binary ? "rec" : "tsv"
+  def format = params.binary ? "--format records" : ""
+
+  // Large score sets are mapped in shards of rows by parallel processes
+  def workers = task.cpus > 1 ? "--workers ${task.cpus}" : ""
+
   // If --from_files is true, use local files instead of downloading via the MaveDB API
   def script_name = params.from_files ? "map_scores_to_variants_fromfiles.py" : "map_scores_to_variants.py"
 
@@ -56,13 +77,13 @@ process map_scores_to_HGVSg_variants {
                  --scores ${scores} \\
                  --mappings ${mappings} \\
                  --metadata ${metadata} \\
-                 ${round} \\
-                 --output map_${urn}.tsv
+                 ${round} ${format} ${workers} \\
+                 --output map_${urn}.${ext}
 
   # Check if the output file exists and is non-empty, if not, create an empty file
-  if [ ! -s map_${urn}.tsv ]; then
-      echo "WARNING: map_${urn}.tsv is empty or doesn't exist. Creating fallback empty file." >&2
-      echo "" > map_${urn}.tsv
+  if [ ! -s map_${urn}.${ext} ]; then
+      echo "WARNING: map_${urn}.${ext} is empty or doesn't exist. Creating fallback empty file." >&2
+      echo "" > map_${urn}.${ext}
   fi
   """
 }
\ No newline at end of file
@@ -61,15 +61,28 @@ process concatenate_files {
   """
 }
 
-process tabix {
-  publishDir file(params.output).parent, mode: 'move', overwrite: true
+process merge_variants {
+  // Merge variants in the binary record format into a single TSV file
+
+  input:  path(mapped_variants)
+  output: path("combined.tsv")
+
+  // files are read into memory by pandas, as in concatenate_files
+  memory '20GB'
+
+  """
+  merge_variants.py --output combined.tsv *map_*.rec
+  """
+}
+
+process sort_variants {
+  // Sort variants by position, without LRG and chromosome patches
 
   input:  path out
-  output: path "*"
+  output: path "${file(params.output).baseName}"
 
   script:
   def name = file(params.output).baseName
-  def gzip = file(params.output).name
   """
   # add hash to first line of header
   sed -i '1 s/^/#/' ${out}
@@ -79,9 +92,34 @@ process tabix {
 
   # sort file by position
   (head -n1 ${out}; sort -k1,1 -k2,2n -k3,3n tmp.tsv | uniq) > ${name}
+  rm tmp.tsv
+  """
+}
 
-  bgzip ${name}
+process tabix {
+  publishDir file(params.output).parent, mode: 'move', overwrite: true
+
+  input:  path sorted
+  output: path "${file(params.output).name}*"
+
+  script:
+  def gzip = file(params.output).name
+  """
+  bgzip -c ${sorted} > ${gzip}
   tabix -s1 -b2 -e3 ${gzip}
-  rm tmp.tsv
+  """
+}
+
+process to_parquet {
+  // Write the sorted variants as Parquet with an interval index
+  publishDir file(params.output).parent, mode: 'move', overwrite: true
+
+  input:  path sorted
+  output: path "*.parquet*"
+
+  script:
+  def parquet = file(params.output).name.replace('.tsv.gz', '') + ".parquet"
+  """
+  to_parquet.py --input ${sorted} --output ${parquet}
   """
 }
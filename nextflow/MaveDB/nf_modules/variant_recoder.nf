@@ -3,7 +3,9 @@ process run_variant_recoder {
   label 'bigmem'
 
   input:  tuple val(urn), path(mappings), path(scores), path(metadata), path(hgvs)
-  output: tuple val(urn), path(mappings), path(scores), path(metadata), path('vr.json')
+  output:
+    tuple val(urn), path(mappings), path(scores), path(metadata), path('vr.json'), emit: vr
+    path('vr_cache_shard.db'), optional: true, emit: shard
 
   tag "${urn}"
   // determines how much RAM is requested for this specific process’s SLURM job
@@ -16,7 +18,35 @@ process run_variant_recoder {
   script:
   def bin = "${params.ensembl}/ensembl-vep"
   def reg = params.registry ? "--registry ${params.registry}" : ""
+  if (params.vr_cache) {
+    // only recode HGVSp missing from the cache (read-only, see vr_cache.py)
+    // and store their results in a shard, merged by merge_vr_cache
+    def namespace = "--namespace ${params.vr_namespace}"
+    """
+    vr_cache.py missing --cache ${file(params.vr_cache)} $namespace --hgvs $hgvs --expire ${params.vr_expire} > new_hgvsp.txt
+    if [ -s new_hgvsp.txt ]; then
+      perl ${bin}/variant_recoder -i new_hgvsp.txt --vcf_string $reg > vr.json
+    else
+      echo "[]" > vr.json
+    fi
+    vr_cache.py add --cache vr_cache_shard.db $namespace --hgvs new_hgvsp.txt --vr vr.json
+    """
+  } else {
+    """
+    perl ${bin}/variant_recoder -i $hgvs --vcf_string $reg > vr.json
+    """
+  }
+}
+
+process merge_vr_cache {
+  // Merge the Variant Recoder results of all tasks into the cache; the only
+  // task writing to it, run once no task reads it anymore
+  input:
+    path(shards)
+    val(mapped)
+
+  script:
   """
-  perl ${bin}/variant_recoder -i $hgvs --vcf_string $reg > vr.json
+  vr_cache.py merge --cache ${file(params.vr_cache)} --namespace ${params.vr_namespace} ${shards}
   """
 }
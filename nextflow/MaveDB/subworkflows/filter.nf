@@ -1,15 +1,22 @@
-include { download_MaveDB_metadata } from '../nf_modules/fetch.nf'
+include { fetch_MaveDB } from '../nf_modules/fetch.nf'
 
 workflow filter_by_licence {
   take:
     urn
     licences
   main:
-    download_MaveDB_metadata( urn )
-    // Warn about discarded files
-    data = download_MaveDB_metadata.out
-             .map { [ urn: it[0], metadata: it[1], licence: it[2] ] }
+    // download data of all URNs in a single task
+    urns = urn.collectFile(name: 'urns.txt', newLine: true)
+    fetch_MaveDB( urns, licences )
+    data = fetch_MaveDB.out
+             .flatten()
+             .map { [ urn      : it.name,
+                      metadata : it.resolve('metadata.json'),
+                      licence  : it.resolve('LICENCE.txt'),
+                      mappings : it.resolve('mappings.json'),
+                      scores   : it.resolve('scores.csv') ] }
 
+    // Warn about discarded files
     data.
       filter { !licences.contains(it.licence.text) }.
       subscribe {
@@ -1,6 +1,9 @@
 def split_by_mapping_type (files) {
   // split mapping files based on HGVS type (HGVSp or HGVSg files)
   type = files.map {
+    // HGVS type may already be known (e.g. from the catalogue)
+    if (it.hgvs) return it
+
     it.mappings.withReader {
       while( line = it.readLine() ) {
         if (line.contains("hgvs.")) {
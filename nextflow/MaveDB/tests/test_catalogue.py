@@ -0,0 +1,78 @@
+"""
+Mappings and scores files of a URN must be the same in the catalogue
+(catalogue.py) and in --from_files mode (import_from_files.sh): both are
+checked on the same layout of the data dump.
+
+Usage:
+  python3 -m pytest nextflow/MaveDB/tests
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+MAVEDB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BIN_DIR = os.path.join(MAVEDB_DIR, "bin")
+UTILS_DIR = os.path.join(os.path.dirname(MAVEDB_DIR), "utils")
+sys.path.insert(0, BIN_DIR)
+sys.path.insert(0, UTILS_DIR)
+
+from mavedb.catalogue import find_file, find_files  # noqa: E402
+
+# files of the data dump, as {path: content}: -a-10 sorts before -a-1_, in
+# different directories and with different cases
+LAYOUT = {
+  "mappings/urn:mavedb:00000001-a-10_mappings.json": "1-a-10",
+  "mappings/old/urn:mavedb:00000001-a-1_mappings.json": "1-a-1",
+  "mappings/URN:MAVEDB:00000002-A-1.json": "2-a-1",
+  "mappings/urn:mavedb:00000002-a-1.txt": "not json",
+  "scores/urn-mavedb-00000001-a-10.scores.csv": "1-a-10\n",
+  "scores/1/urn-mavedb-00000001-a-1.scores.csv": "1-a-1\n",
+  "scores/urn-mavedb-00000002-a-1.scores.csv": "2-a-1\n",
+  "scores/urn-mavedb-00000002-a-1.scores.csv.bak": "backup\n",
+}
+
+
+@pytest.fixture
+def dump (tmp_path):
+  for path, content in LAYOUT.items():
+    os.makedirs(os.path.dirname(tmp_path / path), exist_ok=True)
+    (tmp_path / path).write_text(content)
+  return tmp_path
+
+
+def import_from_files (dump, urn, workdir):
+  os.makedirs(workdir)
+  # like the task environment of the pipeline (nextflow.config)
+  env = dict(os.environ, PATH=BIN_DIR + os.pathsep + os.environ["PATH"],
+             PYTHONPATH=UTILS_DIR)
+  return subprocess.run(
+    ["bash", os.path.join(BIN_DIR, "import_from_files.sh"), urn,
+     str(dump / "mappings"), str(dump / "scores")],
+    cwd=workdir, env=env, capture_output=True, text=True)
+
+
+@pytest.mark.parametrize("urn", ["urn:mavedb:00000001-a-1", "urn:mavedb:00000001-a-10",
+                                 "urn:mavedb:00000002-a-1"])
+def test_same_files (dump, urn):
+  mappings = find_file(find_files(dump / "mappings", ".json"), urn)
+  scores = find_file(find_files(dump / "scores", ".scores.csv"),
+                     urn.replace(":", "-") + ".scores.csv")
+  suffix = urn.split(":")[-1].lstrip("0")
+  assert open(mappings).read() == suffix
+  assert open(scores).read() == suffix + "\n"
+
+  res = import_from_files(dump, urn, dump / "work")
+  assert res.returncode == 0, res.stdout + res.stderr
+  assert (dump / "work" / "mappings.json").read_text() == open(mappings).read()
+  assert (dump / "work" / "scores.csv").read_text() == open(scores).read()
+
+
+def test_missing_files (dump):
+  urn = "urn:mavedb:00000003-a-1"
+  assert find_file(find_files(dump / "mappings", ".json"), urn) is None
+  res = import_from_files(dump, urn, dump / "work")
+  assert res.returncode == 1
+  assert "No mapping file found" in res.stdout
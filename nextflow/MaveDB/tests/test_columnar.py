@@ -0,0 +1,67 @@
+"""
+Parquet store of the combined output (columnar.py): row groups per genomic
+bin, variants without coordinates and region/URN lookups.
+
+Usage:
+  python3 -m pytest nextflow/MaveDB/tests
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+MAVEDB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(MAVEDB_DIR, "bin"))
+sys.path.insert(0, os.path.join(os.path.dirname(MAVEDB_DIR), "utils"))
+
+from mavedb.columnar import INDEX_SUFFIX, ScoreStore, write_parquet  # noqa: E402
+
+# sorted like sort_variants: missing starts sort as 0
+ROWS = [
+  ["", "", "", "A", "G", "urn:mavedb:00000003-a-1", "1"],
+  ["1", "NA", "NA", "A", "G", "urn:mavedb:00000001-a-1", "0.5"],
+  ["1", "100", "100", "A", "G", "urn:mavedb:00000001-a-1", "NA"],
+  ["1", "150", "", "A", "G", "urn:mavedb:00000002-a-1", "-1e-3"],
+  ["1", "1500", "1502", "AAA", "G", "urn:mavedb:00000002-a-1", "x"],
+  ["2", "", "", "C", "T", "urn:mavedb:00000002-a-1", "2"],
+  ["2", "10", "10", "C", "T", "urn:mavedb:00000001-a-1", "3"],
+]
+
+
+@pytest.fixture
+def store (tmp_path):
+  pytest.importorskip("pyarrow")
+  tsv = tmp_path / "variants.tsv"
+  with open(tsv, "w") as f:
+    f.write("\t".join(["chr", "start", "end", "ref", "alt", "urn", "score"]) + "\n")
+    for row in ROWS:
+      f.write("\t".join(row) + "\n")
+  write_parquet(str(tsv), str(tmp_path / "variants.parquet"), bin_size=1000)
+  return ScoreStore(str(tmp_path / "variants.parquet"))
+
+
+def test_row_groups (store):
+  groups = [(g["chr"], g["bin"], g["start"], g["end"], g["rows"]) for g in store.index["row_groups"]]
+  assert groups == [(None, None, None, None, 1),
+                    ("1", None, None, None, 1),
+                    ("1", 0, 100, 150, 2),
+                    ("1", 1, 1500, 1502, 1),
+                    ("2", None, None, None, 1),
+                    ("2", 0, 10, 10, 1)]
+  with open(store.path + INDEX_SUFFIX) as f:
+    assert json.load(f) == store.index
+
+
+def test_lookups (store):
+  assert store.region("1", 1, 2000, numpy=True)["start"].tolist() == [100, 150, 1500]
+  assert store.region("1", 120, 1500, columns=["start"]).column("start").to_pylist() == [150, 1500]
+  assert store.region("2", 1, 5).num_rows == 0
+
+  # variants without coordinates are only found by URN
+  table = store.urn("urn:mavedb:00000002-a-1", columns=["chr", "start", "score"])
+  assert table.to_pylist() == [{"chr": "1", "start": 150, "score": -1e-3},
+                               {"chr": "1", "start": 1500, "score": None},
+                               {"chr": "2", "start": None, "score": 2.0}]
+  assert store.urn("urn:mavedb:00000003-a-1").column("chr").to_pylist() == [None]
@@ -0,0 +1,211 @@
+"""
+Downloads of fetch_mavedb.py against a local MaveDB API (http.server): full
+and conditional (ETag/Last-Modified) responses, bodies streamed to disk,
+truncated responses, connection resets and stale keep-alive connections.
+
+Usage:
+  python3 -m pytest nextflow/MaveDB/tests
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+MAVEDB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(MAVEDB_DIR, "bin"))
+sys.path.insert(0, os.path.join(os.path.dirname(MAVEDB_DIR), "utils"))
+
+from mavedb import fetch  # noqa: E402
+
+LAST_MODIFIED = email.utils.formatdate(0, usegmt=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+  """
+  MaveDB API of the URNs in server.resources ({path: body}); paths in
+  server.faults fail their next requests, in order, with 'truncate' (half
+  of the body), 'reset' (connection closed without a response) or a status
+  """
+  protocol_version = "HTTP/1.1"
+  # idle keep-alive connections are closed after this many seconds
+  timeout = 0.2
+
+  def log_message(self, *args):
+    pass
+
+  def do_GET(self):
+    server = self.server
+    server.requests.append((self.path, dict(self.headers)))
+    body = server.resources.get(self.path)
+    faults = server.faults.get(self.path)
+    fault = faults.pop(0) if faults else None
+
+    if body is None:
+      return self.reply(404, b"not found")
+    if fault == "reset":
+      self.close_connection = True
+      return
+    if isinstance(fault, int):
+      return self.reply(fault, b"error")
+
+    if self.path.endswith("/scores"):
+      # revalidated by date
+      headers = {"Last-Modified": LAST_MODIFIED}
+      modified = self.headers.get("If-Modified-Since") != LAST_MODIFIED
+    else:
+      etag = '"' + hashlib.sha256(body).hexdigest() + '"'
+      headers = {"ETag": etag}
+      modified = self.headers.get("If-None-Match") != etag
+    if not modified:
+      return self.reply(304, b"", headers)
+    if fault == "truncate":
+      self.reply(200, body[:len(body) // 2], headers, length=len(body))
+      self.close_connection = True
+      return
+    self.reply(200, body, headers)
+
+  def reply(self, status, body, headers=None, length=None):
+    self.send_response(status)
+    for name, value in (headers or {}).items():
+      self.send_header(name, value)
+    self.send_header("Content-Length", str(len(body) if length is None else length))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+  server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+  server.daemon_threads = True
+  server.resources, server.faults, server.requests = {}, {}, []
+  server.base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v1"
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield server
+  server.shutdown()
+  server.server_close()
+
+
+def add_urn (server, urn, scores=b"accession,score\n"):
+  base = f"/api/v1/score-sets/{urn}"
+  server.resources[base] = json.dumps(
+    {"urn": urn, "license": {"shortName": "CC0"}}).encode()
+  server.resources[base + "/mapped-variants"] = json.dumps([{"urn": urn}]).encode()
+  server.resources[base + "/scores"] = scores
+  return base
+
+
+def fetch_all (server, urns, outdir, cache=None, retries=2):
+  return asyncio.run(fetch.fetch_all(urns, str(outdir), server.base_url,
+                                     cache and str(cache), concurrency=2,
+                                     retries=retries, backoff=0))
+
+
+def assert_downloaded (server, urn, outdir):
+  base = f"/api/v1/score-sets/{urn}"
+  for name, path in [fetch.METADATA] + fetch.DATA:
+    assert (outdir / urn / name).read_bytes() == server.resources[base + path]
+  assert (outdir / urn / "LICENCE.txt").read_text() == "CC0"
+  # only the final directories, without temporary files
+  assert not [f for f in os.listdir(outdir) if f.startswith(".")]
+
+
+def test_download_and_revalidate (server, tmp_path):
+  # scores bigger than a chunk, streamed to disk
+  scores = b"accession,score\n" + b"urn:mavedb:00000001-a-1#1,0.5\n" * 100000
+  assert len(scores) > fetch.CHUNK_SIZE
+  add_urn(server, "urn:mavedb:00000001-a-1", scores)
+  add_urn(server, "urn:mavedb:00000002-a-1")
+  urns = ["urn:mavedb:00000001-a-1", "urn:mavedb:00000002-a-1"]
+
+  fetcher, results = fetch_all(server, urns, tmp_path / "out", tmp_path / "cache")
+  assert results == {urn: "CC0" for urn in urns}
+  assert fetcher.stats["downloaded"] == 6 and fetcher.stats["not modified"] == 0
+  for urn in urns:
+    assert_downloaded(server, urn, tmp_path / "out")
+  assert not [f for f in os.listdir(tmp_path / "cache") if f.endswith(".tmp")]
+
+  # unchanged resources are revalidated (by ETag or date) and copied from the cache
+  server.requests.clear()
+  fetcher, results = fetch_all(server, urns, tmp_path / "out2", tmp_path / "cache")
+  assert fetcher.stats["downloaded"] == 0 and fetcher.stats["not modified"] == 6
+  for urn in urns:
+    assert_downloaded(server, urn, tmp_path / "out2")
+  headers = {path: headers for path, headers in server.requests}
+  assert "If-Modified-Since" in headers["/api/v1/score-sets/urn:mavedb:00000001-a-1/scores"]
+  assert "If-None-Match" in headers["/api/v1/score-sets/urn:mavedb:00000001-a-1"]
+
+  # a changed resource is downloaded again
+  base = "/api/v1/score-sets/urn:mavedb:00000002-a-1"
+  server.resources[base + "/mapped-variants"] = b"[]"
+  fetcher, _ = fetch_all(server, urns, tmp_path / "out3", tmp_path / "cache")
+  assert fetcher.stats["downloaded"] == 1 and fetcher.stats["not modified"] == 5
+  assert_downloaded(server, "urn:mavedb:00000002-a-1", tmp_path / "out3")
+
+
+def test_truncated_response (server, tmp_path):
+  base = add_urn(server, "urn:mavedb:00000001-a-1", b"accession,score\n" * 1000)
+  server.faults[base + "/scores"] = ["truncate"]
+
+  fetcher, results = fetch_all(server, ["urn:mavedb:00000001-a-1"], tmp_path / "out",
+                               tmp_path / "cache")
+  assert results == {"urn:mavedb:00000001-a-1": "CC0"}
+  assert fetcher.stats["retries"] == 1
+  assert_downloaded(server, "urn:mavedb:00000001-a-1", tmp_path / "out")
+
+  # truncated every time: the URN fails, without partial output or cache entries
+  server.faults[base] = ["truncate"] * 3
+  fetcher, results = fetch_all(server, ["urn:mavedb:00000001-a-1"], tmp_path / "out2",
+                               tmp_path / "cache2")
+  assert isinstance(results["urn:mavedb:00000001-a-1"], Exception)
+  assert os.listdir(tmp_path / "out2") == []
+  assert os.listdir(tmp_path / "cache2") == []
+
+
+def test_connection_reset (server, tmp_path):
+  base = add_urn(server, "urn:mavedb:00000001-a-1")
+  add_urn(server, "urn:mavedb:00000002-a-1")
+  server.faults[base] = ["reset"]
+  server.faults[base + "/scores"] = [503]
+
+  fetcher, results = fetch_all(server, ["urn:mavedb:00000001-a-1"], tmp_path / "out")
+  assert results == {"urn:mavedb:00000001-a-1": "CC0"}
+  assert fetcher.stats["retries"] == 2
+  assert_downloaded(server, "urn:mavedb:00000001-a-1", tmp_path / "out")
+
+  # errors that outlast the retries fail the URN only
+  server.faults[base + "/scores"] = [503] * 3
+  fetcher, results = fetch_all(server, ["urn:mavedb:00000001-a-1", "urn:mavedb:00000002-a-1"],
+                               tmp_path / "out2")
+  assert isinstance(results["urn:mavedb:00000001-a-1"], fetch.HTTPError)
+  assert results["urn:mavedb:00000002-a-1"] == "CC0"
+  assert os.listdir(tmp_path / "out2") == ["urn:mavedb:00000002-a-1"]
+
+
+def test_stale_connection (server, tmp_path):
+  base = add_urn(server, "urn:mavedb:00000001-a-1")
+
+  async def get_twice ():
+    pool = fetch.ConnectionPool(server.base_url, size=1)
+    fetcher = fetch.Fetcher(pool, retries=0)
+    try:
+      await fetcher.get("/score-sets/urn:mavedb:00000001-a-1", str(tmp_path / "1.json"))
+      # the server closes the idle connection in the meantime
+      await asyncio.sleep(Handler.timeout * 3)
+      await fetcher.get("/score-sets/urn:mavedb:00000001-a-1", str(tmp_path / "2.json"))
+    finally:
+      pool.close()
+    return fetcher
+
+  fetcher = asyncio.run(get_twice())
+  # reconnected without a retry (retries=0 would have failed)
+  assert fetcher.stats["retries"] == 0 and fetcher.stats["downloaded"] == 2
+  assert (tmp_path / "2.json").read_bytes() == server.resources[base]
@@ -0,0 +1,116 @@
+"""
+With --binary, merge_variants.py must write the same combined TSV as the
+pandas-based concatenation (process concatenate_files in output.nf). The
+pandas script is taken from output.nf and run on TSV files with the same
+rows as the record files given to merge_variants.
+
+Usage:
+  python3 -m pytest nextflow/MaveDB/tests
+"""
+
+import csv
+import glob
+import os
+import re
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+MAVEDB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(MAVEDB_DIR, "bin"))
+sys.path.insert(0, os.path.join(os.path.dirname(MAVEDB_DIR), "utils"))
+
+from mavedb.merge import merge_variants  # noqa: E402
+from mavedb.records import RecordWriter  # noqa: E402
+
+COLUMNS = ["chr", "start", "end", "ref", "alt", "hgvs", "urn", "publish_date",
+           "refseq", "pubmed", "accession", "nt", "splice", "pro", "score", "p-value"]
+
+# per file: columns and rows, with values as written by the mappers
+FILES = {
+  "map_1": (COLUMNS, [
+    ["1", "100", "100", "A", "G", "NC_000001.11:g.100A>G", "urn:mavedb:00000001-a-1",
+     "2024-01-01", "NM_000001.1", "123456", "urn:mavedb:00000001-a-1#1", "c.1A>G", "NA",
+     "p.Met1Val", "0.5", "NA"],
+    ["1", "200", "202", "AAA", "T", "NC_000001.11:g.200_202delinsT", "urn:mavedb:00000001-a-1",
+     "2024-01-01", "NM_000001.1", "NA", "urn:mavedb:00000001-a-1#2", "c.2A>T", "NA",
+     "p.Met1Val", "-1.25E-3", "0.01"],
+    ["X", "300", "300", "C", "T", "NC_000023.11:g.300C>T", "urn:mavedb:00000001-a-1",
+     "2024-01-01", "NM_000001.1", "123456", "urn:mavedb:00000001-a-1#3", "c.3C>T", "NA",
+     "p.=", "1", "1e-05"],
+  ]),
+  # integer scores, booleans, quoted and blank values
+  "map_2": (COLUMNS[:14] + ["score", "sd", "significant"], [
+    ["2", "5", "5", "G", "A", "NC_000002.12:g.5G>A", "urn:mavedb:00000002-a-1", "2023",
+     "NM_000002.1", "654321", "urn:mavedb:00000002-a-1#1", "c.5G>A", "", 'p.(Gly2"Ser)',
+     "3", "007", "true"],
+    ["2", "6", "6", "G", "C", "NC_000002.12:g.6G>C", "urn:mavedb:00000002-a-1", "2023",
+     "NM_000002.1", "654321", "urn:mavedb:00000002-a-1#2", "c.6G>C", "NA", "p.Gly2Ala\tx",
+     "-0", "+5", "False"],
+  ]),
+  # without pubmed and p-value; integer coordinates with a missing value
+  "map_3": ([c for c in COLUMNS if c not in ("pubmed", "p-value")], [
+    ["3", "10", "", "T", "TA", "NC_000003.12:g.10_11insA", "urn:mavedb:00000003-a-1",
+     "2022", "NM_000003.1", "urn:mavedb:00000003-a-1#1", "c.10_11insA", "NA", "NA", "inf"],
+    ["3", "12", "12", "T", "C", "NC_000003.12:g.12T>C", "urn:mavedb:00000003-a-1",
+     "2022", "NM_000003.1", "urn:mavedb:00000003-a-1#2", "c.12T>C", "NA", "NA", "NaN"],
+  ]),
+  # floats with more digits than a double (parsed like the pandas C parser,
+  # not like float()) and duplicate column names
+  "map_5": (COLUMNS[:14] + ["score", "score"], [
+    ["5", "7", "7", "C", "G", "NC_000005.10:g.7C>G", "urn:mavedb:00000005-a-1", "2021",
+     "NM_000005.1", "NA", "urn:mavedb:00000005-a-1#1", "c.7C>G", "NA", "p.Ala3Gly",
+     "0.604876475938242194", "1"],
+    ["5", "8", "8", "C", "T", "NC_000005.10:g.8C>T", "urn:mavedb:00000005-a-1", "2021",
+     "NM_000005.1", "NA", "urn:mavedb:00000005-a-1#2", "c.8C>T", "NA", "p.Ala3Val",
+     "-1.00000000000000011102230246251565404236316680908203125", "2"],
+  ]),
+}
+
+
+def concatenate_files_script ():
+  """Python script of process concatenate_files, as run by Nextflow"""
+  with open(os.path.join(MAVEDB_DIR, "nf_modules", "output.nf")) as f:
+    process = f.read().split("process concatenate_files {")[1]
+  script = re.search(r'"""\n(.*?)"""', process, re.DOTALL).group(1)
+  escapes = {"t": "\t", "n": "\n", "\\": "\\", "$": "$", '"': '"'}
+  return textwrap.dedent(re.sub(r"\\(.)", lambda m: escapes[m.group(1)], script))
+
+
+def test_merge_variants_matches_pandas (tmp_path):
+  pytest.importorskip("pandas")
+
+  for name, (columns, rows) in FILES.items():
+    with open(tmp_path / f"{name}.tsv", "w", newline="") as f:
+      writer = csv.writer(f, delimiter="\t", lineterminator="\n")
+      writer.writerow(columns)
+      writer.writerows(rows)
+    with RecordWriter(tmp_path / f"{name}.rec", columns) as writer:
+      for row in rows:
+        writer.write(row)
+  # fallback of a URN without variants
+  (tmp_path / "map_4.tsv").write_text("\n")
+  (tmp_path / "map_4.rec").write_text("\n")
+
+  script = tmp_path / "concatenate_files.py"
+  script.write_text(concatenate_files_script())
+  subprocess.run([sys.executable, str(script)], cwd=tmp_path, check=True,
+                 stdout=subprocess.DEVNULL)
+
+  # same order of files as the pandas script
+  files = glob.glob("*map_*.tsv", root_dir=tmp_path)
+  records = [tmp_path / f.replace(".tsv", ".rec") for f in files]
+  rows = merge_variants(records, tmp_path / "merged.tsv")
+
+  assert rows == sum(len(rows) for columns, rows in FILES.values())
+  merged = (tmp_path / "merged.tsv").read_text()
+  assert merged == (tmp_path / "combined.tsv").read_text()
+
+  lines = [line.split("\t") for line in merged.splitlines()]
+  header = lines[0]
+  assert header.count("score") == 1 and "score.1" in header
+  map_5 = [dict(zip(header, line)) for line in lines if line[0] == "5"]
+  assert [(row["score"], row["score.1"]) for row in map_5] == [
+    ("0.6048764759382421", "1"), ("-1.0", "2")]
@@ -0,0 +1,96 @@
+"""
+Variant Recoder cache (vr_cache.py): expiry of HGVSp without variants,
+namespaces, shards merged into the cache and read-only lookups.
+
+Usage:
+  python3 -m pytest nextflow/MaveDB/tests
+"""
+
+import os
+import sys
+import time
+
+MAVEDB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(MAVEDB_DIR, "bin"))
+sys.path.insert(0, os.path.join(os.path.dirname(MAVEDB_DIR), "utils"))
+
+from mavedb.vr_cache import VRCache, failed_hgvs  # noqa: E402
+
+NAMESPACE = "114_GRCh38"
+VARIANT = ("1", "100", 100, "A", "G")
+
+
+def test_expire (tmp_path, monkeypatch):
+  cache = VRCache(tmp_path / "cache.db", NAMESPACE)
+  now = time.time()
+  monkeypatch.setattr(time, "time", lambda: now - 10 * 86400)
+  cache.add({"NP_1:p.Ala1Gly": [VARIANT], "NP_1:p.Ala2Gly": []})
+  monkeypatch.setattr(time, "time", lambda: now)
+  cache.add({"NP_1:p.Ala3Gly": []})
+
+  hgvs = ["NP_1:p.Ala1Gly", "NP_1:p.Ala2Gly", "NP_1:p.Ala3Gly", "NP_1:p.Ala4Gly"]
+  # HGVSp with variants never expire, those without after expire days
+  assert cache.missing(hgvs, expire=30) == ["NP_1:p.Ala4Gly"]
+  assert cache.missing(hgvs, expire=5) == ["NP_1:p.Ala2Gly", "NP_1:p.Ala4Gly"]
+  assert cache.missing(hgvs, expire=0) == ["NP_1:p.Ala2Gly", "NP_1:p.Ala3Gly", "NP_1:p.Ala4Gly"]
+
+  assert cache.variants("NP_1:p.Ala1Gly") == [VARIANT]
+  assert cache.variants("NP_1:p.Ala2Gly") == []
+  assert cache.variants("NP_1:p.Ala4Gly") is None
+
+
+def test_namespaces (tmp_path):
+  path = tmp_path / "cache.db"
+  VRCache(path, NAMESPACE).add({"NP_1:p.Ala1Gly": [VARIANT]})
+  VRCache(path, "113_GRCh37").add({"NP_1:p.Ala1Gly": []})
+
+  assert VRCache(path, NAMESPACE).variants("NP_1:p.Ala1Gly") == [VARIANT]
+  assert VRCache(path, "113_GRCh37").variants("NP_1:p.Ala1Gly") == []
+  assert VRCache(path, "115_GRCh38").missing(["NP_1:p.Ala1Gly"]) == ["NP_1:p.Ala1Gly"]
+
+
+def test_failed_hgvs (tmp_path):
+  failed = ["Unable to parse HGVS notation 'NP_1:p.Xaa1Gly': Could not parse",
+            "Line NP_1:p.Ala5Gly skipped."]
+  assert {"NP_1:p.Xaa1Gly", "NP_1:p.Ala5Gly"} <= failed_hgvs(failed)
+
+  # only HGVSp sent to Variant Recoder are stored as failed
+  cache = VRCache(tmp_path / "cache.db", NAMESPACE)
+  hgvs = ["NP_1:p.Xaa1Gly", "NP_1:p.Ala5Gly", "NP_1:p.Ala6Gly"]
+  assert cache.add({}, hgvs, failed) == 2
+  assert cache.missing(hgvs) == ["NP_1:p.Ala6Gly"]
+  assert cache.variants("Unable") is None
+
+
+def test_merge_shards (tmp_path):
+  path = tmp_path / "cache.db"
+  VRCache(path, NAMESPACE).add({"NP_1:p.Ala1Gly": [], "NP_1:p.Ala2Gly": [VARIANT]})
+
+  shard_1 = VRCache(tmp_path / "shard_1.db", NAMESPACE)
+  shard_1.add({"NP_1:p.Ala1Gly": [VARIANT, VARIANT[:4] + ("T",)]})
+  shard_2 = VRCache(tmp_path / "shard_2.db", "113_GRCh37")
+  shard_2.add({"NP_1:p.Ala3Gly": [VARIANT]})
+
+  cache = VRCache(path, NAMESPACE)
+  assert cache.merge([tmp_path / "shard_1.db", tmp_path / "shard_2.db"]) == 1
+  # results of the shard replace those of the cache; other namespaces are left out
+  assert cache.variants("NP_1:p.Ala1Gly") == [VARIANT, VARIANT[:4] + ("T",)]
+  assert cache.variants("NP_1:p.Ala2Gly") == [VARIANT]
+  assert VRCache(path, "113_GRCh37").variants("NP_1:p.Ala3Gly") is None
+
+
+def test_readonly (tmp_path):
+  path = tmp_path / "cache.db"
+  # a cache that does not exist yet is empty, and is not created
+  assert VRCache(path, NAMESPACE, readonly=True).missing(["NP_1:p.Ala1Gly"]) == ["NP_1:p.Ala1Gly"]
+  assert not path.exists()
+
+  VRCache(path, NAMESPACE).add({"NP_1:p.Ala1Gly": [VARIANT], "NP_1:p.Ala2Gly": []})
+  cache = VRCache(path, NAMESPACE, readonly=True)
+  assert cache.missing(["NP_1:p.Ala1Gly", "NP_1:p.Ala3Gly"]) == ["NP_1:p.Ala3Gly"]
+
+  # results not merged yet are looked up first
+  matches = cache.matches({"NP_1:p.Ala3Gly": [VARIANT]})
+  assert "NP_1:p.Ala1Gly" in matches and "NP_1:p.Ala3Gly" in matches
+  assert "NP_1:p.Ala2Gly" not in matches
+  assert matches["NP_1:p.Ala3Gly"][0]["start"] == "100"
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Start-up benchmark for the Python scripts in the Nextflow bin/ directories
+
+Every Nextflow task pays for interpreter start-up plus module imports, so the
+scripts should only import what they need to parse their arguments. This
+runs each script with `python -X importtime <script> --help`, reports the
+total import time and the slowest top-level imports, and fails if a script
+is over its budget or imports a module that should be deferred.
+
+Usage:
+  python3 nextflow/benchmarks/startup.py [--repeat 5] [--scale 1.5]
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+NEXTFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# shared modules are on the PYTHONPATH of the tasks (see nextflow.config)
+ENV = dict(os.environ, PYTHONPATH=os.path.join(NEXTFLOW_DIR, "utils"))
+
+# import time budget (ms) per script, as measured with --help
+BUDGETS = {
+  "MaveDB/bin/map_scores_to_variants.py"           : 60,
+  "MaveDB/bin/map_scores_to_variants_fromfiles.py" : 60,
+  "MaveDB/bin/liftover.py"                         : 60,
+  "MaveDB/bin/extract_metadata.py"                 : 60,
+  "MaveDB/bin/vr_cache.py"                         : 60,
+  "MaveDB/bin/manifest.py"                         : 60,
+  "MaveDB/bin/fetch_mavedb.py"                     : 200, # asyncio; runs once per pipeline
+  "MaveDB/bin/to_parquet.py"                       : 60,
+  "MaveDB/bin/merge_variants.py"                   : 60,
+  "MaveDB/bin/catalogue.py"                        : 60,
+  "pangenomes/bin/create_pangenomes_annotation.py" : 60,
+}
+
+# modules that should only be imported when they are used
+DEFERRED = ["pandas", "numpy", "pyarrow", "pyliftover", "urllib.request"]
+
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)")
+
+
+def measure(script):
+  """Run script --help with -X importtime; returns top-level imports as {module: us}"""
+  res = subprocess.run([sys.executable, "-X", "importtime", script, "--help"],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                       universal_newlines=True, env=ENV)
+  if res.returncode != 0:
+    raise Exception(f"{script} --help exited with status {res.returncode}:\n{res.stderr}")
+
+  imports = {}
+  for line in res.stderr.splitlines():
+    match = IMPORTTIME.match(line)
+    # top-level imports are indented by a single space
+    if match and len(match.group(3)) == 1:
+      imports[match.group(4)] = int(match.group(2))
+  return imports, res.stderr
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Check the import time of the Nextflow Python scripts against their budgets")
+  parser.add_argument("--repeat", type=int, default=5,
+                      help="number of runs per script; the median is reported (default: 5)")
+  parser.add_argument("--scale", type=float, default=1.0,
+                      help="multiply all budgets by this factor, e.g. on slow machines (default: 1)")
+  parser.add_argument("--top", type=int, default=5,
+                      help="number of slowest top-level imports to report (default: 5)")
+  args = parser.parse_args()
+
+  failed = False
+  for script, budget in BUDGETS.items():
+    path = os.path.join(NEXTFLOW_DIR, script)
+    runs = [measure(path) for _ in range(args.repeat)]
+    totals = [sum(imports.values()) / 1000 for imports, _ in runs]
+    total = statistics.median(totals)
+    budget = budget * args.scale
+
+    status = "OK" if total <= budget else "OVER BUDGET"
+    print(f"{script}: {total:.1f} ms (budget: {budget:.0f} ms) {status}")
+
+    imports, stderr = runs[-1]
+    slowest = sorted(imports.items(), key=lambda x: x[1], reverse=True)[:args.top]
+    for module, us in slowest:
+      print(f"  {us / 1000:8.1f} ms  {module}")
+
+    imported = {match.group(4) for match in map(IMPORTTIME.match, stderr.splitlines()) if match}
+    deferred = [module for module in DEFERRED if module in imported]
+    if deferred:
+      print(f"  imports modules that should be deferred: {', '.join(deferred)}")
+
+    failed = failed or total > budget or bool(deferred)
+
+  sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+  main()
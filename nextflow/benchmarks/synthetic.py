@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Synthetic inputs for the pipeline benchmarks
+
+Writes deterministic (seeded) files shaped like the real inputs of the
+pangenomes annotation and MaveDB liftover steps, at a configurable scale:
+
+  assembly GTF          genes with transcripts and exons; a fraction of genes
+                        is unnamed and gene symbols can be shared by several
+                        genes (e.g. copies in a pangenome assembly)
+  GO reference (GFF)    lines per gene symbol, keyed by ID=<symbol>
+  phenotypes (GVF)      lines per reference gene, keyed by id=<gene>
+  gene symbols          lookup table of gene symbol to reference gene
+  UCSC chain file       one chain per chromosome with gapped blocks
+  mapped variants       MaveDB mapper output (TSV or records) whose
+                        coordinates all fall within the chain blocks
+
+Usage:
+  python3 nextflow/benchmarks/synthetic.py --outdir inputs/ [--size release] [--genes 1000]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+
+NEXTFLOW_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHROMOSOMES = [str(i) for i in range(1, 23)] + ["X", "Y"]
+BASES = "ACGT"
+
+# close to a GRCh38 Ensembl release (~62k genes, ~250k transcripts, ~1.6M exons)
+SIZES = {
+  "small"   : dict(genes=2000, transcripts=4, exons=6, variants=20000, blocks=200),
+  "release" : dict(genes=62000, transcripts=4, exons=6, variants=1000000, blocks=5000),
+}
+
+DEFAULTS = dict(
+  named=0.7,          # fraction of genes with a gene symbol
+  copies=2,           # genes per gene symbol
+  go_lines=3,         # mean GO lines per gene symbol
+  go_terms=8,         # GO terms per line
+  go_coverage=0.8,    # fraction of gene symbols with GO terms
+  pheno_lines=2,      # mean phenotype lines per reference gene
+  pheno_coverage=0.3, # fraction of gene symbols with phenotypes
+  block_size=5000,    # chain block length
+  gap=200,            # mean gap between chain blocks
+  seed=1,
+)
+
+# file names of a dataset, as expected by the pipeline scripts
+FILES = dict(
+  gtf="synthetic-gca_000000001.1.gtf",
+  go="go_terms.gff",
+  phenotypes="phenotypes.gvf",
+  symbols="gene_symbols.tsv",
+  chain="hg19ToHg38.over.chain.gz",
+  metadata="metadata.json",
+  variants_tsv="mapped_variants.tsv",
+  variants_records="mapped_variants.rec",
+)
+
+VARIANT_COLUMNS = ["chr", "start", "end", "ref", "alt", "hgvs", "urn", "publish_date",
+                   "refseq", "pubmed", "accession", "nt", "splice", "pro", "score"]
+
+
+def _mean_count(rng, mean):
+  """Random count between 1 and 2 * mean - 1"""
+  return rng.randint(1, max(1, 2 * mean - 1))
+
+
+def _symbol(gene, params):
+  return f"GENE{gene // params['copies']}"
+
+
+def write_gtf(f, params, rng):
+  """Assembly GTF; returns the number of lines"""
+  genes, lines = params['genes'], 0
+  per_chr = -(-genes // len(CHROMOSOMES))
+  with open(f, 'w') as out:
+    out.write("#!genome-build synthetic\n")
+    for g in range(genes):
+      chr = CHROMOSOMES[g // per_chr]
+      start = (g % per_chr) * 50000 + rng.randint(1, 20000)
+      end = start + rng.randint(2000, 25000)
+      gene = f'gene_id "ENSG{g:011d}"; gene_version "1"; '
+      if rng.random() < params['named']:
+        gene += f'gene_name "{_symbol(g, params)}"; '
+      gene += 'gene_source "ensembl"; gene_biotype "protein_coding";'
+      out.write(f"{chr}\tensembl\tgene\t{start}\t{end}\t.\t+\t.\t{gene}\n")
+      lines += 1
+
+      for t in range(_mean_count(rng, params['transcripts'])):
+        transcript = (f'{gene} transcript_id "ENST{g:08d}{t:03d}"; transcript_version "1"; '
+                      f'transcript_biotype "protein_coding"; tag "basic";')
+        out.write(f"{chr}\tensembl\ttranscript\t{start + t}\t{end}\t.\t+\t.\t{transcript}\n")
+        lines += 1
+
+        exons = _mean_count(rng, params['exons'])
+        size = (end - start - t) // exons
+        for e in range(exons):
+          exon_start = start + t + e * size
+          out.write(f"{chr}\tensembl\texon\t{exon_start}\t{exon_start + size // 2}\t.\t+\t.\t"
+                    f'{transcript} exon_number "{e + 1}";\n')
+          lines += 1
+  return lines
+
+
+def write_go(f, params, rng):
+  """GO terms reference, keyed by gene symbol; returns the number of lines"""
+  lines = 0
+  with open(f, 'w') as out:
+    out.write("##gff-version 1.10\n")
+    for s in range(-(-params['genes'] // params['copies'])):
+      if rng.random() >= params['go_coverage']:
+        continue
+      for _ in range(_mean_count(rng, params['go_lines'])):
+        terms = ",".join(f"GO:{rng.randint(1, 9999999):07d}" for _ in range(params['go_terms']))
+        out.write(f"1\tGO\ttranscript\t{s + 1}\t{s + 1000}\t.\t+\t.\t"
+                  f"ID=GENE{s};Ontology_term={terms}\n")
+        lines += 1
+  return lines
+
+
+def write_phenotypes(f, symbols, params, rng):
+  """
+  Phenotypes reference, keyed by reference gene, and lookup table of gene
+  symbol to reference gene; returns the number of lines of both
+  """
+  lines = entries = 0
+  with open(f, 'w') as out, open(symbols, 'w') as lookup:
+    for s in range(-(-params['genes'] // params['copies'])):
+      lookup.write(f"GENE{s}\tENSG_REF{s:011d}\n")
+      entries += 1
+      if rng.random() >= params['pheno_coverage']:
+        continue
+      for p in range(_mean_count(rng, params['pheno_lines'])):
+        out.write(f"1\tPheno\tgene\t{s + 1}\t{s + 1000}\t.\t+\t.\t"
+                  f"id=ENSG_REF{s:011d}; phenotype=Disease {s} type {p}; source=synthetic\n")
+        lines += 1
+  return lines, entries
+
+
+def write_chain(f, params, rng):
+  """
+  UCSC chain file (hg19 to hg38) with one chain per chromosome; returns the
+  aligned blocks of each chromosome as {chr: [(start, end)]} (0-based, hg19)
+  """
+  blocks = {}
+  with gzip.open(f, 'wt') as out:
+    for i, chr in enumerate(CHROMOSOMES):
+      sizes = [params['block_size']] * params['blocks']
+      gaps = [(rng.randint(0, 2 * params['gap']), rng.randint(0, 2 * params['gap']))
+              for _ in range(params['blocks'] - 1)]
+      t_start, q_start = 10000, 10000 + 1000 * (i + 1)
+      t_end = t_start + sum(sizes) + sum(dt for dt, dq in gaps)
+      q_end = q_start + sum(sizes) + sum(dq for dt, dq in gaps)
+
+      out.write(f"chain {sum(sizes)} chr{chr} {t_end + 10000} + {t_start} {t_end} "
+                f"chr{chr} {q_end + 10000} + {q_start} {q_end} {i + 1}\n")
+      blocks[chr], pos = [], t_start
+      for size, (dt, dq) in zip(sizes, gaps):
+        out.write(f"{size}\t{dt}\t{dq}\n")
+        blocks[chr].append((pos, pos + size))
+        pos += size + dt
+      out.write(f"{sizes[-1]}\n\n")
+      blocks[chr].append((pos, pos + sizes[-1]))
+  return blocks
+
+
+def variant_rows(blocks, params, rng):
+  """Mapped variants (lists of values of VARIANT_COLUMNS) within the chain blocks"""
+  urn = "urn:mavedb:00000001-a-1"
+  positions = []
+  for _ in range(params['variants']):
+    chr = rng.choice(CHROMOSOMES)
+    start, end = rng.choice(blocks[chr])
+    positions.append((CHROMOSOMES.index(chr), rng.randint(start + 1, end - 3)))
+  positions.sort()
+
+  for i, (c, start) in enumerate(positions):
+    chr = CHROMOSOMES[c]
+    ref = rng.choice(BASES)
+    alt = rng.choice(BASES.replace(ref, "")) * rng.choice((1, 1, 1, 2, 3))
+    end = start + len(alt) - 1
+    yield [chr, str(start), str(end), ref, alt, f"NC_0000{c + 1:02d}.10:g.{start}{ref}>{alt}",
+           urn, "2020-01-01", "NM_000000.1", "123456", f"{urn}#{i + 1}",
+           f"c.{i + 1}{ref}>{alt}", "NA", f"p.Ala{i // 3 + 1}Gly", f"{rng.gauss(0, 1):.6f}"]
+
+
+def write_variants(f, blocks, params, rng, format='tsv'):
+  """Mapped variants as TSV or records; returns the number of variants"""
+  rows = variant_rows(blocks, params, rng)
+  if format == 'records':
+    # imported here: the record format is part of the MaveDB pipeline code
+    sys.path.insert(0, os.path.join(NEXTFLOW_DIR, "MaveDB", "bin"))
+    from mavedb.records import RecordWriter
+    with RecordWriter(f, VARIANT_COLUMNS) as writer:
+      for row in rows:
+        writer.write(row)
+    return writer.rows
+
+  n = 0
+  with open(f, 'w') as out:
+    out.write("\t".join(VARIANT_COLUMNS) + "\n")
+    for row in rows:
+      out.write("\t".join(row) + "\n")
+      n += 1
+  return n
+
+
+def parameters(size="small", **overrides):
+  """Parameters of a dataset of the given size, with overrides (ignoring None)"""
+  params = dict(DEFAULTS, **SIZES[size])
+  params.update({k: v for k, v in overrides.items() if v is not None})
+  return params
+
+
+def write_dataset(outdir, params, parts=("annotation", "liftover")):
+  """Write the inputs of the given parts to outdir; returns the paths and line counts"""
+  os.makedirs(outdir, exist_ok=True)
+  files = {name: os.path.join(outdir, f) for name, f in FILES.items()}
+  counts = {}
+
+  if "annotation" in parts:
+    rng = random.Random(params['seed'])
+    counts['gtf'] = write_gtf(files['gtf'], params, rng)
+    counts['go'] = write_go(files['go'], params, rng)
+    counts['phenotypes'], counts['symbols'] = write_phenotypes(
+      files['phenotypes'], files['symbols'], params, rng)
+
+  if "liftover" in parts:
+    rng = random.Random(params['seed'])
+    blocks = write_chain(files['chain'], params, rng)
+    counts['chain'] = sum(len(b) for b in blocks.values())
+    with open(files['metadata'], 'w') as f:
+      json.dump({"extraMetadata": {"reference": "hg19"}}, f)
+    # same variants in both formats
+    for format in ('tsv', 'records'):
+      counts['variants'] = write_variants(files[f'variants_{format}'], blocks, params,
+                                          random.Random(params['seed'] + 1), format)
+  return files, counts
+
+
+def add_arguments(parser):
+  parser.add_argument("--size", choices=SIZES, default="small",
+                      help="preset dataset size (default: small)")
+  parser.add_argument("--seed", type=int, help="random seed (default: 1)")
+  for name in ("genes", "transcripts", "exons", "variants", "blocks", "copies",
+               "go_lines", "go_terms", "pheno_lines", "block_size", "gap"):
+    parser.add_argument(f"--{name}", type=int,
+                        help=f"override the preset {name} (see synthetic.py)")
+  for name in ("named", "go_coverage", "pheno_coverage"):
+    parser.add_argument(f"--{name}", type=float,
+                        help=f"override the default {name} (see synthetic.py)")
+
+
+def dataset_parameters(args):
+  names = list(DEFAULTS) + list(SIZES["small"])
+  return parameters(args.size, **{name: getattr(args, name) for name in names})
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Write synthetic inputs for the pangenomes annotation and liftover benchmarks")
+  parser.add_argument("--outdir", required=True, help="output directory")
+  parser.add_argument("--parts", default="annotation,liftover",
+                      help="comma-separated inputs to write (default: annotation,liftover)")
+  add_arguments(parser)
+  args = parser.parse_args()
+
+  files, counts = write_dataset(args.outdir, dataset_parameters(args), args.parts.split(","))
+  for name, count in counts.items():
+    print(f"{name}: {count}")
+
+
+if __name__ == "__main__":
+  main()
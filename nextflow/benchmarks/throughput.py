@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the pangenomes annotation and MaveDB liftover steps
+
+Generates synthetic inputs (see synthetic.py) at a preset or custom scale,
+runs each case with telemetry enabled and reports, per stage, the wall time,
+throughput (input rows and bytes read per second) and peak RSS. Results can
+be saved as a baseline and later runs checked against it: the check fails if
+a stage is slower or uses more memory than the baseline allows, or if it
+outputs a different number of rows.
+
+Cases:
+  annotation-go           create_pangenomes_annotation.py --go
+  annotation-phenotypes   create_pangenomes_annotation.py --pheno --gene_symbols
+  liftover-tsv            liftover.py on mapped variants (TSV)
+  liftover-records        liftover.py on mapped variants (binary records)
+
+Usage:
+  python3 nextflow/benchmarks/throughput.py --size release --save baseline.json
+  python3 nextflow/benchmarks/throughput.py --size release --baseline baseline.json
+
+Baselines depend on the machine, so only compare runs on the same host.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+import synthetic
+
+NEXTFLOW_DIR = synthetic.NEXTFLOW_DIR
+ANNOTATION = os.path.join(NEXTFLOW_DIR, "pangenomes", "bin", "create_pangenomes_annotation.py")
+LIFTOVER = os.path.join(NEXTFLOW_DIR, "MaveDB", "bin", "liftover.py")
+
+
+def annotation_go(files, outdir):
+  return [ANNOTATION, "--version", "1", "--gtf", files['gtf'], "--go", files['go'],
+          "--outdir", outdir]
+
+
+def annotation_phenotypes(files, outdir):
+  return [ANNOTATION, "--version", "1", "--gtf", files['gtf'], "--pheno", files['phenotypes'],
+          "--gene_symbols", files['symbols'], "--outdir", outdir]
+
+
+def liftover(format):
+  def command(files, outdir):
+    # liftover.py reads the chain from and writes liftover_<input> to the working directory
+    mapped = os.path.join(outdir, os.path.basename(files[f'variants_{format}']))
+    shutil.copyfile(files[f'variants_{format}'], mapped)
+    shutil.copyfile(files['chain'], os.path.join(outdir, os.path.basename(files['chain'])))
+    return [LIFTOVER, "--metadata", files['metadata'],
+            "--mapped_variants", os.path.basename(mapped), "--reference", "hg38"]
+  return command
+
+
+# case: (inputs needed, command to run in an empty output directory)
+CASES = {
+  "annotation-go"         : ("annotation", annotation_go),
+  "annotation-phenotypes" : ("annotation", annotation_phenotypes),
+  "liftover-tsv"          : ("liftover", liftover("tsv")),
+  "liftover-records"      : ("liftover", liftover("records")),
+}
+
+
+def run_case(command, files, workdir):
+  """Run a case once; returns its telemetry"""
+  outdir = tempfile.mkdtemp(dir=workdir)
+  try:
+    sidecar = os.path.join(outdir, "telemetry.json")
+    args = command(files, outdir)
+    # shared modules are on the PYTHONPATH of the tasks (see nextflow.config)
+    env = dict(os.environ, PIPELINE_TELEMETRY=sidecar,
+               PYTHONPATH=os.path.join(NEXTFLOW_DIR, "utils"))
+    env.pop("PIPELINE_PROFILE", None)
+    res = subprocess.run([sys.executable] + args, cwd=outdir, env=env,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                         universal_newlines=True)
+    if res.returncode != 0:
+      raise Exception(f"{' '.join(args)} exited with status {res.returncode}:\n{res.stderr}")
+    with open(sidecar) as f:
+      return json.load(f)
+  finally:
+    shutil.rmtree(outdir)
+
+
+def summarise(runs):
+  """Median wall time and peak RSS of each stage over runs"""
+  def median(values):
+    values = [v for v in values if v is not None]
+    return statistics.median(values) if values else None
+
+  stages = {}
+  for stage in runs[0]['stages']:
+    name = stage['name']
+    same = [s for run in runs for s in run['stages'] if s['name'] == name]
+    stages[name] = {"wall_time"  : median(s['wall_time'] for s in same),
+                    "peak_rss"   : median(s['peak_rss'] for s in same),
+                    "rows_in"    : stage['rows_in'],
+                    "rows_out"   : stage['rows_out'],
+                    "bytes_read" : median(s['bytes_read'] for s in same)}
+  return {"wall_time" : median(run['wall_time'] for run in runs),
+          "peak_rss"  : median(run['peak_rss'] for run in runs),
+          "stages"    : stages}
+
+
+def _rate(count, seconds):
+  return count / seconds if count and seconds else 0
+
+
+def report(case, result):
+  print(f"{case}: {result['wall_time']:.2f} s, peak RSS {(result['peak_rss'] or 0) / 2**20:.0f} MB")
+  for name, stage in result['stages'].items():
+    # rows processed: input rows, or output rows of stages without input rows (e.g. writing)
+    rows = _rate(stage['rows_in'] or stage['rows_out'], stage['wall_time'])
+    mb = _rate(stage['bytes_read'], stage['wall_time']) / 2**20
+    print(f"  {name:<32} {stage['wall_time']:8.3f} s {rows:12,.0f} rows/s "
+          f"{mb:8.1f} MB/s {(stage['peak_rss'] or 0) / 2**20:8.0f} MB")
+
+
+def compare(case, result, baseline, args):
+  """Regressions of result compared to its baseline, as messages"""
+  regressions = []
+  for name, stage in result['stages'].items():
+    base = baseline['stages'].get(name)
+    if base is None:
+      continue
+    if stage['rows_out'] != base['rows_out']:
+      regressions.append(f"{case}: {name}: {stage['rows_out']} rows out "
+                         f"(baseline: {base['rows_out']})")
+    if (stage['wall_time'] > base['wall_time'] * (1 + args.tolerance) and
+        stage['wall_time'] - base['wall_time'] > args.min_time):
+      regressions.append(f"{case}: {name}: {stage['wall_time']:.3f} s "
+                         f"(baseline: {base['wall_time']:.3f} s)")
+    if (stage['peak_rss'] and base['peak_rss'] and
+        stage['peak_rss'] > base['peak_rss'] * (1 + args.rss_tolerance) and
+        stage['peak_rss'] - base['peak_rss'] > args.min_rss * 2**20):
+      regressions.append(f"{case}: {name}: peak RSS {stage['peak_rss'] / 2**20:.0f} MB "
+                         f"(baseline: {base['peak_rss'] / 2**20:.0f} MB)")
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(
+    description="Measure throughput and peak RSS of the annotation and liftover steps on synthetic inputs")
+  parser.add_argument("--cases", default=",".join(CASES),
+                      help=f"comma-separated cases to run (default: {','.join(CASES)})")
+  parser.add_argument("--repeat", type=int, default=3,
+                      help="number of runs per case; the median is reported (default: 3)")
+  parser.add_argument("--workdir", help="directory to write inputs to and keep them in "
+                                        "(default: temporary directory)")
+  parser.add_argument("--save", help="save the results as a baseline to this JSON file")
+  parser.add_argument("--baseline", help="check the results against this baseline JSON file")
+  parser.add_argument("--tolerance", type=float, default=0.25,
+                      help="allowed relative increase of stage wall time (default: 0.25)")
+  parser.add_argument("--min_time", type=float, default=0.05,
+                      help="ignore stage wall time increases below this (seconds; default: 0.05)")
+  parser.add_argument("--rss_tolerance", type=float, default=0.15,
+                      help="allowed relative increase of stage peak RSS (default: 0.15)")
+  parser.add_argument("--min_rss", type=float, default=8,
+                      help="ignore stage peak RSS increases below this (MB; default: 8)")
+  synthetic.add_arguments(parser)
+  args = parser.parse_args()
+
+  cases = args.cases.split(",")
+  unknown = [case for case in cases if case not in CASES]
+  if unknown:
+    parser.error(f"unknown cases: {', '.join(unknown)}")
+  params = synthetic.dataset_parameters(args)
+
+  baseline = None
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    if baseline['params'] != params:
+      sys.exit(f"ERROR: baseline {args.baseline} was measured with different inputs: "
+               f"{baseline['params']}")
+
+  workdir = args.workdir or tempfile.mkdtemp(prefix="throughput.")
+  try:
+    print(f"Writing synthetic inputs to {workdir}...", flush=True)
+    parts = sorted({CASES[case][0] for case in cases})
+    files, counts = synthetic.write_dataset(os.path.join(workdir, "inputs"), params, parts)
+    print(", ".join(f"{name}: {count:,}" for name, count in counts.items()), flush=True)
+
+    results = {}
+    for case in cases:
+      runs = [run_case(CASES[case][1], files, workdir) for _ in range(args.repeat)]
+      results[case] = summarise(runs)
+      report(case, results[case])
+  finally:
+    if not args.workdir:
+      shutil.rmtree(workdir)
+
+  if args.save:
+    with open(args.save, "w") as f:
+      json.dump({"params"  : params,
+                 "python"  : platform.python_version(),
+                 "machine" : platform.node(),
+                 "cases"   : results}, f, indent=2)
+      f.write("\n")
+    print(f"Saved baseline to {args.save}")
+
+  if baseline is not None:
+    regressions = []
+    for case, result in results.items():
+      if case in baseline['cases']:
+        regressions += compare(case, result, baseline['cases'][case], args)
+    for regression in regressions:
+      print(f"REGRESSION: {regression}")
+    if regressions:
+      sys.exit(1)
+    print(f"No regressions compared to {args.baseline}")
+
+
+if __name__ == "__main__":
+  main()
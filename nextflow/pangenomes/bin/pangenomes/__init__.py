@@ -0,0 +1,6 @@
+"""
+Python code of the pangenomes pipeline
+
+The scripts in bin/ are thin entry points over these modules, which only use
+the standard library so that start-up (and --help) stays fast.
+"""
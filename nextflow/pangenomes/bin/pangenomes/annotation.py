@@ -0,0 +1,189 @@
+"""
+Create GO or Phenotypes plugin annotation for a pangenome assembly
+
+The GO terms or phenotypes are loaded into a table of gene symbol to
+annotations, which the assembly annotation is streamed through: only its
+matching lines are kept (to sort them by genomic position) and each is
+expanded into its annotations while writing the output.
+"""
+
+import argparse
+import re
+import os
+
+import telemetry
+
+COLUMNS = ['chr', 'source', 'feature', 'start', 'end', 'score', 'strand', 'frame', 'attribute']
+
+# values read as missing, like pandas.read_csv does by default
+NA_VALUES = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+             '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None',
+             'n/a', 'nan', 'null'}
+
+
+def parse_args(argv=None):
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--version', help="Release version", required=True)
+  parser.add_argument('--gtf', help="Assembly-specific GFF/GTF", required=True)
+  parser.add_argument('--outdir', default=".", help="Output directory")
+  parser.add_argument('--gene_symbols', default=None,
+                      help="Lookup table with two columns (gene symbols and Ensembl identifiers) ")
+
+  group = parser.add_mutually_exclusive_group(required=True)
+  group.add_argument('--go', help="GO terms annotation")
+  group.add_argument('--pheno', help="Phenotypes annotation")
+  return parser.parse_args(argv)
+
+
+def read_table(f, columns=len(COLUMNS), comment="#"):
+  """
+  Yield the line number and fields (None if missing) of each line of a
+  tab-separated file
+  """
+  with open(f) as fh:
+    for number, line in enumerate(fh, 1):
+      line = line.rstrip("\r\n")
+      if comment:
+        line = line.split(comment, 1)[0]
+      if not line:
+        continue
+      fields = line.split("\t")[:columns]
+      fields += [''] * (columns - len(fields))
+      yield number, [None if value in NA_VALUES else value for value in fields]
+
+
+def coordinates(fields, f, number):
+  """Start and end of line number of f; raises an exception if they are not integers"""
+  try:
+    return int(fields[3]), int(fields[4])
+  except (TypeError, ValueError):
+    values = ", ".join("missing" if v is None else v for v in fields[3:5])
+    raise Exception(f"ERROR: start and end of line {number} of {f} are not integers: "
+                    f"{values}") from None
+
+
+def extract(pattern, value):
+  """First group of pattern in value (None if missing or not found)"""
+  match = None if value is None else pattern.search(value)
+  return None if match is None else match.group(1)
+
+
+def read_gene_symbols(f):
+  """Lookup table of Ensembl identifier to its gene symbols"""
+  symbols = {}
+  for _, (symbol, gene) in read_table(f, columns=2, comment=None):
+    symbols.setdefault(gene, []).append(symbol)
+  return symbols
+
+
+def read_reference(annot, key, value, symbols=None):
+  """
+  Table of gene symbol to the (source, attribute) of its annotations, in file
+  order; key and value are the patterns to extract both from each attribute
+  and, with symbols, key gets the Ensembl identifier to look symbols up for
+  """
+  table, rows = {}, 0
+  for number, fields in read_table(annot):
+    rows += 1
+    # coordinates of the reference are not used, but must be integers
+    coordinates(fields, annot, number)
+    attribute = fields[8]
+    entry = (fields[1], extract(value, attribute))
+
+    keys = [extract(key, attribute)]
+    if symbols is not None:
+      keys = symbols.get(keys[0], [])
+    for k in keys:
+      table.setdefault(k, []).append(entry)
+  return table, rows
+
+
+def main(argv=None):
+  args = parse_args(argv)
+
+  if args.go:
+    plugin = 'GO'
+    annot  = args.go
+    ext    = 'gff'
+    feat   = 'transcript'
+    key    = re.compile(r'ID=(.*?);')
+    value  = re.compile(r';(Ontology_term=.*)')
+  elif args.pheno:
+    plugin = 'phenotypes'
+    annot  = args.pheno
+    ext    = 'gvf'
+    feat   = 'gene'
+    key    = re.compile(r'id=(.*?);')
+    value  = re.compile(r'; (phenotype=.*)')
+
+  output = re.sub(r'(.*)-gca_(\d+)\.(\d+).*',
+                  f'\\1_gca\\2v\\3_{args.version}_VEP_{plugin}_plugin.{ext}',
+                  os.path.basename(args.gtf.lower()))
+
+  if not os.path.exists(args.outdir):
+    os.makedirs(args.outdir)
+  output = args.outdir + "/" + output
+
+  symbols = None
+  if args.gene_symbols is not None:
+    print(f"Preparing lookup table from {args.gene_symbols}...", flush=True)
+    with telemetry.stage("join gene symbols") as stage:
+      symbols = read_gene_symbols(args.gene_symbols)
+      stage.rows_in = sum(len(s) for s in symbols.values())
+
+  ## read GO terms or Phenotypes annotation into table of gene symbol to annotations
+  print(f"Preparing {plugin} annotation from {annot}...", flush=True)
+  with telemetry.stage(f"read {plugin} annotation") as stage:
+    reference, stage.rows_in = read_reference(annot, key, value, symbols)
+    stage.rows_out = sum(len(entries) for entries in reference.values())
+
+  # join assembly annotation based on gene symbols, keeping matching lines only
+  print(f"Joining assembly annotation from {args.gtf}...", flush=True)
+  gene_id       = re.compile(r'gene_id "(.*?)";')
+  gene_name     = re.compile(r'gene_name "(.*?)";')
+  transcript_id = re.compile(r'transcript_id "(.*?)";')
+  with telemetry.stage("join annotation") as stage:
+    matched, rows, total = [], 0, 0
+    for number, fields in read_table(args.gtf):
+      rows += 1
+      if fields[2] is None or feat not in fields[2]:
+        continue
+      start, end = coordinates(fields, args.gtf, number)
+      attribute = fields[8]
+      entries = reference.get(extract(gene_name, attribute))
+      if not entries:
+        continue
+
+      if args.go:
+        # new assembly-specific GO annotations with backwards compatibiliy (i.e., transcript-based)
+        prefix = extract(transcript_id, attribute)
+        prefix = None if prefix is None else "ID=" + prefix + ';'
+      elif args.pheno:
+        # new assembly-specific Phenotypes annotations
+        prefix = extract(gene_id, attribute)
+        prefix = None if prefix is None else "id=" + prefix + '; '
+      matched.append((fields[0], start, end, fields[2], fields[5], fields[6],
+                      fields[7], prefix, entries))
+      total += len(entries)
+
+    # sort by genomic position (stable, missing chromosomes last)
+    matched.sort(key=lambda m: (m[0] is None, m[0] or '', m[1], m[2]))
+    stage.rows_in = rows
+    stage.rows_out = total
+
+  if total == 0:
+    raise Exception(f"ERROR: new pangenomes {plugin} annotation is empty (maybe no genes matched between annotations?)")
+
+  # write to file
+  print(f"Writing new {plugin} annotation to {output}...", flush=True)
+  with telemetry.stage("write annotation") as stage:
+    with open(output, 'w') as f:
+      if args.go:
+        f.write('##gff-version 1.10\n')
+      for chr, start, end, feature, score, strand, frame, prefix, entries in matched:
+        for source, attribute in entries:
+          new_attribute = None if prefix is None or attribute is None else prefix + attribute
+          f.write("\t".join('' if v is None else str(v) for v in (
+            chr, source, feature, start, end, score, strand, frame, new_attribute)) + "\n")
+    stage.rows_out = total
+  print(f"Done!", flush=True)
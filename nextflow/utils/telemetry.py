@@ -0,0 +1,310 @@
+"""
+Opt-in resource telemetry for the pipeline's Python steps
+
+Disabled unless the PIPELINE_TELEMETRY environment variable is set, in which
+case each named stage records its wall time, CPU time, peak RSS, rows in/out
+and bytes read/written, and a JSON sidecar file is written when the script
+exits:
+
+  PIPELINE_TELEMETRY=1              write <script>.telemetry.json to the
+                                    working directory
+  PIPELINE_TELEMETRY=<file>         write the sidecar to <file>
+  PIPELINE_PROFILE=cprofile         also profile the run with cProfile (stats
+                                    saved next to the sidecar with a .prof
+                                    extension; top functions in the JSON)
+  PIPELINE_PROFILE=sample[:<ms>]    also sample the call stack every <ms> of
+                                    CPU time (default: 10), saved as collapsed
+                                    stacks (flame graph input) with a .stacks
+                                    extension; top stacks in the JSON
+
+Usage:
+  import telemetry
+
+  with telemetry.stage("load scores") as s:
+    scores = load_scores(path)
+    s.rows_in = len(scores)
+
+Peak RSS is per stage on Linux (the high-water mark is reset at the start of
+each stage), otherwise it is the peak of the process so far. Bytes read and
+written default to the read()/write() totals in /proc/self/io, which include
+console output but not sockets; set them on the stage to override them.
+
+The pipelines put nextflow/utils on the PYTHONPATH of their tasks (env block
+of nextflow.config), so there is a single copy of this module.
+"""
+
+import atexit
+import json
+import os
+import sys
+import time
+
+try:
+  import resource
+except ImportError:  # not available on Windows
+  resource = None
+
+SIDECAR_SUFFIX = ".telemetry.json"
+SAMPLE_INTERVAL = 10  # ms
+TOP_ENTRIES = 25
+
+
+def _read_proc(path):
+  try:
+    with open(path) as f:
+      return f.read()
+  except OSError:
+    return None
+
+
+def _io_counters():
+  """Bytes passed to read() and write() by this process, if known"""
+  io = _read_proc("/proc/self/io")
+  if io is None:
+    return None
+  counters = dict(line.split(": ") for line in io.splitlines())
+  return int(counters["rchar"]), int(counters["wchar"])
+
+
+def _peak_rss():
+  """Peak resident set size (bytes) since the last reset of the high-water mark"""
+  status = _read_proc("/proc/self/status")
+  if status is not None:
+    for line in status.splitlines():
+      if line.startswith("VmHWM:"):
+        return int(line.split()[1]) * 1024
+  if resource is None:
+    return None
+  maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes on Linux, bytes on macOS
+  return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def _reset_peak_rss():
+  """Reset the RSS high-water mark (Linux 4.0+); returns whether it was reset"""
+  try:
+    with open("/proc/self/clear_refs", "w") as f:
+      f.write("5")
+    return True
+  except OSError:
+    return False
+
+
+class Stage:
+  """
+  Resource usage of a named stage; rows_in, rows_out, bytes_read and
+  bytes_written can be set (or incremented) while the stage runs.
+  """
+
+  def __init__(self, name):
+    self.name = name
+    self.rows_in = None
+    self.rows_out = None
+    self.bytes_read = None
+    self.bytes_written = None
+    self.wall_time = None
+    self.cpu_time = None
+    self.peak_rss = None
+
+  def count(self, **counters):
+    """Add to the given counters of this stage, e.g. count(rows_in=1)"""
+    for name, value in counters.items():
+      if name not in ("rows_in", "rows_out", "bytes_read", "bytes_written"):
+        raise TypeError(f"unknown counter: {name}")
+      setattr(self, name, (getattr(self, name) or 0) + value)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    return False
+
+  def to_dict(self):
+    return {"name": self.name,
+            "wall_time": self.wall_time,
+            "cpu_time": self.cpu_time,
+            "peak_rss": self.peak_rss,
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written}
+
+
+class _RecordedStage(Stage):
+  """Stage that records its resource usage into the current run"""
+
+  def __init__(self, name, run):
+    super().__init__(name)
+    self._run = run
+
+  def __enter__(self):
+    self._run.start_stage(self)
+    self._wall = time.perf_counter()
+    self._cpu = time.process_time()
+    self._io = _io_counters()
+    return self
+
+  def __exit__(self, *exc):
+    self.wall_time = round(time.perf_counter() - self._wall, 6)
+    self.cpu_time = round(time.process_time() - self._cpu, 6)
+    io = _io_counters()
+    if io is not None and self._io is not None:
+      if self.bytes_read is None:
+        self.bytes_read = io[0] - self._io[0]
+      if self.bytes_written is None:
+        self.bytes_written = io[1] - self._io[1]
+    self._run.end_stage(self)
+    return False
+
+
+class _Run:
+  """Telemetry of the whole script run, written to the sidecar at exit"""
+
+  def __init__(self, sidecar, profile=None):
+    self.sidecar = sidecar
+    self.stages = []
+    self._active = []
+    self._peak_resettable = _reset_peak_rss()
+    self._wall = time.perf_counter()
+    self._cpu = time.process_time()
+    self._started = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    self._profiler = None
+    if profile:
+      self._profiler = _profiler(profile, os.path.splitext(sidecar)[0])
+    atexit.register(self.write)
+
+  def start_stage(self, stage):
+    if self._peak_resettable:
+      # keep the peak so far for enclosing stages before resetting it
+      peak = _peak_rss()
+      for outer in self._active:
+        outer._peak = max(outer._peak, peak)
+      _reset_peak_rss()
+    stage._peak = 0
+    self._active.append(stage)
+
+  def end_stage(self, stage):
+    peak = max(stage._peak, _peak_rss() or 0)
+    stage.peak_rss = peak or None
+    self._active.remove(stage)
+    for outer in self._active:
+      outer._peak = max(outer._peak, peak)
+    self.stages.append(stage)
+
+  def write(self):
+    if self._profiler is not None:
+      profile = self._profiler.stop()
+      self._profiler = None
+    else:
+      profile = None
+
+    if resource is not None:
+      maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      peak_rss = maxrss if sys.platform == "darwin" else maxrss * 1024
+    else:
+      peak_rss = None
+
+    data = {"script": os.path.basename(sys.argv[0]),
+            "argv": sys.argv[1:],
+            "pid": os.getpid(),
+            "started": self._started,
+            "wall_time": round(time.perf_counter() - self._wall, 6),
+            "cpu_time": round(time.process_time() - self._cpu, 6),
+            "peak_rss": peak_rss,
+            "stages": [s.to_dict() for s in self.stages]}
+    if profile is not None:
+      data["profile"] = profile
+
+    with open(self.sidecar, "w") as f:
+      json.dump(data, f, indent=2)
+      f.write("\n")
+
+
+class _CProfiler:
+  def __init__(self, prefix):
+    import cProfile
+    self.prefix = prefix
+    self.profile = cProfile.Profile()
+    self.profile.enable()
+
+  def stop(self):
+    import pstats
+    self.profile.disable()
+    path = self.prefix + ".prof"
+    self.profile.dump_stats(path)
+
+    stats = pstats.Stats(self.profile)
+    top = sorted(stats.stats.items(), key=lambda x: x[1][3], reverse=True)
+    functions = [{"function": f"{filename}:{lineno}({name})",
+                  "calls": nc,
+                  "total_time": round(tt, 6),
+                  "cumulative_time": round(ct, 6)}
+                 for (filename, lineno, name), (cc, nc, tt, ct, callers)
+                 in top[:TOP_ENTRIES]]
+    return {"type": "cprofile", "file": path, "top": functions}
+
+
+class _SamplingProfiler:
+  def __init__(self, prefix, interval):
+    import signal
+    self.prefix = prefix
+    self.interval = interval / 1000
+    self.samples = {}
+    self._signal = signal
+    signal.signal(signal.SIGPROF, self._sample)
+    signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+  def _sample(self, signum, frame):
+    stack = []
+    while frame is not None:
+      code = frame.f_code
+      stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+      frame = frame.f_back
+    key = ";".join(reversed(stack))
+    self.samples[key] = self.samples.get(key, 0) + 1
+
+  def stop(self):
+    self._signal.setitimer(self._signal.ITIMER_PROF, 0)
+    self._signal.signal(self._signal.SIGPROF, self._signal.SIG_DFL)
+
+    path = self.prefix + ".stacks"
+    top = sorted(self.samples.items(), key=lambda x: x[1], reverse=True)
+    with open(path, "w") as f:
+      for stack, count in top:
+        f.write(f"{stack} {count}\n")
+    return {"type": "sample",
+            "interval": self.interval,
+            "samples": sum(self.samples.values()),
+            "file": path,
+            "top": [{"stack": stack, "samples": count}
+                    for stack, count in top[:TOP_ENTRIES]]}
+
+
+def _profiler(profile, prefix):
+  kind, _, interval = profile.partition(":")
+  if kind == "cprofile":
+    return _CProfiler(prefix)
+  if kind == "sample":
+    return _SamplingProfiler(prefix, float(interval or SAMPLE_INTERVAL))
+  raise ValueError(f"invalid PIPELINE_PROFILE: {profile} (expected cprofile or sample[:<ms>])")
+
+
+def _start():
+  setting = os.environ.get("PIPELINE_TELEMETRY", "")
+  if setting in ("", "0"):
+    return None
+  if setting == "1":
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    setting = script + SIDECAR_SUFFIX
+  return _Run(setting, os.environ.get("PIPELINE_PROFILE"))
+
+
+_run = _start()
+enabled = _run is not None
+
+
+def stage(name):
+  """Context manager recording the resource usage of a named stage"""
+  if _run is None:
+    return Stage(name)
+  return _RecordedStage(name, _run)
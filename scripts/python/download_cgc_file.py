@@ -11,6 +11,11 @@ import urllib.request
 import os
 from ftplib import FTP, error_perm
 
+# shared with the Nextflow pipelines
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "..", "nextflow", "utils"))
+import telemetry  # noqa: E402
+
 
 HOST = "ftp.ebi.ac.uk"
 BASE_DIR = "/pub/databases/opentargets/platform"
@@ -33,7 +38,7 @@ def find_json_files(ftp, pathname):
     ftp.cwd(current)
 
 
-def walk_ftp(host, dirname):
+def walk_ftp(host, dirname, stage=None):
     ftp = FTP(host)
     ftp.login()
 
@@ -44,6 +49,8 @@ def walk_ftp(host, dirname):
             items = []
             with urllib.request.urlopen(url) as f:
                 for line in f:
+                    if stage is not None:
+                        stage.count(rows_in=1, bytes_read=len(line))
                     yield json.loads(line.decode("utf-8").rstrip())
     finally:
         ftp.quit()
@@ -82,8 +89,8 @@ def main():
     sys.stderr.write(f"Fetching data from Open Target Platform "
                      f"(release: {release})\n")
 
-    with open(output_file, "w") as f:
-      for obj in walk_ftp(HOST, evidence_dir):
+    with telemetry.stage("download evidence") as stage, open(output_file, "w") as f:
+      for obj in walk_ftp(HOST, evidence_dir, stage):
           try:
               disease_id = obj["diseaseId"]
           except KeyError:
@@ -93,6 +100,7 @@ def main():
               continue
 
           f.write(json.dumps(obj) + "\n")
+          stage.count(rows_out=1)
 
 if __name__ == '__main__':
     main()